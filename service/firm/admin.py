@@ -1,9 +1,221 @@
-from django.contrib import admin
+import operator
+from functools import reduce
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import CustomUser, OrderStatus, PaymentStatus, Client, Courier, Product, Order, OrderItem, Payment, Feedback, Category
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+from . import search, sharding
+from .bulk import chunked_update
+from .pagination import EstimatedCountPaginator
+from .models import CustomUser, OrderStatus, PaymentStatus, Client, Courier, Product, Order, OrderItem, Payment, Feedback, Category, OutboxEmail
+from .models import ArchivedFeedback, ArchivedOrder, ArchivedOrderItem, ArchivedPayment, ClientPurgeJob
 
 # Register your models here.
 
+@admin.display(description="Рейтинг", ordering='rating__average')
+def rating_average(obj):
+    # Берётся из агрегата (CourierRating/ProductRating), подтянутого через list_select_related
+    rating = getattr(obj, 'rating', None)
+    if rating is None or rating.average is None:
+        return "—"
+    return f"{rating.average:.2f} ({rating.ratings_count})"
+
+
+class RankedChangeList(ChangeList):
+    """Список, который при поиске по индексу сохраняет порядок релевантности, пока сортировку не выбрали явно."""
+
+    def get_ordering(self, request, queryset):
+        if ORDER_VAR not in self.params and 'search_rank' in queryset.query.extra_select:
+            return ['search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
+
+class FullTextSearchMixin:
+    """
+    Поиск в списке через индекс FTS5 (firm/search.py) вместо LIKE-сканирования по search_fields.
+
+    Индекс присоединяется к запросу списка, так что число результатов не ограничено, а порядок — по
+    релевантности. Поля search_fields, которых нет в индексе (например, client__surname у отзывов),
+    ищутся обычным icontains и объединяются с найденным индексом через OR; порядок тогда обычный.
+    """
+
+    def get_changelist(self, request, **kwargs):
+        return RankedChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.is_supported(queryset.db):
+            return super().get_search_results(request, queryset, search_term)
+        _, indexed = search.SEARCH_INDEXES[self.model]
+        unindexed = [field for field in self.get_search_fields(request) if field not in indexed]
+        if not unindexed:
+            return search.ranked(queryset, search_term), False
+
+        # Как в ModelAdmin.get_search_results: каждое слово должно найтись хотя бы в одном поле
+        words = Q()
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            words &= reduce(operator.or_, (Q(**{f'{field}__icontains': bit}) for field in unindexed))
+        if search.build_match(search_term):
+            words |= Q(pk__in=search.matching(self.model, search_term))
+        may_have_duplicates = any(lookup_spawns_duplicates(self.opts, field) for field in unindexed)
+        return queryset.filter(words), may_have_duplicates
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Фильтр по внешнему ключу с поиском через admin autocomplete вместо списка всех строк.
+
+    Стандартный RelatedFieldListFilter выводит по ссылке на каждую строку связанной таблицы
+    (тысячи клиентов или заказов); здесь в фильтре только поле select2, а варианты подгружаются
+    по мере ввода из search_fields админки связанной модели. В HTML попадает лишь выбранная строка.
+    """
+    template = 'admin/firm/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.admin_site = model_admin.admin_site
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        related = self.field.remote_field.model
+        choice_field = forms.ModelChoiceField(
+            queryset=related._default_manager.all(),
+            to_field_name=self.field.target_field.name,
+            widget=AutocompleteSelect(self.field, self.admin_site),
+            required=False,
+        )
+        widget = choice_field.widget.render(self.lookup_kwarg, self.lookup_val, attrs={
+            'data-filter-param': self.lookup_kwarg,
+            'data-filter-url': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'style': 'width: 100%',
+        })
+        yield {
+            'selected': self.lookup_val is not None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': "Все",
+            'widget': widget,
+        }
+
+
+class ScalableChangeListMixin:
+    """
+    Список, который не деградирует на больших таблицах: без полного COUNT(*) и с фильтрами-autocomplete.
+    Связанные объекты для list_display задаются в list_select_related каждой админки.
+    """
+    paginator = EstimatedCountPaginator
+    # Autocomplete-запросы к этой админке тоже постраничные: нужен стабильный порядок по индексу pk
+    ordering = ('-pk',)
+    # «Показать все (N)» требует отдельный COUNT(*) по всей таблице
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        # Номер страницы нужен до подсчёта: за границей FIRM_ADMIN_COUNT_LIMIT счёт продлевается до неё.
+        # Список админки листается параметром p, autocomplete-запросы к ней — параметром page
+        try:
+            page = max(int(request.GET.get(PAGE_VAR) or request.GET.get('page') or 1), 1)
+        except ValueError:
+            page = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, page=page)
+
+    @property
+    def media(self):
+        # Скрипты select2/autocomplete для AutocompleteFilter и переход по выбору в фильтре
+        return (super().media + AutocompleteSelect(None, self.admin_site).media
+                + forms.Media(js=['firm/admin/autocomplete_filter.js']))
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Шард, из которого читается список. ChangeList строит страницу одним запросом к одной базе, поэтому
+    при шардировании список показывает один шард: по умолчанию шард сотрудника, остальные — выбором здесь.
+    """
+    title = "Шард"
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in sharding.shard_aliases()]
+
+    def alias(self):
+        if self.value() in sharding.shard_aliases():
+            return self.value()
+        return sharding.current_shard() or DEFAULT_DB_ALIAS
+
+    def choices(self, changelist):
+        # Без пункта «Все»: страницы нескольких баз ChangeList не сливает
+        selected = self.alias()
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': lookup == selected,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.alias())
+
+
+class ShardedAdminMixin:
+    """
+    Админка данных арендаторов при шардировании: список — по шарду из фильтра «Шард», а карточка записи
+    ищется во всех шардах и сохраняется в том, из которого прочитана. Autocomplete-фильтры по данным
+    арендаторов ищут в шарде сотрудника.
+    """
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return (ShardListFilter, *list_filter) if sharding.is_sharded() else list_filter
+
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding.is_sharded():
+            return super().get_object(request, object_id, from_field)
+        for alias in sharding.shard_aliases():
+            with sharding.use_shard(alias):
+                obj = super().get_object(request, object_id, from_field)
+            if obj is not None:
+                return obj
+        return None
+
+
+class BulkUpdateMixin:
+    """Массовые действия: одно поле для всего выбора (или всех отфильтрованных строк) через firm.bulk.chunked_update."""
+
+    def bulk_set(self, request, queryset, field, value):
+        rows, elapsed = chunked_update(queryset, {field: value})
+        self.message_user(request, f"Обновлено строк: {rows} за {elapsed:.2f} с.", messages.SUCCESS)
+
+    def bulk_set_from_form(self, request, queryset, field, model, label):
+        # Значение приходит из полей ActionForm рядом со списком действий
+        pk = request.POST.get(field)
+        value = model.objects.filter(pk=pk).first() if pk else None
+        if value is None:
+            self.message_user(request, f"Выберите {label} в поле рядом с действием.", messages.WARNING)
+            return
+        self.bulk_set(request, queryset, field, value)
+
+
+class OrderActionForm(ActionForm):
+    order_status = forms.ModelChoiceField(OrderStatus.objects.all(), required=False, label="Статус")
+    # Курьеров может быть много: выбор через autocomplete, в HTML попадает только выбранный
+    courier = forms.ModelChoiceField(Courier.objects.all(), required=False, label="Курьер",
+                                     widget=AutocompleteSelect(Order._meta.get_field('courier'), admin.site))
+
+
+class PaymentActionForm(ActionForm):
+    payment_status = forms.ModelChoiceField(PaymentStatus.objects.all(), required=False, label="Статус платежа")
+
+
 @admin.register(CustomUser)
 class CustomUserAdmin(BaseUserAdmin):
     fieldsets = BaseUserAdmin.fieldsets + (
@@ -28,64 +240,160 @@ class PaymentStatusAdmin(admin.ModelAdmin):
 
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(ShardedAdminMixin, ScalableChangeListMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('surname', 'name', 'email', 'registration_date', 'created_by')
-    list_filter = ('registration_date', 'created_by')
+    list_select_related = ('created_by',)
+    list_filter = ('registration_date', ('created_by', AutocompleteFilter))
     search_fields = ('surname', 'name', 'email')
     date_hierarchy = 'registration_date'
 
 
 @admin.register(Courier)
-class CourierAdmin(admin.ModelAdmin):
-    list_display = ('surname', 'name', 'email', 'registration_date', 'created_by')
-    list_filter = ('registration_date', 'created_by')
+class CourierAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('surname', 'name', 'email', 'registration_date', rating_average, 'created_by')
+    list_select_related = ('rating', 'created_by')
+    list_filter = ('registration_date', ('created_by', AutocompleteFilter))
     search_fields = ('surname', 'name', 'email')
     date_hierarchy = 'registration_date'
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('product_name', 'price', 'category', 'stock')
+class ProductAdmin(ScalableChangeListMixin, FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ('product_name', 'price', 'category', 'stock', rating_average)
+    list_select_related = ('rating',)
     list_filter = ('category', 'stock')
     search_fields = ('product_name', 'category')
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'order_status', 'client', 'courier', 'creation_date', 'created_by')
-    list_filter = ('order_status', 'creation_date', 'client', 'courier', 'created_by')
+class OrderAdmin(BulkUpdateMixin, ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'order_status', 'client', 'courier', 'creation_date', 'total_amount', 'item_count', 'created_by')
+    list_select_related = ('order_status', 'client', 'courier', 'created_by')
+    list_filter = ('order_status', 'creation_date', ('client', AutocompleteFilter), ('courier', AutocompleteFilter),
+                   ('created_by', AutocompleteFilter))
     search_fields = ('content',)
     date_hierarchy = 'creation_date'
     raw_id_fields = ('client', 'courier', 'order_status') # Удобно для выбора связанных объектов
+    readonly_fields = ('total_amount', 'item_count') # Поддерживаются сигналами OrderItem
+    action_form = OrderActionForm
+    actions = ('set_order_status', 'assign_courier', 'unassign_courier')
+
+    @admin.action(description="Установить выбранный статус", permissions=['change'])
+    def set_order_status(self, request, queryset):
+        self.bulk_set_from_form(request, queryset, 'order_status', OrderStatus, "статус")
+
+    @admin.action(description="Назначить выбранного курьера", permissions=['change'])
+    def assign_courier(self, request, queryset):
+        self.bulk_set_from_form(request, queryset, 'courier', Courier, "курьера")
+
+    @admin.action(description="Снять курьера", permissions=['change'])
+    def unassign_courier(self, request, queryset):
+        self.bulk_set(request, queryset, 'courier', None)
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('id', 'order', 'product', 'amount', 'price')
-    list_filter = ('order', 'product')
+    list_select_related = ('order__client', 'product')  # Order.__str__ выводит клиента
+    list_filter = (('order', AutocompleteFilter), ('product', AutocompleteFilter))
     search_fields = ('order__id', 'product__product_name')
     raw_id_fields = ('order', 'product')
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(BulkUpdateMixin, ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('id', 'order', 'client', 'payment_date', 'payment_status', 'amount', 'created_by')
-    list_filter = ('payment_date', 'payment_status', 'client', 'order', 'created_by')
+    list_select_related = ('order__client', 'client', 'payment_status', 'created_by')
+    list_filter = ('payment_date', 'payment_status', ('client', AutocompleteFilter), ('order', AutocompleteFilter),
+                   ('created_by', AutocompleteFilter))
     search_fields = ('order__id', 'client__surname', 'client__name')
     date_hierarchy = 'payment_date'
     raw_id_fields = ('order', 'client', 'payment_status')
+    action_form = PaymentActionForm
+    actions = ('set_payment_status',)
+
+    @admin.action(description="Установить выбранный статус платежа", permissions=['change'])
+    def set_payment_status(self, request, queryset):
+        self.bulk_set_from_form(request, queryset, 'payment_status', PaymentStatus, "статус платежа")
 
 
 @admin.register(Feedback)
-class FeedbackAdmin(admin.ModelAdmin):
+class FeedbackAdmin(ShardedAdminMixin, ScalableChangeListMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('id', 'order', 'client', 'review_date', 'rating', 'created_by')
-    list_filter = ('review_date', 'rating', 'client', 'order', 'created_by')
+    list_select_related = ('order__client', 'client', 'created_by')
+    list_filter = ('review_date', 'rating', ('client', AutocompleteFilter), ('order', AutocompleteFilter),
+                   ('created_by', AutocompleteFilter))
     search_fields = ('comment', 'client__surname', 'client__name')
     date_hierarchy = 'review_date'
     raw_id_fields = ('order', 'client')
+    readonly_fields = ('rated_courier', 'rated_products') # Снимок при создании отзыва, см. firm/ratings.py
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('category_name',)
     search_fields = ('category_name',)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'status', 'attempts', 'created_at', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+
+
+@admin.register(ClientPurgeJob)
+class ClientPurgeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'client_name', 'shard', 'status', 'orders_deleted', 'orders_total', 'rows_deleted',
+                    'attempts', 'created_at', 'updated_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('client_id', 'client_name', 'shard', 'requested_by', 'orders_total', 'orders_deleted',
+                       'rows_deleted', 'attempts', 'last_error', 'created_at', 'updated_at', 'finished_at')
+
+    def has_add_permission(self, request):
+        # Задания ставит удаление клиента на сайте (firm.deletion.delete_client)
+        return False
+
+
+class ArchiveAdminMixin:
+    """Архив только для чтения: строки попадают туда командой archive_before и больше не меняются."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(ArchiveAdminMixin, ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'order_status', 'client', 'courier', 'creation_date', 'total_amount', 'item_count', 'created_by')
+    list_select_related = ('order_status', 'client', 'courier', 'created_by')
+    list_filter = ('order_status', ('client', AutocompleteFilter), ('created_by', AutocompleteFilter))
+    date_hierarchy = 'creation_date'
+
+
+@admin.register(ArchivedOrderItem)
+class ArchivedOrderItemAdmin(ArchiveAdminMixin, ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'order', 'product', 'amount', 'price')
+    list_select_related = ('order', 'product')
+    list_filter = (('product', AutocompleteFilter),)
+
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(ArchiveAdminMixin, ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'order', 'client', 'payment_date', 'payment_status', 'amount', 'created_by')
+    list_select_related = ('order', 'client', 'payment_status', 'created_by')
+    list_filter = ('payment_status', ('client', AutocompleteFilter), ('created_by', AutocompleteFilter))
+    date_hierarchy = 'payment_date'
+
+
+@admin.register(ArchivedFeedback)
+class ArchivedFeedbackAdmin(ArchiveAdminMixin, ShardedAdminMixin, ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('id', 'order', 'client', 'review_date', 'rating', 'created_by')
+    list_select_related = ('order', 'client', 'created_by')
+    list_filter = ('rating', ('client', AutocompleteFilter), ('created_by', AutocompleteFilter))
+    date_hierarchy = 'review_date'
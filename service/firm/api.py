@@ -0,0 +1,255 @@
+# firm/api.py
+import json
+
+from django.forms.models import model_to_dict
+from django.http import QueryDict
+
+from . import deletion, sharding
+from .forms import ClientCreateForm, ClientUpdateForm, OrderForm, OrderItemForm, PaymentForm, ProductForm
+from .models import Client, Order, OrderItem, OwnedQuerySet, Payment, Product
+from .orders import InsufficientStock, delete_item, delete_order, place_order, save_item
+
+
+# Запись заказов и позиций идёт через firm/orders.py: товар резервируется на складе
+def parse_items(value):
+    """
+    Позиции нового заказа из поля items: список {"product": id, "amount": n} (в данных формы — JSON-строкой).
+    Возвращает пары (product_id, количество).
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = None
+    if not isinstance(value, list) or not value:
+        raise ApiError(400, {'errors': {'items': ['Укажите позиции заказа: [{"product": id, "amount": n}, ...].']}})
+    items = []
+    for line in value:
+        try:
+            product_id, amount = int(line['product']), int(line['amount'])
+        except (TypeError, KeyError, ValueError):
+            raise ApiError(400, {'errors': {'items': ['Каждая позиция — {"product": id, "amount": n}.']}})
+        if amount <= 0:
+            raise ApiError(400, {'errors': {'items': ['Количество товара должно быть положительным.']}})
+        items.append((product_id, amount))
+    unknown = {product_id for product_id, _ in items} - set(
+        Product.objects.filter(pk__in={product_id for product_id, _ in items}).values_list('pk', flat=True))
+    if unknown:
+        raise ApiError(400, {'errors': {'items': ['Неизвестные продукты.']}, 'unknown': sorted(unknown)})
+    return items
+
+
+def stock_error(exc):
+    return ApiError(409, {'error': str(exc), 'product': exc.product_id, 'requested': exc.requested})
+
+
+def save_order(form, user, data):
+    """Новый заказ оформляется через orders.place_order: позиции из items резервируются на складе."""
+    if form.instance.pk is not None:
+        # Поля самого заказа (статус, клиент, курьер, комментарий) склад не затрагивают
+        return save_instance(form, user)
+    items = parse_items(data.get('items'))
+    try:
+        return place_order(form.cleaned_data['client'], items, user, order_status=form.cleaned_data['order_status'],
+                           courier=form.cleaned_data['courier'], content=form.cleaned_data['content'])
+    except InsufficientStock as exc:
+        raise stock_error(exc)
+
+
+def save_order_item(form, user, data):
+    """Позиция создаётся и меняется через orders.save_item: товар резервируется на складе."""
+    try:
+        return save_item(form.save(commit=False))
+    except InsufficientStock as exc:
+        raise stock_error(exc)
+    except ValueError as exc:
+        raise ApiError(400, {'errors': {'amount': [str(exc)]}})
+
+
+def delete_order_with_items(order, user):
+    """Заказ удаляется через orders.delete_order: товар из позиций возвращается на склад."""
+    delete_order(order)
+
+
+def delete_order_item(item, user):
+    """Позиция удаляется через orders.delete_item: её количество возвращается на склад."""
+    delete_item(item)
+
+
+def delete_client(client, user):
+    """Клиент удаляется через deletion.delete_client: большая история — фоновым заданием, а не каскадом в запросе."""
+    job = deletion.delete_client(client, user)
+    return None if job is None else {'job': job.pk, 'status': job.status}
+
+
+# Ресурсы API: модель, поля ответа (колонки values()), поле курсора, формы для создания/изменения
+# и функции записи ('save') и удаления ('delete'), если работать с записью напрямую нельзя
+# (например, нужен резерв товара или удаление порциями)
+RESOURCES = {
+    'clients': {
+        'model': Client,
+        'fields': ['id', 'surname', 'name', 'email', 'registration_date', 'created_by_id'],
+        'cursor_field': 'registration_date',
+        'create_form': ClientCreateForm,
+        'update_form': ClientUpdateForm,
+        'delete': delete_client,
+    },
+    'orders': {
+        'model': Order,
+        'fields': ['id', 'creation_date', 'order_status_id', 'client_id', 'courier_id', 'content',
+                   'total_amount', 'item_count', 'created_by_id'],
+        'cursor_field': 'creation_date',
+        'create_form': OrderForm,
+        'update_form': OrderForm,
+        'save': save_order,
+        'delete': delete_order_with_items,
+    },
+    'order-items': {
+        'model': OrderItem,
+        'fields': ['id', 'order_id', 'product_id', 'amount', 'price'],
+        'cursor_field': 'id',
+        'create_form': OrderItemForm,
+        'update_form': OrderItemForm,
+        'save': save_order_item,
+        'delete': delete_order_item,
+    },
+    'payments': {
+        'model': Payment,
+        'fields': ['id', 'payment_date', 'payment_status_id', 'order_id', 'client_id', 'amount', 'created_by_id'],
+        'cursor_field': 'payment_date',
+        'create_form': PaymentForm,
+        'update_form': PaymentForm,
+    },
+    'products': {
+        'model': Product,
+        'fields': ['id', 'product_name', 'price', 'category', 'stock'],
+        'cursor_field': 'id',
+        # Каталог общий: читают все, меняют только администраторы
+        'staff_writes': True,
+        'create_form': ProductForm,
+        'update_form': ProductForm,
+    },
+}
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API: HTTP-статус и тело ответа."""
+
+    def __init__(self, status, payload):
+        super().__init__(payload)
+        self.status = status
+        self.payload = payload
+
+
+def visible(config, user):
+    """Записи ресурса, доступные пользователю (для моделей с владельцем — OwnedQuerySet.visible_to)."""
+    manager = config['model'].objects
+    if hasattr(manager, 'visible_to'):
+        return manager.visible_to(user)
+    return manager.all() if user.is_authenticated else manager.none()
+
+
+def parse_fields(config, value):
+    """Разбирает ?fields=a,b в список колонок; без параметра отдаются все поля ресурса."""
+    if not value:
+        return list(config['fields'])
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in config['fields']]
+    if unknown or not fields:
+        raise ApiError(400, {'error': 'Неизвестные поля.', 'unknown': unknown, 'allowed': config['fields']})
+    return fields
+
+
+def page_source(config, user, fields):
+    """values()-запрос, из которого list_page режет страницу: запрошенные поля плюс ключ курсора."""
+    columns = list(dict.fromkeys(fields + [config['cursor_field'], 'id']))
+    return visible(config, user).values(*columns)
+
+
+def list_page(config, user, fields, page_size, after=None, before=None):
+    """
+    Одна страница ресурса в виде словарей из values(), без создания экземпляров моделей.
+
+    Ключ курсора (поле сортировки и id) запрашивается всегда, но в ответ попадают только
+    запрошенные поля.
+    """
+    source = page_source(config, user, fields)
+    page = sharding.keyset_page(source, user, config['cursor_field'], page_size, after=after, before=before)
+    results = page.object_list
+    if len(source.query.values_select) != len(fields):
+        results = [{field: row[field] for field in fields} for row in results]
+    return {'results': results, 'next': page.next_cursor, 'previous': page.prev_cursor}
+
+
+def get_row(config, user, pk, fields):
+    return sharding.get_visible(visible(config, user).values(*fields), user, pk=pk)
+
+
+def get_instance(config, user, pk):
+    """Запись для изменения или удаления; None, если её нет или она чужая."""
+    try:
+        return sharding.get_visible(visible(config, user), user, pk=pk)
+    except config['model'].DoesNotExist:
+        return None
+
+
+def parse_body(request):
+    """Тело запроса: JSON-объект или данные формы (для POST — request.POST)."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ApiError(400, {'error': 'Тело запроса не является корректным JSON.'})
+        if not isinstance(data, dict):
+            raise ApiError(400, {'error': 'Ожидается JSON-объект.'})
+        return data
+    if request.method == 'POST':
+        return request.POST
+    return QueryDict(request.body, encoding=request.encoding)
+
+
+def check_write(config, user):
+    if config.get('staff_writes') and not user.is_staff:
+        raise ApiError(403, {'error': 'Изменять этот ресурс могут только администраторы.'})
+
+
+def bind_form(config, user, data, instance=None, partial=False):
+    """
+    Создаёт форму ресурса; выбор в каждом поле, ссылающемся на записи с владельцем (клиент, заказ,
+    курьер), ограничивается видимыми пользователю, чтобы нельзя было сослаться на чужую запись.
+    """
+    form_class = config['update_form'] if instance is not None else config['create_form']
+    if partial and instance is not None:
+        # PATCH: недостающие поля берутся из текущей записи
+        current = model_to_dict(instance, fields=form_class._meta.fields)
+        current.update(data.dict() if isinstance(data, QueryDict) else data)
+        data = current
+    form = form_class(data, instance=instance)
+    for field in form.fields.values():
+        queryset = getattr(field, 'queryset', None)
+        if isinstance(queryset, OwnedQuerySet):
+            field.queryset = queryset.visible_to(user)
+    return form
+
+
+def save_instance(form, user):
+    obj = form.save(commit=False)
+    if not obj.pk and hasattr(obj, 'created_by_id'):
+        obj.created_by = user
+    obj.save()
+    return obj
+
+
+def save_form(config, form, user, data):
+    """Сохраняет проверенную форму; ресурсы с функцией 'save' пишут через неё."""
+    if 'save' in config:
+        return config['save'](form, user, data)
+    return save_instance(form, user)
+
+
+def delete_instance(config, instance, user):
+    """Удаляет запись; возвращает данные фонового задания или None, если запись удалена сразу."""
+    if 'delete' in config:
+        return config['delete'](instance, user)
+    instance.delete()
+    return None
@@ -0,0 +1,145 @@
+# firm/archive.py
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max
+
+from . import rollups, search
+from .cache import invalidate_home_page
+from .models import (ArchivedFeedback, ArchivedOrder, ArchivedOrderItem, ArchivedPayment, Feedback, Order, OrderItem,
+                     Payment, Watermark)
+
+# Кто читает архив. Через with_archive — только выгрузки (exports.period_rows) и пересчёт дневных агрегатов
+# (rollups.rollup_range), а рейтинги (ratings.expected_aggregates) учитывают архивные отзывы сами. Остальное
+# читает лишь горячие таблицы: списки и карточки клиентов и заказов, API, поиск, главная и админка перенесённых
+# заказов не показывают. Архив — для отчётов за прошлые периоды, а не для работы с отдельными заказами.
+
+# Горячая модель -> архивная модель и поле даты, по которому читатели выбирают период
+ARCHIVES = {
+    Order: (ArchivedOrder, 'creation_date'),
+    OrderItem: (ArchivedOrderItem, None),
+    Payment: (ArchivedPayment, 'payment_date'),
+    Feedback: (ArchivedFeedback, 'review_date'),
+}
+
+# Порядок переноса: сначала заказ, затем ссылающиеся на него строки; удаление — в обратном порядке
+MOVE_ORDER = (Order, OrderItem, Payment, Feedback)
+
+HORIZON_PREFIX = 'archive_'
+
+
+def closed_orders(before):
+    """Закрытые заказы, созданные раньше before, — кандидаты на перенос в архив."""
+    closed = getattr(settings, 'FIRM_CLOSED_ORDER_STATUSES', ['Доставлен', 'Отменён'])
+    return Order.objects.filter(creation_date__lt=before, order_status__name__in=closed)
+
+
+def _columns(model):
+    # Архивные таблицы повторяют колонки горячих, поэтому список берётся из архивной модели
+    archived = ARCHIVES[model][0]
+    return [field.column for field in archived._meta.concrete_fields]
+
+
+def move_batch(order_ids, using='default'):
+    """
+    Переносит заказы order_ids вместе с позициями, платежами и отзывами в одной транзакции.
+
+    Строки копируются INSERT ... SELECT и удаляются сырыми DELETE: сигналы не отправляются, поэтому
+    итоги заказов и агрегаты оценок остаются как есть (архивные отзывы продолжают учитываться в рейтингах,
+    см. ratings.expected_aggregates). Из полнотекстового индекса архивные отзывы убираются.
+    Возвращает {модель: перенесено строк}.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(order_ids))
+    moved = {}
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        feedback_ids = list(Feedback.objects.using(using).filter(order_id__in=order_ids)
+                            .values_list('pk', flat=True))
+        # Агрегаты за эти дни после переноса собираются уже и из архива: пусть rollup_sales их перепроверит
+        rollups.mark_dirty_rows(Order.objects.using(using).filter(pk__in=order_ids))
+        rollups.mark_dirty_rows(Payment.objects.using(using).filter(order_id__in=order_ids))
+        for model in MOVE_ORDER:
+            columns = ', '.join(quote(column) for column in _columns(model))
+            key = 'id' if model is Order else 'order_id'
+            cursor.execute(
+                f"INSERT INTO {quote(ARCHIVES[model][0]._meta.db_table)} ({columns}) "
+                f"SELECT {columns} FROM {quote(model._meta.db_table)} WHERE {quote(key)} IN ({placeholders})",
+                order_ids,
+            )
+        for model in reversed(MOVE_ORDER):
+            key = 'id' if model is Order else 'order_id'
+            cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(key)} IN ({placeholders})",
+                           order_ids)
+            moved[model] = cursor.rowcount
+        if search.is_supported(using):
+            search.remove_ids(Feedback, feedback_ids, using=using)
+    return moved
+
+
+def archive_before(before, batch_size=None):
+    """
+    Переносит в архив все закрытые заказы старше before порциями по batch_size заказов, шард за шардом.
+
+    Каждая порция — отдельная транзакция, так что блокировка записи не держится на весь перенос,
+    а прерванный запуск можно просто повторить. Возвращает ({модель: строк}, секунд).
+    """
+    from . import sharding  # firm.sharding импортирует firm.bulk, а тот через firm.rollups — этот модуль
+    batch_size = batch_size or getattr(settings, 'FIRM_ARCHIVE_BATCH_SIZE', 500)
+    totals = {model: 0 for model in MOVE_ORDER}
+    started = time.perf_counter()
+    for alias in sharding.shard_aliases():
+        candidates = closed_orders(before).using(alias).order_by('pk')
+        last_pk = 0
+        while True:
+            order_ids = list(candidates.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not order_ids:
+                break
+            for model, rows in move_batch(order_ids, using=alias).items():
+                totals[model] += rows
+            last_pk = order_ids[-1]
+    if totals[Order]:
+        refresh_horizons()
+        invalidate_home_page()
+    return totals, time.perf_counter() - started
+
+
+def refresh_horizons():
+    """
+    Запоминает самую позднюю дату среди архивных строк каждой таблицы во всех шардах.
+
+    Платёж или отзыв старого заказа может быть позже даты заказа, поэтому граница своя у каждой таблицы.
+    Границы хранятся в основной базе: читатель решает, заходить ли в архив, до того как обойти шарды.
+    """
+    from . import sharding
+    for model, (archived, date_field) in ARCHIVES.items():
+        if date_field is None:
+            continue
+        dates = [archived.objects.using(alias).aggregate(value=Max(date_field))['value']
+                 for alias in sharding.shard_aliases()]
+        dates = [value for value in dates if value is not None]
+        if dates:
+            Watermark.objects.update_or_create(name=HORIZON_PREFIX + model._meta.model_name,
+                                               defaults={'value': max(dates)})
+
+
+def get_horizon(model):
+    """Самая поздняя дата в архиве модели или None, если архив пуст."""
+    return (Watermark.objects.filter(name=HORIZON_PREFIX + model._meta.model_name)
+            .values_list('value', flat=True).first())
+
+
+def covers(model, date_from):
+    """Нужно ли читать архив для периода, начинающегося с date_from (None — с самого начала)."""
+    if model not in ARCHIVES:
+        return False
+    horizon = get_horizon(model if ARCHIVES[model][1] else Order)
+    return horizon is not None and (date_from is None or date_from <= horizon)
+
+
+def with_archive(model, date_from):
+    """Модели, которые нужно прочитать за период: горячая и, если период заходит в архив, архивная."""
+    if covers(model, date_from):
+        return [model, ARCHIVES[model][0]]
+    return [model]
@@ -0,0 +1,31 @@
+# firm/benchmarks.py
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Создаёт на время бенчмарка отдельную тестовую БД с применёнными миграциями.
+
+    Для SQLite это временный файл, а не память: потоки бенчмарка открывают собственные
+    соединения и должны конкурировать за блокировки так же, как рабочие процессы.
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    path = None
+    if connection.vendor == 'sqlite':
+        fd, path = tempfile.mkstemp(prefix='firm-bench-', suffix='.sqlite3')
+        os.close(fd)
+        connection.settings_dict['TEST']['NAME'] = path
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        if path and os.path.exists(path):
+            os.remove(path)
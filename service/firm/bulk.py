@@ -0,0 +1,97 @@
+# firm/bulk.py
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.constants import OnConflict
+
+from . import rollups
+from .cache import HOME_PAGE_MODELS, invalidate_home_page
+from .models import Courier, Order, OrderStatus, Payment, PaymentStatus
+
+# Что можно менять массово: ресурс -> модель и поля (внешний ключ -> модель справочника и поле для поиска по имени)
+BULK_TARGETS = {
+    'orders': {
+        'model': Order,
+        'fields': {'order_status': (OrderStatus, 'name'), 'courier': (Courier, 'email')},
+    },
+    'payments': {
+        'model': Payment,
+        'fields': {'payment_status': (PaymentStatus, 'name')},
+    },
+}
+
+
+def chunked_update(queryset, values, chunk_size=None):
+    """
+    Выполняет queryset.update(**values) порциями по pk, каждая порция — своя короткая транзакция.
+
+    pk порции выбираются по индексу первичного ключа (keyset, без OFFSET), затем один UPDATE ... WHERE
+    pk IN (...) с исходными условиями queryset. Так блокировка записи SQLite держится только на время
+    одной порции, а не всего обновления. Сигналы post_save, как и при любом update(), не отправляются.
+    Возвращает (обновлено строк, секунд).
+    """
+    chunk_size = chunk_size or getattr(settings, 'FIRM_BULK_CHUNK_SIZE', 1000)
+    queryset = queryset.order_by()
+    rows, last_pk = 0, None
+    started = time.perf_counter()
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(page.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        with transaction.atomic(using=queryset.db):
+            if queryset.model in rollups.ROLLED_UP_MODELS:
+                # Статус или сумма платежа за прошедший день меняет его дневные агрегаты
+                rollups.mark_dirty_rows(queryset.filter(pk__in=pks))
+            rows += queryset.filter(pk__in=pks).update(**values)
+        last_pk = pks[-1]
+    elapsed = time.perf_counter() - started
+    if rows and queryset.model in HOME_PAGE_MODELS:
+        # Статусы заказов и остатки товаров выводятся на главной; update() не шлёт сигналы, поэтому сбрасываем кеш сами
+        invalidate_home_page()
+    return rows, elapsed
+
+
+def delete_ids(model, ids, using='default', field=None):
+    """
+    Удаляет строки model, у которых field (по умолчанию первичный ключ) входит в ids, одним сырым DELETE.
+
+    Сборщик каскадов и сигналы не участвуют: ссылающиеся строки вызывающий удаляет раньше, а агрегаты
+    и полнотекстовый индекс поправляет сам. Возвращает число удалённых строк.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(field).column if field else model._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN "
+                       f"({', '.join(['%s'] * len(ids))})", ids)
+        return cursor.rowcount
+
+
+def insert_rows(model, objs, using=DEFAULT_DB_ALIAS, update_conflicts=False):
+    """
+    Вставляет объекты с заданными id как есть — с датами auto_now_add, которые bulk_create заменил бы на «сейчас».
+
+    Строки пишутся в «сыром» режиме, как при loaddata: pre_save полей не вызывается, а определения полей
+    модели не меняются, поэтому параллельные запросы продолжают получать свои даты. С update_conflicts
+    строки с теми же id перезаписываются. Сигналы не отправляются. Возвращает число строк.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    opts = model._meta
+    fields = opts.concrete_fields
+    conflict = {}
+    if update_conflicts:
+        conflict = {'on_conflict': OnConflict.UPDATE, 'unique_fields': [opts.pk],
+                    'update_fields': [field for field in fields if field is not opts.pk]}
+    batch_size = max(connections[using].ops.bulk_batch_size(fields, objs), 1)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(objs[start:start + batch_size], fields, raw=True, using=using, **conflict)
+    for obj in objs:
+        obj._state.adding, obj._state.db = False, using
+    return len(objs)
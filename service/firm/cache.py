@@ -0,0 +1,98 @@
+# firm/cache.py
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Client, Order, Product
+
+HOME_PAGE_CACHE_KEY = 'firm:home:latest'
+
+# Модели, строки которых выводит главная: их изменение (в том числе через update()) сбрасывает кеш
+HOME_PAGE_MODELS = (Client, Order, Product)
+
+
+def _home_page_timeout():
+    return getattr(settings, 'FIRM_HOME_CACHE_TIMEOUT', 300)
+
+
+def home_page_querysets():
+    """
+    Запросы блоков «последние клиенты/заказы/продукты» главной страницы.
+
+    Клиент заказа подтягивается тем же запросом (select_related), а название статуса
+    шаблон берёт из справочника в памяти (firm/lookups.py), поэтому запросов на строку нет.
+    """
+    return {
+        'latest_clients': Client.objects.only('id', 'surname', 'name', 'email', 'registration_date')
+        .order_by('-registration_date')[:5],
+        'latest_orders': Order.objects.select_related('client')
+        .only('id', 'creation_date', 'order_status_id', 'client__surname', 'client__name')
+        .order_by('-creation_date')[:5],
+        'latest_products': Product.objects.only('id', 'product_name', 'price', 'stock').order_by('-id')[:5],
+    }
+
+
+# Ключ сортировки блоков главной — тот же, что в order_by() home_page_querysets
+HOME_PAGE_SORT_KEYS = {
+    'latest_clients': lambda client: client.registration_date,
+    'latest_orders': lambda order: order.creation_date,
+}
+
+
+def load_home_page_data():
+    from . import sharding  # firm.sharding импортирует firm.bulk, а тот — этот модуль
+    if sharding.is_sharded():
+        return load_sharded_home_page_data()
+    return {name: list(queryset) for name, queryset in home_page_querysets().items()}
+
+
+def load_sharded_home_page_data():
+    # Клиенты и заказы — данные арендаторов: по запросу в каждый шард и слияние последних записей
+    from . import sharding
+    data = {}
+    for name, queryset in home_page_querysets().items():
+        if queryset.model in sharding.TENANT_MODELS:
+            limit = queryset.query.high_mark
+            data[name] = sharding.merge([queryset.using(alias) for alias in sharding.shard_aliases()],
+                                        HOME_PAGE_SORT_KEYS[name], reverse=True, limit=limit)
+        else:
+            data[name] = list(queryset)
+    return data
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def aload_home_page_data():
+    from . import sharding
+    if sharding.is_sharded():
+        return await sync_to_async(load_sharded_home_page_data)()
+    # Три независимых запроса запускаются одновременно через асинхронный ORM
+    querysets = home_page_querysets()
+    results = await asyncio.gather(*(_alist(queryset) for queryset in querysets.values()))
+    return dict(zip(querysets, results))
+
+
+def get_home_page_data():
+    """Возвращает данные главной страницы из кеша, при промахе загружает их из БД."""
+    data = cache.get(HOME_PAGE_CACHE_KEY)
+    if data is None:
+        data = load_home_page_data()
+        cache.set(HOME_PAGE_CACHE_KEY, data, _home_page_timeout())
+    return data
+
+
+async def aget_home_page_data():
+    """Асинхронный вариант get_home_page_data для async-представлений."""
+    data = await cache.aget(HOME_PAGE_CACHE_KEY)
+    if data is None:
+        data = await aload_home_page_data()
+        await cache.aset(HOME_PAGE_CACHE_KEY, data, _home_page_timeout())
+    return data
+
+
+def invalidate_home_page():
+    cache.delete(HOME_PAGE_CACHE_KEY)
@@ -0,0 +1,202 @@
+# firm/deletion.py
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import ratings, rollups, search
+from .bulk import delete_ids
+from .cache import invalidate_home_page
+from .models import (ArchivedFeedback, ArchivedOrder, ArchivedOrderItem, ArchivedPayment, Client, ClientPurgeJob,
+                     CourierRating, Feedback, Order, OrderItem, Payment)
+
+# Заказы клиента (горячие и архивные) и ссылающиеся на них строки в порядке удаления — снизу вверх
+HISTORY = (
+    (Order, (Feedback, Payment, OrderItem)),
+    (ArchivedOrder, (ArchivedFeedback, ArchivedPayment, ArchivedOrderItem)),
+)
+
+# Отзывы и платежи ссылаются на клиента и напрямую: такие строки могут висеть на заказе другого клиента
+DIRECT = (Feedback, Payment, ArchivedFeedback, ArchivedPayment)
+
+
+def _atomic(using):
+    # Строки клиента удаляются в его базе, а агрегаты оценок пишутся туда, куда их направляет роутер
+    # (при шардировании — в основную базу); обе транзакции открываются и фиксируются вместе
+    stack = ExitStack()
+    stack.enter_context(transaction.atomic(using=using))
+    ratings_db = router.db_for_write(CourierRating)
+    if ratings_db != using:
+        stack.enter_context(transaction.atomic(using=ratings_db))
+    return stack
+
+
+def _drop_feedbacks(model, ids, using):
+    # Перед удалением отзывы вычитаются из агрегатов оценок; горячие ещё и убираются из поиска
+    ratings.feedbacks_removed(model, ids, using=using)
+    if model in search.SEARCH_INDEXES and search.is_supported(using):
+        search.remove_ids(model, ids, using=using)
+
+
+def history_size(client_id, using=DEFAULT_DB_ALIAS, limit=None):
+    """Число заказов клиента вместе с архивными; с limit счёт останавливается на limit + 1."""
+    total = 0
+    for order_model, _ in HISTORY:
+        orders = order_model._base_manager.using(using).filter(client_id=client_id)
+        total += (orders[:limit + 1] if limit is not None else orders).count()
+    return total
+
+
+def purge_client(client_id, using=DEFAULT_DB_ALIAS, batch_size=None, progress=None):
+    """
+    Удаляет клиента со всей историей порциями по batch_size заказов, снизу вверх.
+
+    Для каждой порции заказов сырыми DELETE ... WHERE order_id IN (...) удаляются отзывы, платежи
+    и позиции, затем сами заказы; каждая порция — своя короткая транзакция. В память попадают только
+    id одной порции заказов и их отзывов, поэтому расход памяти не зависит от размера истории, а
+    блокировка записи SQLite держится лишь на время порции. Сигналы не отправляются: агрегаты оценок,
+    полнотекстовый индекс и кеш главной поправляются здесь же, а дни удалённых заказов и платежей
+    отмечаются для пересчёта дневных агрегатов (rollup_sales). Прерванное удаление можно повторить.
+
+    progress(заказов, строк) вызывается после каждой порции. Возвращает {модель: удалено строк}.
+    """
+    batch_size = batch_size or getattr(settings, 'FIRM_PURGE_BATCH_SIZE', 500)
+    deleted = {}
+
+    def count(model, rows):
+        deleted[model] = deleted.get(model, 0) + rows
+
+    def report():
+        if progress is not None:
+            progress(sum(deleted.get(model, 0) for model, _ in HISTORY), sum(deleted.values()))
+
+    for order_model, dependents in HISTORY:
+        orders = order_model._base_manager.using(using).filter(client_id=client_id).order_by('pk')
+        while True:
+            order_ids = list(orders.values_list('pk', flat=True)[:batch_size])
+            if not order_ids:
+                break
+            feedback, payment, _ = dependents
+            feedback_ids = list(feedback._base_manager.using(using).filter(order_id__in=order_ids)
+                                .values_list('pk', flat=True))
+            with _atomic(using):
+                if feedback_ids:
+                    _drop_feedbacks(feedback, feedback_ids, using)
+                # Дневные агрегаты этих заказов и платежей устаревают: rollup_sales пересчитает их дни
+                rollups.mark_dirty_rows(order_model._base_manager.using(using).filter(pk__in=order_ids))
+                rollups.mark_dirty_rows(payment._base_manager.using(using).filter(order_id__in=order_ids))
+                for model in dependents:
+                    count(model, delete_ids(model, order_ids, using, field='order'))
+                count(order_model, delete_ids(order_model, order_ids, using))
+            report()
+
+    for model in DIRECT:
+        rows = model._base_manager.using(using).filter(client_id=client_id).order_by('pk')
+        while True:
+            ids = list(rows.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with _atomic(using):
+                if model in ratings.FEEDBACK_MODELS:
+                    _drop_feedbacks(model, ids, using)
+                if model in rollups.ROLLED_UP_MODELS:
+                    rollups.mark_dirty_rows(model._base_manager.using(using).filter(pk__in=ids))
+                count(model, delete_ids(model, ids, using))
+            report()
+
+    with transaction.atomic(using=using):
+        if search.is_supported(using):
+            search.remove_ids(Client, [client_id], using=using)
+        count(Client, delete_ids(Client, [client_id], using))
+    report()
+    invalidate_home_page()
+    return deleted
+
+
+def delete_client(client, user=None):
+    """
+    Удаляет клиента из представления: небольшую историю — сразу, большую — в фоне.
+
+    Если заказов (вместе с архивными) не больше FIRM_PURGE_INLINE_ORDERS, клиент удаляется в этом же
+    запросе через purge_client; иначе ставится задание ClientPurgeJob, и запрос возвращается сразу.
+    Возвращает задание или None, если клиент удалён сразу.
+    """
+    using = client._state.db or DEFAULT_DB_ALIAS
+    inline = getattr(settings, 'FIRM_PURGE_INLINE_ORDERS', 50)
+    if history_size(client.pk, using, limit=inline) <= inline:
+        purge_client(client.pk, using)
+        return None
+    return enqueue(client, user)
+
+
+def enqueue(client, user=None):
+    """Ставит удаление клиента в очередь; если активное задание уже есть, возвращает его."""
+    using = client._state.db or DEFAULT_DB_ALIAS
+    active = ClientPurgeJob.objects.filter(shard=using, client_id=client.pk, status__in=ClientPurgeJob.ACTIVE_STATUSES)
+    job = active.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic(using=router.db_for_write(ClientPurgeJob)):
+            return ClientPurgeJob.objects.create(
+                client_id=client.pk, client_name=str(client), shard=using,
+                requested_by=user if user is not None and user.is_authenticated else None,
+            )
+    except IntegrityError:
+        # Параллельный запрос успел поставить задание первым (ограничение purge_active_client_uniq)
+        return active.first()
+
+
+def claim_job():
+    """
+    Забирает следующее задание: ожидающее или брошенное (running без прогресса дольше FIRM_PURGE_STALE_SECONDS).
+
+    Захват — условный UPDATE по прежним статусу и времени прогресса, поэтому два воркера не возьмут
+    одно задание. Возвращает задание или None, если очередь пуста.
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'FIRM_PURGE_STALE_SECONDS', 300))
+    due = (ClientPurgeJob.objects
+           .filter(Q(status=ClientPurgeJob.STATUS_PENDING)
+                   | Q(status=ClientPurgeJob.STATUS_RUNNING, updated_at__lt=stale))
+           .order_by('status', 'id'))
+    while True:
+        job = due.first()
+        if job is None:
+            return None
+        claimed = ClientPurgeJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=ClientPurgeJob.STATUS_RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job, batch_size=None):
+    """
+    Выполняет захваченное задание, записывая прогресс после каждой порции.
+
+    При ошибке задание возвращается в очередь (удаление идемпотентно и продолжится с места остановки),
+    а после FIRM_PURGE_MAX_ATTEMPTS попыток получает статус failed. Возвращает True, если клиент удалён.
+    """
+    jobs = ClientPurgeJob.objects.filter(pk=job.pk)
+
+    def progress(orders, rows):
+        # Счётчики продолжают значения прошлых попыток: повторный запуск доудаляет остаток
+        jobs.update(orders_deleted=job.orders_deleted + orders, rows_deleted=job.rows_deleted + rows,
+                    updated_at=timezone.now())
+
+    try:
+        if not job.orders_total:
+            job.orders_total = history_size(job.client_id, job.shard)
+            jobs.update(orders_total=job.orders_total, updated_at=timezone.now())
+        purge_client(job.client_id, job.shard, batch_size, progress)
+    except Exception as exc:
+        failed = job.attempts >= getattr(settings, 'FIRM_PURGE_MAX_ATTEMPTS', 3)
+        jobs.update(status=ClientPurgeJob.STATUS_FAILED if failed else ClientPurgeJob.STATUS_PENDING,
+                    last_error=f"{type(exc).__name__}: {exc}", updated_at=timezone.now())
+        return False
+    jobs.update(status=ClientPurgeJob.STATUS_DONE, finished_at=timezone.now(), updated_at=timezone.now())
+    return True
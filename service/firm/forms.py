@@ -1,14 +1,11 @@
 # firm/forms.py
-import re
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordResetForm, SetPasswordForm
-from .models import CustomUser, Client
-
-# Регулярные выражения
-NAME_REGEX = r'^[А-ЯЁ][а-яё]+$'
-# Улучшенная регулярка для email (поддержка доменов до 5 уровней, только латиница)
-EMAIL_REGEX = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,5}(\.[a-zA-Z]{2,3}){0,4}$' # Немного скорректировал для 5 уровней
-PASSWORD_REGEX = r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$'
+from .models import CustomUser, Client, Order, OrderItem, Payment, Product
+from .validation import (
+    NAME_REGEX, EMAIL_REGEX, PASSWORD_REGEX, NAME_RE, EMAIL_RE, PASSWORD_RE,
+    FIRST_NAME_MESSAGE, SURNAME_MESSAGE, PATRONYMIC_MESSAGE, EMAIL_MESSAGE, PASSWORD_MESSAGE, check,
+)
 
 
 class RegistrationForm(UserCreationForm):
@@ -29,39 +26,23 @@ class RegistrationForm(UserCreationForm):
         return user
 
     def clean_first_name(self):
-        first_name = self.cleaned_data.get('first_name')
-        if not re.match(NAME_REGEX, first_name):
-            raise forms.ValidationError(
-                "Имя должно начинаться с прописной буквы и содержать только кириллические буквы.")
-        return first_name
+        return check(self.cleaned_data.get('first_name'), NAME_RE, FIRST_NAME_MESSAGE)
 
     def clean_last_name(self):
-        last_name = self.cleaned_data.get('last_name')
-        if not re.match(NAME_REGEX, last_name):
-            raise forms.ValidationError(
-                "Фамилия должна начинаться с прописной буквы и содержать только кириллические буквы.")
-        return last_name
+        return check(self.cleaned_data.get('last_name'), NAME_RE, SURNAME_MESSAGE)
 
     def clean_patronymic(self):
-        patronymic = self.cleaned_data.get('patronymic')
-        if not re.match(NAME_REGEX, patronymic):
-            raise forms.ValidationError(
-                "Отчество должно начинаться с прописной буквы и содержать только кириллические буквы.")
-        return patronymic
+        return check(self.cleaned_data.get('patronymic'), NAME_RE, PATRONYMIC_MESSAGE)
 
     def clean_email(self):
-        email = self.cleaned_data.get('email')
-        if not re.match(EMAIL_REGEX, email):
-            raise forms.ValidationError("Введите корректный email адрес (латинские буквы, @ и домен до 5 уровней).")
-        return email
+        return check(self.cleaned_data.get('email'), EMAIL_RE, EMAIL_MESSAGE)
 
     def clean_password2(self):
         password1 = self.cleaned_data.get('password1')
         password2 = self.cleaned_data.get('password2')
         if password1 != password2:
             raise forms.ValidationError("Пароли не совпадают!")
-        if not re.match(PASSWORD_REGEX, password1):
-            raise forms.ValidationError("Пароль должен быть не менее 8 символов, содержать прописные и строчные латинские буквы, цифры и специальные символы.")
+        check(password1, PASSWORD_RE, PASSWORD_MESSAGE)
         return password2
 
 
@@ -90,23 +71,13 @@ class ClientCreateForm(forms.ModelForm):
         fields = ['surname', 'name', 'email']
 
     def clean_surname(self):
-        surname = self.cleaned_data['surname']
-        if not re.match(NAME_REGEX, surname):
-            raise forms.ValidationError(
-                "Фамилия должна начинаться с прописной буквы и содержать только кириллические буквы.")
-        return surname
+        return check(self.cleaned_data['surname'], NAME_RE, SURNAME_MESSAGE)
 
     def clean_name(self):
-        name = self.cleaned_data['name']
-        if not re.match(NAME_REGEX, name):
-            raise forms.ValidationError(
-                "Имя должно начинаться с прописной буквы и содержать только кириллические буквы.")
-        return name
+        return check(self.cleaned_data['name'], NAME_RE, FIRST_NAME_MESSAGE)
 
     def clean_email(self):
-        email = self.cleaned_data['email']
-        if not re.match(EMAIL_REGEX, email):
-            raise forms.ValidationError("Введите корректный email адрес (латинские буквы, @ и домен до 5 уровней).")
+        email = check(self.cleaned_data['email'], EMAIL_RE, EMAIL_MESSAGE)
         if Client.objects.filter(email=email).exists():
              raise forms.ValidationError("Клиент с таким email уже существует.")
         return email
@@ -118,23 +89,13 @@ class ClientUpdateForm(forms.ModelForm):
         fields = ['surname', 'name', 'email']
 
     def clean_surname(self):
-        surname = self.cleaned_data['surname']
-        if not re.match(NAME_REGEX, surname):
-            raise forms.ValidationError(
-                "Фамилия должна начинаться с прописной буквы и содержать только кириллические буквы.")
-        return surname
+        return check(self.cleaned_data['surname'], NAME_RE, SURNAME_MESSAGE)
 
     def clean_name(self):
-        name = self.cleaned_data['name']
-        if not re.match(NAME_REGEX, name):
-            raise forms.ValidationError(
-                "Имя должно начинаться с прописной буквы и содержать только кириллические буквы.")
-        return name
+        return check(self.cleaned_data['name'], NAME_RE, FIRST_NAME_MESSAGE)
 
     def clean_email(self):
-        email = self.cleaned_data['email']
-        if not re.match(EMAIL_REGEX, email):
-            raise forms.ValidationError("Введите корректный email адрес (латинские буквы, @ и домен до 5 уровней).")
+        email = check(self.cleaned_data['email'], EMAIL_RE, EMAIL_MESSAGE)
         if Client.objects.filter(email=email).exclude(pk=self.instance.pk).exists():
              raise forms.ValidationError("Клиент с таким email уже существует.")
         return email
@@ -149,4 +110,28 @@ class ClientViewForm(forms.ModelForm):
             'name': forms.TextInput(attrs={'readonly': 'readonly'}),
             'email': forms.EmailInput(attrs={'readonly': 'readonly'}),
             'registration_date': forms.DateTimeInput(attrs={'readonly': 'readonly'}), # Можно оставить виджет, он не вызывает ошибку
-        }
\ No newline at end of file
+        }
+
+# Формы для записи через JSON API (firm/api.py); права на связанные объекты ограничивает API
+class OrderForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = ['order_status', 'client', 'courier', 'content']
+
+
+class OrderItemForm(forms.ModelForm):
+    class Meta:
+        model = OrderItem
+        fields = ['order', 'product', 'amount', 'price']
+
+
+class PaymentForm(forms.ModelForm):
+    class Meta:
+        model = Payment
+        fields = ['order', 'client', 'payment_status', 'amount']
+
+
+class ProductForm(forms.ModelForm):
+    class Meta:
+        model = Product
+        fields = ['product_name', 'price', 'category', 'stock']
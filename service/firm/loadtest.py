@@ -0,0 +1,243 @@
+# firm/loadtest.py
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+
+def percentile(sorted_values, share):
+    """Перцентиль по отсортированному списку (ближайший ранг)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def run_workers(make_step, concurrency, duration):
+    """
+    Гоняет шаги нагрузки из concurrency потоков в течение duration секунд.
+
+    make_step(номер потока) готовит состояние потока (например, входит в систему — это не
+    замеряется) и возвращает функцию одного шага; шаг возвращает True при успехе.
+    Считаются задержки успешных шагов и число ошибок. Возвращает сводку summarize().
+    """
+    latencies, lock = [], threading.Lock()
+    errors = [0]
+    deadline = [None]
+    ready = threading.Barrier(concurrency + 1)
+    go = threading.Event()
+
+    def worker(number):
+        local, failed, step = [], 0, None
+        try:
+            step = make_step(number)
+        except Exception:
+            failed = 1  # поток не смог подготовиться (например, войти) и в нагрузке не участвует
+        finally:
+            ready.wait()
+        go.wait()
+        while step is not None and time.perf_counter() < deadline[0]:
+            started = time.perf_counter()
+            try:
+                ok = step()
+            except (urllib.error.URLError, OSError):
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Отсчёт начинается, когда все потоки подготовились (вошли в систему и т.п.)
+    ready.wait()
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    go.set()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def run_http(url, concurrency, duration, headers=None, timeout=30):
+    """Гоняет GET-запросы на url из concurrency потоков в течение duration секунд (ответы 2xx/3xx — успех)."""
+    headers = headers or {}
+
+    def make_step(number):
+        def step():
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                response.read()
+            return True
+        return step
+
+    return run_workers(make_step, concurrency, duration)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Ответ 302 после POST — это и есть результат формы; переход по нему мерить не нужно
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """HTTP-сессия одного виртуального пользователя: cookies (sessionid, csrftoken) и формы с CSRF-токеном."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def request(self, path, data=None):
+        """Возвращает (статус, тело); 3xx не считаются ошибкой и не выполняются."""
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode({'csrfmiddlewaretoken': self.cookie('csrftoken'), **data}).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, headers={'Referer': self.base_url + path})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code, b''
+
+    def cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return ''
+
+    def login(self, username, password):
+        self.request('/firm/login/')  # выдаёт csrftoken
+        status, _ = self.request('/firm/login/', {'username': username, 'password': password})
+        # Успешный вход — редирект; неверный пароль — снова форма с кодом 200
+        return status == 302
+
+
+def ok(status):
+    return 200 <= status < 400
+
+
+def _visible_clients(session):
+    # id и email своих клиентов берём из JSON API (firm/api.py) одним запросом на поток
+    status, body = session.request('/firm/api/clients/?fields=id,surname,email&page_size=200')
+    return json.loads(body)['results'] if status == 200 else []
+
+
+SURNAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов')
+NAMES = ('Иван', 'Пётр', 'Мария', 'Анна')
+
+
+def scenario_index(session, rnd):
+    return lambda: ok(session.request('/')[0])
+
+
+def scenario_client_list(session, rnd):
+    return lambda: session.request('/firm/clients/')[0] == 200
+
+
+def scenario_client_detail(session, rnd):
+    clients = _visible_clients(session)
+    return lambda: bool(clients) and session.request(f"/firm/clients/{rnd.choice(clients)['id']}/")[0] == 200
+
+
+def scenario_client_create(session, rnd):
+    counter = itertools.count()
+    prefix = f'{time.time_ns():x}{rnd.randrange(1 << 30):x}'
+
+    def step():
+        data = {'surname': rnd.choice(SURNAMES), 'name': rnd.choice(NAMES),
+                'email': f'bench{prefix}n{next(counter)}@bench.test'}
+        # Успешное создание — редирект на список; ошибка формы — 200 со страницей формы
+        return session.request('/firm/clients/create/', data)[0] == 302
+    return step
+
+
+def scenario_client_update(session, rnd):
+    clients = _visible_clients(session)
+
+    def step():
+        if not clients:
+            return False
+        client = rnd.choice(clients)
+        data = {'surname': client['surname'], 'name': rnd.choice(NAMES), 'email': client['email']}
+        return session.request(f"/firm/clients/{client['id']}/update/", data)[0] == 302
+    return step
+
+
+# Сценарии нагрузки: имя -> (представление в метриках /metrics, нужен ли вход, фабрика шага по сессии)
+SCENARIOS = {
+    'index': ('index', False, scenario_index),
+    'client_list': ('firm:client_list', True, scenario_client_list),
+    'client_detail': ('firm:client_detail', True, scenario_client_detail),
+    'client_create': ('firm:client_create', True, scenario_client_create),
+    'client_update': ('firm:client_update', True, scenario_client_update),
+    'login': ('firm:login', False, None),
+}
+
+
+def run_scenario(name, base_url, concurrency, duration, credentials, seed=0, timeout=30):
+    """
+    Прогоняет сценарий SCENARIOS[name]: каждый поток — отдельная сессия своего пользователя
+    из credentials (список пар логин/пароль, по кругу). Для login каждый шаг — вход новой сессией.
+    """
+    view, needs_login, factory = SCENARIOS[name]
+
+    def make_step(number):
+        rnd = random.Random(seed * 100003 + number)
+        username, password = credentials[number % len(credentials)]
+        if name == 'login':
+            def step():
+                session = Session(base_url, timeout)
+                session.request('/firm/login/')
+                return session.login(username, password)
+            return step
+        session = Session(base_url, timeout)
+        if needs_login and not session.login(username, password):
+            raise RuntimeError(f"Не удалось войти как {username}")
+        return factory(session, rnd)
+
+    return run_workers(make_step, concurrency, duration)
+
+
+METRIC_LINE = re.compile(r'^(firm_request_queries_(?:sum|count))\{view="([^"]*)"\} (\S+)$')
+
+
+def query_totals(base_url, token=None, timeout=30):
+    """Считывает с /metrics суммарное число SQL-запросов и число запросов по каждому представлению."""
+    request = urllib.request.Request(base_url.rstrip('/') + '/metrics')
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        text = response.read().decode('utf-8')
+    totals = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            metric, view, value = match.groups()
+            totals.setdefault(view, [0.0, 0.0])[metric.endswith('_count')] = float(value)
+    return totals
@@ -0,0 +1,73 @@
+# firm/lookups.py
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import OrderStatus, PaymentStatus
+
+# Маленькие, почти неизменные справочники: имя -> (модель, поле с названием)
+LOOKUPS = {
+    'order_status': (OrderStatus, 'name'),
+    'payment_status': (PaymentStatus, 'name'),
+}
+
+# Локальная копия справочников в процессе: имя -> (версия, {id: название}, время последней сверки версии)
+_tables = {}
+
+
+def _version_key(name):
+    return f'firm:lookups:{name}:version'
+
+
+def _check_interval():
+    # Как часто (в секундах) сверять локальную копию с версией в общем кеше
+    return getattr(settings, 'FIRM_LOOKUP_CHECK_INTERVAL', 1.0)
+
+
+def get_table(name):
+    """
+    Возвращает справочник {id: название}, загружая таблицу из БД один раз на версию.
+
+    Версия хранится в общем кеше и меняется при любом изменении справочника (invalidate),
+    так что остальные воркеры перечитывают таблицу не позже чем через FIRM_LOOKUP_CHECK_INTERVAL.
+    """
+    now = time.monotonic()
+    entry = _tables.get(name)
+    if entry is not None and now - entry[2] < _check_interval():
+        return entry[1]
+
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex)
+        version = cache.get(key)
+    if entry is not None and entry[0] == version:
+        _tables[name] = (version, entry[1], now)
+        return entry[1]
+
+    model, field = LOOKUPS[name]
+    values = dict(model.objects.values_list('pk', field))
+    _tables[name] = (version, values, now)
+    return values
+
+
+def get_name(name, pk, default=None):
+    if pk is None:
+        return default
+    return get_table(name).get(pk, default)
+
+
+def get_order_status_name(pk, default=None):
+    return get_name('order_status', pk, default)
+
+
+def get_payment_status_name(pk, default=None):
+    return get_name('payment_status', pk, default)
+
+
+def invalidate(name):
+    """Меняет версию справочника в общем кеше: все процессы перечитают таблицу."""
+    cache.set(_version_key(name), uuid.uuid4().hex, None)
+    _tables.pop(name, None)
@@ -0,0 +1,148 @@
+# firm/mail.py
+import smtplib
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+class OutboxBackend(BaseEmailBackend):
+    """
+    EMAIL_BACKEND, который не ходит в SMTP, а кладёт письма в таблицу OutboxEmail.
+
+    Запрос (например, сброс пароля) тратит на письмо одну вставку в БД, а доставкой
+    занимается команда send_outbox через настоящий бэкенд FIRM_OUTBOX_DELIVERY_BACKEND.
+    """
+
+    def send_messages(self, email_messages):
+        rows = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            if message.attachments:
+                raise ValueError("Вложения в очереди писем не поддерживаются.")
+            rows.append(OutboxEmail(
+                subject=message.subject,
+                body=message.body,
+                from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=list(message.to),
+                cc=list(message.cc),
+                bcc=list(message.bcc),
+                reply_to=list(message.reply_to),
+                headers=dict(message.extra_headers),
+                alternatives=[list(part) for part in getattr(message, 'alternatives', [])],
+            ))
+        OutboxEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def to_message(row, connection=None):
+    message = EmailMultiAlternatives(
+        subject=row.subject, body=row.body, from_email=row.from_email, to=row.to, cc=row.cc, bcc=row.bcc,
+        reply_to=row.reply_to, headers=row.headers, connection=connection,
+    )
+    for content, mimetype in row.alternatives:
+        message.attach_alternative(content, mimetype)
+    return message
+
+
+def delivery_connection(**overrides):
+    """Соединение настоящего бэкенда доставки; overrides — host, port, use_tls и т.п. (для локального SMTP)."""
+    backend = getattr(settings, 'FIRM_OUTBOX_DELIVERY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+    return get_connection(backend, **overrides)
+
+
+def retry_delay(attempts):
+    # Экспоненциальная пауза: base, 2*base, 4*base ... но не больше FIRM_OUTBOX_MAX_RETRY_DELAY
+    base = getattr(settings, 'FIRM_OUTBOX_RETRY_DELAY', 60)
+    maximum = getattr(settings, 'FIRM_OUTBOX_MAX_RETRY_DELAY', 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), maximum))
+
+
+class NotDelivered(Exception):
+    """Бэкенд доставки не отправил письмо, хотя и не бросил исключение (send_messages вернул 0)."""
+
+
+def claim_batch(batch_size):
+    """
+    Захватывает порцию готовых писем, чтобы параллельные воркеры не отправили одно письмо дважды.
+
+    Захват — условный UPDATE: у писем, которые всё ещё ожидают и уже готовы к отправке, next_attempt_at
+    сдвигается на FIRM_OUTBOX_LEASE_SECONDS вперёд и ставится метка порции. Другой воркер такие письма
+    не видит, пока аренда не истечёт; если воркер упал, письма сами вернутся в очередь по её истечении.
+    Возвращает (метка, захваченные письма).
+    """
+    now = timezone.now()
+    due = OutboxEmail.objects.filter(status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return None, []
+    token = uuid.uuid4().hex
+    lease = timedelta(seconds=getattr(settings, 'FIRM_OUTBOX_LEASE_SECONDS', 300))
+    due.filter(pk__in=ids).update(next_attempt_at=now + lease, claim_token=token)
+    rows = OutboxEmail.objects.filter(pk__in=ids, claim_token=token).order_by('id')
+    return token, list(rows)
+
+
+def deliver_batch(connection, batch_size):
+    """
+    Отправляет одну порцию готовых писем через уже открытое соединение.
+
+    Порция сначала захватывается (claim_batch). Каждое письмо уходит отдельным send_messages([...])
+    по тому же SMTP-соединению, чтобы ошибка одного адресата не откатывала остальные; результат 0
+    считается неудачной попыткой. Отправленные помечаются одним UPDATE, неудачные получают следующую
+    попытку с экспоненциальной паузой или статус failed. Возвращает (отправлено, ошибок, писем в порции).
+    """
+    token, rows = claim_batch(batch_size)
+    max_attempts = getattr(settings, 'FIRM_OUTBOX_MAX_ATTEMPTS', 5)
+    sent_ids, failed = [], []
+    for row in rows:
+        try:
+            if not connection.send_messages([to_message(row, connection)]):
+                raise NotDelivered("бэкенд доставки не отправил письмо")
+        except Exception as exc:
+            row.attempts += 1
+            row.last_error = f"{type(exc).__name__}: {exc}"
+            if row.attempts >= max_attempts:
+                row.status = OutboxEmail.STATUS_FAILED
+            else:
+                row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+            failed.append(row)
+            if isinstance(exc, (smtplib.SMTPServerDisconnected, OSError)):
+                # Соединение потеряно: переоткрываем, а если сервер недоступен — оставляем остаток порции на потом
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    break
+        else:
+            sent_ids.append(row.pk)
+
+    if sent_ids:
+        OutboxEmail.objects.filter(pk__in=sent_ids, claim_token=token).update(
+            status=OutboxEmail.STATUS_SENT, sent_at=timezone.now(), attempts=F('attempts') + 1,
+        )
+    if failed:
+        OutboxEmail.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return len(sent_ids), len(failed), len(rows)
+
+
+def drain(connection, batch_size, max_batches=None):
+    """Разбирает очередь порциями, пока есть готовые письма; возвращает (отправлено, ошибок, секунд)."""
+    sent = errors = batches = 0
+    started = time.perf_counter()
+    while max_batches is None or batches < max_batches:
+        batch_sent, batch_errors, size = deliver_batch(connection, batch_size)
+        sent += batch_sent
+        errors += batch_errors
+        batches += 1
+        if size < batch_size:
+            break
+    return sent, errors, time.perf_counter() - started
@@ -0,0 +1,23 @@
+# firm/management/commands/assign_couriers.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from firm.scheduling import assign_couriers
+
+
+class Command(BaseCommand):
+    help = "Назначает курьеров всем открытым заказам без курьера, выравнивая текущую загрузку курьеров."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacity', type=int, help="Максимум открытых заказов на одного курьера.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Сколько id заказов передавать в одном UPDATE ... WHERE id IN (...).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        assigned, skipped = assign_couriers(capacity=options['capacity'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Назначено заказов: {assigned} за {time.perf_counter() - started:.3f} с."
+        ))
+        if skipped:
+            self.stdout.write(f"Пропущено заказов, получивших курьера параллельно: {skipped}")
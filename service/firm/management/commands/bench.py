@@ -0,0 +1,138 @@
+# firm/management/commands/bench.py
+import json
+import platform
+import secrets
+import subprocess
+import threading
+import urllib.error
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+from firm.loadtest import SCENARIOS, query_totals, run_scenario
+from firm.models import Client, Feedback, Order, OrderItem, Payment, Product
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def git_revision():
+    """Коммит и признак незакоммиченных изменений — чтобы результаты разных версий можно было сопоставить."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный прогон сценариев (главная, список/карточка/создание/изменение клиента, вход) с параллельными "
+            "сессиями; результат — JSON с p50/p95/p99, пропускной способностью, числом SQL-запросов на запрос "
+            "(по /metrics) и коммитом. Данные — из seed_scale (пользователи seed_*). Сервер можно запустить "
+            "внутри команды (--serve) или указать уже запущенный (--base-url); для точного числа запросов "
+            "сервер должен работать одним процессом, так как метрики хранятся в памяти процесса.")
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--base-url', help="Адрес уже запущенного сервера, например http://127.0.0.1:8000")
+        target.add_argument('--serve', action='store_true', help="Поднять многопоточный WSGI-сервер в этом процессе.")
+        parser.add_argument('--scenario', action='append', help=f"Сценарии: {', '.join(SCENARIOS)} (по умолчанию все).")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10.0, help="Секунд на каждый сценарий.")
+        parser.add_argument('--users', type=int, default=10, help="Сколько пользователей seed_0..seed_N-1 задействовать.")
+        parser.add_argument('--username-prefix', default='seed_')
+        parser.add_argument('--password', default='seed-password')
+        parser.add_argument('--seed', type=int, default=42, help="Зерно для выбора клиентов и данных форм.")
+        parser.add_argument('--output', help="Записать JSON в файл (иначе — в stdout).")
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(unknown)}")
+        if options['concurrency'] < 1 or options['users'] < 1:
+            raise CommandError("--concurrency и --users должны быть положительными.")
+        credentials = [(f"{options['username_prefix']}{i}", options['password']) for i in range(options['users'])]
+
+        server = None
+        base_url = options['base_url']
+        if options['serve']:
+            # Свой сервер читает настройки этого процесса: /metrics открывается разовым токеном, если он не задан
+            if not getattr(settings, 'FIRM_METRICS_TOKEN', None):
+                settings.FIRM_METRICS_TOKEN = secrets.token_urlsafe(24)
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+            server.set_app(WSGIHandler())
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+
+        commit, dirty = git_revision()
+        report = {
+            'commit': commit,
+            'dirty': dirty,
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            # С репликой (FIRM_REPLICA_DB) чтения идут в 'replica' — результаты сравнивают с прогоном без неё
+            'database_aliases': sorted(settings.DATABASES),
+            'base_url': base_url,
+            'in_process_server': bool(server),
+            'concurrency': options['concurrency'],
+            'duration': options['duration'],
+            'seed': options['seed'],
+            'dataset': {model._meta.model_name: model.objects.count()
+                        for model in (Client, Order, OrderItem, Payment, Feedback, Product)},
+            'scenarios': [],
+        }
+        try:
+            for name in scenarios:
+                before = self.query_totals(base_url)
+                stats = run_scenario(name, base_url, options['concurrency'], options['duration'], credentials,
+                                     seed=options['seed'])
+                after = self.query_totals(base_url)
+                stats = {'name': name, **stats, 'queries_per_request': self.queries_per_request(name, before, after)}
+                report['scenarios'].append(stats)
+                self.stderr.write(
+                    f"{name:<14} {stats['throughput']:>8.1f} зап/с  p50 {stats['p50_ms']:>7.1f} мс  "
+                    f"p95 {stats['p95_ms']:>7.1f} мс  p99 {stats['p99_ms']:>7.1f} мс  "
+                    f"SQL/запрос {stats['queries_per_request']}  ошибок {stats['errors']}"
+                )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+            self.stderr.write(f"Результаты записаны в {options['output']}")
+        else:
+            self.stdout.write(text)
+
+    @staticmethod
+    def query_totals(base_url):
+        try:
+            return query_totals(base_url, getattr(settings, 'FIRM_METRICS_TOKEN', None))
+        except (urllib.error.URLError, OSError):
+            return None  # /metrics недоступен (нет middleware или не задан FIRM_METRICS_TOKEN)
+
+    @staticmethod
+    def queries_per_request(name, before, after):
+        if before is None or after is None:
+            return None
+        view = SCENARIOS[name][0]
+        queries_sum, count = after.get(view, [0.0, 0.0])
+        old_sum, old_count = before.get(view, [0.0, 0.0])
+        if count <= old_count:
+            return None
+        return round((queries_sum - old_sum) / (count - old_count), 2)
@@ -0,0 +1,87 @@
+# firm/management/commands/bench_api.py
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client as TestClient
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from firm.benchmarks import benchmark_database
+from firm.models import Client
+
+# Что сравнивается: HTML-список клиентов, JSON API целиком и JSON API с урезанным набором полей
+VARIANTS = [
+    ('HTML /firm/clients/', '/firm/clients/?page_size={size}'),
+    ('API /firm/api/clients/', '/firm/api/clients/?page_size={size}'),
+    ('API ?fields=id,surname,email', '/firm/api/clients/?page_size={size}&fields=id,surname,email'),
+]
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает HTML-список клиентов и JSON API на отдельной временной БД: "
+            "строк в секунду при обходе всех страниц и пик памяти на запрос (tracemalloc).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20000)
+        parser.add_argument('--page-size', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=3, help="Сколько обходов делать (берётся лучший).")
+
+    def handle(self, *args, **options):
+        # Тестовый клиент ходит на testserver, которого нет в ALLOWED_HOSTS
+        setup_test_environment()
+        try:
+            with benchmark_database():
+                self.run(options)
+        finally:
+            teardown_test_environment()
+
+    def run(self, options):
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'bench', patronymic='Тестович')
+        Client.objects.bulk_create(
+            (Client(surname='Иванов', name='Иван', email=f'bench{i}@example.com', created_by=user)
+             for i in range(options['clients'])),
+            batch_size=1000,
+        )
+        http = TestClient()
+        http.force_login(user)
+        size = options['page_size']
+
+        # Курсоры одинаковы для HTML и API (тот же ключ registration_date, id), поэтому собираем их один раз
+        cursors = [None]
+        while True:
+            payload = http.get(f'/firm/api/clients/?page_size={size}&fields=id' + self.after(cursors[-1])).json()
+            if not payload['next']:
+                break
+            cursors.append(payload['next'])
+        self.stdout.write(f"Клиентов: {options['clients']}, размер страницы: {size}, страниц: {len(cursors)}")
+
+        for label, url in VARIANTS:
+            url = url.format(size=size)
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                for cursor in cursors:
+                    response = http.get(url + self.after(cursor))
+                    if response.status_code != 200:
+                        raise CommandError(f"{url}: ответ {response.status_code}")
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+            # Память меряется отдельным проходом: tracemalloc заметно замедляет выполнение
+            peaks = []
+            for cursor in cursors[:10]:
+                tracemalloc.start()
+                http.get(url + self.after(cursor))
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+            self.stdout.write(
+                f"{label:32} {options['clients'] / best:10.0f} строк/с, "
+                f"{best / len(cursors) * 1000:7.1f} мс/страница, "
+                f"пик памяти {sum(peaks) / len(peaks) / 1024:8.0f} КиБ/запрос"
+            )
+
+    @staticmethod
+    def after(cursor):
+        return f'&after={cursor}' if cursor else ''
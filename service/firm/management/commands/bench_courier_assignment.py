@@ -0,0 +1,64 @@
+# firm/management/commands/bench_courier_assignment.py
+import random
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.benchmarks import benchmark_database
+from firm.models import Client, Courier, Order
+from firm.scheduling import assign_couriers, plan_assignments
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк назначения курьеров на отдельной временной БД (по умолчанию 10k заказов × 500 курьеров)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--couriers', type=int, default=500)
+        parser.add_argument('--preassigned', type=float, default=0.2,
+                            help="Доля заказов, уже назначенных случайным курьерам (исходная неравномерная загрузка).")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.run(options)
+
+    def run(self, options):
+        rnd = random.Random(options['seed'])
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'bench', patronymic='Тестович')
+        client = Client.objects.create(surname='Тестов', name='Тест', email='bench@example.com', created_by=user)
+        Courier.objects.bulk_create(
+            Courier(surname='Курьеров', name='Курьер', email=f'courier{i}@example.com', created_by=user)
+            for i in range(options['couriers'])
+        )
+        courier_ids = list(Courier.objects.values_list('pk', flat=True))
+        Order.objects.bulk_create(
+            (Order(client=client, created_by=user,
+                   courier_id=rnd.choice(courier_ids) if rnd.random() < options['preassigned'] else None)
+             for _ in range(options['orders'])),
+            batch_size=1000,
+        )
+        pending = Order.objects.filter(courier__isnull=True).count()
+
+        # Отдельно — чистый алгоритм на куче, без БД
+        loads = dict.fromkeys(courier_ids, 0)
+        started = time.perf_counter()
+        plan_assignments(range(pending), loads)
+        plan_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        assigned, _ = assign_couriers()
+        total_time = time.perf_counter() - started
+
+        loads = Counter(Order.objects.values_list('courier_id', flat=True))
+        if None in loads or assigned != pending:
+            raise CommandError("Не все заказы получили курьера.")
+        spread = max(loads.values()) - min(loads.get(pk, 0) for pk in courier_ids)
+
+        self.stdout.write(f"Заказов без курьера: {pending}, курьеров: {len(courier_ids)}")
+        self.stdout.write(f"Планирование (куча): {plan_time * 1000:.1f} мс")
+        self.stdout.write(f"Полный проход (чтение + план + запись): {total_time * 1000:.1f} мс, "
+                          f"{assigned / total_time:.0f} заказов/с")
+        self.stdout.write(self.style.SUCCESS(f"Разброс загрузки курьеров после назначения: {spread}"))
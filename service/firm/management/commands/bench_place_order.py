@@ -0,0 +1,91 @@
+# firm/management/commands/bench_place_order.py
+import random
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from firm.benchmarks import benchmark_database
+from firm.models import Client, Order, OrderItem, Product
+from firm.orders import InsufficientStock, place_order
+
+
+class Command(BaseCommand):
+    help = ("Многопоточный бенчмарк place_order на отдельной временной БД: заказы в секунду "
+            "и проверка, что остаток ни одного товара не ушёл в минус.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=2000, help="Сколько заказов попытается оформить каждый поток.")
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--stock', type=int, default=500, help="Начальный остаток каждого товара.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.run(options)
+
+    def run(self, options):
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'bench', patronymic='Тестович')
+        client = Client.objects.create(surname='Тестов', name='Тест', email='bench@example.com', created_by=user)
+        Product.objects.bulk_create(
+            Product(product_name=f'Товар {i}', price='10.00', stock=options['stock'])
+            for i in range(options['products'])
+        )
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        initial_stock = options['stock'] * len(product_ids)
+
+        stats = {'placed': 0, 'rejected': 0, 'retries': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            placed = rejected = retries = 0
+            try:
+                for _ in range(options['orders']):
+                    items = [(rnd.choice(product_ids), rnd.randint(1, 3)) for _ in range(rnd.randint(1, 3))]
+                    while True:
+                        try:
+                            place_order(client, items, user)
+                            placed += 1
+                        except InsufficientStock:
+                            rejected += 1
+                        except OperationalError:
+                            # SQLite: писатель не дождался блокировки — повторяем заказ целиком
+                            retries += 1
+                            continue
+                        break
+            finally:
+                connection.close()
+            with lock:
+                stats['placed'] += placed
+                stats['rejected'] += rejected
+                stats['retries'] += retries
+
+        threads = [threading.Thread(target=worker, args=(options['seed'] + i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        negative = Product.objects.filter(stock__lt=0).count()
+        remaining = Product.objects.aggregate(total=Sum('stock'))['total'] or 0
+        sold = OrderItem.objects.aggregate(total=Sum('amount'))['total'] or 0
+        attempts = stats['placed'] + stats['rejected']
+
+        self.stdout.write(f"Потоков: {options['threads']}, попыток: {attempts}, оформлено: {stats['placed']}, "
+                          f"отказов по остатку: {stats['rejected']}, повторов из-за блокировок: {stats['retries']}")
+        self.stdout.write(f"Время: {elapsed:.2f} с, {attempts / elapsed:.0f} попыток/с, "
+                          f"{stats['placed'] / elapsed:.0f} заказов/с")
+        self.stdout.write(f"Остаток: было {initial_stock}, продано {sold}, осталось {remaining}")
+        if negative or sold + remaining != initial_stock:
+            raise CommandError("Обнаружена перепродажа: остатки не сходятся с проданным количеством.")
+        if Order.objects.count() != stats['placed']:
+            # Отказ по остатку должен откатывать заказ целиком, без «пустых» заказов
+            raise CommandError("Число заказов в БД не совпадает с числом успешно оформленных.")
+        self.stdout.write(self.style.SUCCESS("Перепродаж нет, отклонённые заказы откатились полностью."))
@@ -0,0 +1,54 @@
+# firm/management/commands/bench_validation.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from firm.forms import ClientCreateForm
+from firm.validation import validate_many
+
+
+def make_records(count, invalid_share, seed):
+    rnd = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {'surname': 'Иванов', 'name': 'Иван', 'email': f'bench{i}@example.com'}
+        if rnd.random() < invalid_share:
+            record[rnd.choice(['surname', 'name', 'email'])] = rnd.choice(['иванов', 'Ivan', 'bad@', ''])
+        records.append(record)
+    return records
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость проверки клиентов через ClientCreateForm и через validation.validate_many."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=10000)
+        parser.add_argument('--invalid-share', type=float, default=0.1, help="Доля заведомо некорректных записей.")
+        parser.add_argument('--repeat', type=int, default=3, help="Сколько прогонов делать (берётся лучший).")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        records = make_records(options['records'], options['invalid_share'], options['seed'])
+
+        def per_form():
+            # Текущий путь: форма на каждую запись, включая запрос exists() на уникальность email
+            return sum(not ClientCreateForm(data=record).is_valid() for record in records)
+
+        def batch():
+            return len(validate_many(records))
+
+        results = {}
+        for name, func in (('ClientCreateForm', per_form), ('validate_many', batch)):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                invalid = func()
+                timings.append(time.perf_counter() - started)
+            results[name] = min(timings)
+            self.stdout.write(f"{name:<18} {min(timings) * 1000:9.1f} мс  "
+                              f"{len(records) / min(timings):12.0f} записей/с  некорректных: {invalid}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"validate_many быстрее в {results['ClientCreateForm'] / results['validate_many']:.1f} раз"
+        ))
@@ -0,0 +1,75 @@
+# firm/management/commands/bulk_set.py
+from django.core.exceptions import FieldError, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.bulk import BULK_TARGETS, chunked_update
+
+
+def parse_filters(expressions):
+    """Разбирает выражения вида поле__lookup=значение (как в filter()); для __in значения через запятую."""
+    filters = {}
+    for expression in expressions or []:
+        key, sep, value = expression.partition('=')
+        if not sep or not key:
+            raise CommandError(f"Фильтр должен иметь вид поле=значение, получено: {expression}")
+        if key.endswith('__in'):
+            value = [item for item in value.split(',') if item]
+        elif key.endswith('__isnull'):
+            value = value.lower() in ('1', 'true', 'yes')
+        filters[key] = value
+    return filters
+
+
+def resolve_value(field, related, raw):
+    """Значение для внешнего ключа: id, имя справочника (или email курьера); none — очистить поле."""
+    model, lookup_field = related
+    if raw.lower() in ('', 'none', 'null'):
+        return None
+    lookup = {'pk': int(raw)} if raw.isdigit() else {lookup_field: raw}
+    try:
+        return model.objects.get(**lookup)
+    except model.DoesNotExist:
+        raise CommandError(f"{field}: не найдено значение «{raw}».")
+    except model.MultipleObjectsReturned:
+        raise CommandError(f"{field}: значению «{raw}» соответствует несколько записей, укажите id.")
+
+
+class Command(BaseCommand):
+    help = ("Массово меняет статус заказов/платежей или курьера заказов одним UPDATE на порцию строк. Например:\n"
+            "  manage.py bulk_set orders --set order_status=Доставлен --filter order_status__name=В пути "
+            "--filter creation_date__lt=2025-01-01")
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(BULK_TARGETS))
+        parser.add_argument('--set', dest='assignments', action='append', required=True,
+                            help="поле=значение: order_status, courier (для orders) или payment_status (для payments).")
+        parser.add_argument('--filter', dest='filters', action='append',
+                            help="Условие отбора в синтаксисе filter(), например client_id__in=1,2,3; можно несколько.")
+        parser.add_argument('--all', action='store_true', help="Разрешить обновление без --filter (вся таблица).")
+        parser.add_argument('--chunk-size', type=int, help="Строк на один UPDATE (по умолчанию FIRM_BULK_CHUNK_SIZE).")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать подходящие строки.")
+
+    def handle(self, *args, **options):
+        target = BULK_TARGETS[options['resource']]
+        if not options['filters'] and not options['all']:
+            raise CommandError("Укажите --filter или явно --all для обновления всей таблицы.")
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError("--chunk-size должен быть положительным.")
+
+        values = {}
+        for assignment in options['assignments']:
+            field, sep, raw = assignment.partition('=')
+            if not sep or field not in target['fields']:
+                raise CommandError(f"Можно менять только: {', '.join(target['fields'])}; получено: {assignment}")
+            values[field] = resolve_value(field, target['fields'][field], raw)
+
+        try:
+            queryset = target['model'].objects.filter(**parse_filters(options['filters']))
+            if options['dry_run']:
+                self.stdout.write(f"Подходит строк: {queryset.count()}")
+                return
+            rows, elapsed = chunked_update(queryset, values, options['chunk_size'])
+        except (FieldError, ValidationError, ValueError) as exc:
+            raise CommandError(f"Некорректный фильтр: {exc}")
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Обновлено строк: {rows} за {elapsed:.2f} с ({rate:.0f} строк/с)"))
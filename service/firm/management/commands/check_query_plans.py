@@ -0,0 +1,122 @@
+# firm/management/commands/check_query_plans.py
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from firm import api
+from firm.cache import home_page_querysets
+from firm.models import Feedback, Order, Payment
+from firm.pagination import encode_cursor, keyset_queryset
+from firm.views import ClientListView
+
+# Любой id подходит: план запроса от значения параметра не зависит
+OWNER_ID = 1
+
+
+def make_user(is_staff):
+    # Пользователь без строки в БД: запросы строятся с его id, но не выполняются от его имени
+    user = get_user_model()(pk=OWNER_ID, is_staff=is_staff, is_superuser=is_staff, is_active=True)
+    user._state.adding = False
+    return user
+
+
+def make_request(user, path='/', **params):
+    request = RequestFactory().get(path, params)
+    request.user = user
+    return request
+
+
+def client_list(user, after=None):
+    """Запрос страницы ClientListView — тот же get_queryset и тот же размер страницы, что у представления."""
+    view = ClientListView()
+    view.setup(make_request(user))
+    return keyset_queryset(view.get_queryset(), view.cursor_field, view.get_paginate_by(None), after=after)
+
+
+def api_page(resource, user, after=None):
+    config = api.RESOURCES[resource]
+    return keyset_queryset(api.page_source(config, user, config['fields']), config['cursor_field'],
+                           getattr(settings, 'FIRM_CLIENT_LIST_PAGE_SIZE', 50), after=after)
+
+
+def admin_changelist(model, user, day):
+    """Страница списка админки за день date_hierarchy: фильтры, сортировка и select_related — из ModelAdmin."""
+    model_admin = admin.site._registry[model]
+    field = model_admin.date_hierarchy
+    request = make_request(user, **{f'{field}__year': day.year, f'{field}__month': day.month,
+                                    f'{field}__day': day.day})
+    changelist = model_admin.get_changelist_instance(request)
+    return changelist.queryset[:changelist.list_per_page]
+
+
+def canonical_queries():
+    """
+    Горячие запросы представлений, API и админки, план которых проверяет команда.
+
+    Запросы строятся теми же функциями, которыми пользуются представления, поэтому изменения
+    в представлениях сразу попадают в проверку.
+    """
+    now = timezone.now()
+    cursor = encode_cursor(now, 1)
+    staff, owner = make_user(is_staff=True), make_user(is_staff=False)
+    home = home_page_querysets()
+    return [
+        ('Список клиентов (staff), первая страница', client_list(staff)),
+        ('Список клиентов (staff), глубокая страница', client_list(staff, after=cursor)),
+        ('Список клиентов владельца, первая страница', client_list(owner)),
+        ('Список клиентов владельца, глубокая страница', client_list(owner, after=cursor)),
+        ('Главная: последние клиенты', home['latest_clients']),
+        ('Главная: последние заказы', home['latest_orders']),
+        ('Главная: последние продукты', home['latest_products']),
+        ('OrderAdmin: заказы за день', admin_changelist(Order, staff, now)),
+        ('API: заказы владельца по дате', api_page('orders', owner)),
+        ('API: заказы владельца, глубокая страница', api_page('orders', owner, after=cursor)),
+        ('PaymentAdmin: платежи за день', admin_changelist(Payment, staff, now)),
+        ('API: платежи владельца по дате', api_page('payments', owner)),
+        ('FeedbackAdmin: отзывы за день', admin_changelist(Feedback, staff, now)),
+    ]
+
+
+def walks_rowid(queryset):
+    # Без WHERE и с сортировкой по pk SQLite идёт по rowid и останавливается на LIMIT,
+    # хотя в плане это выглядит как обычный "SCAN <таблица>"
+    pk_names = {'id', 'pk', queryset.model._meta.pk.attname}
+    return not queryset.query.where and all(field.lstrip('-') in pk_names for field in queryset.query.order_by)
+
+
+def is_full_scan(detail, queryset):
+    # "SCAN firm_client" — полный проход по таблице; "SCAN ... USING [COVERING] INDEX" — проход по индексу
+    if not detail.startswith('SCAN ') or ' USING ' in detail:
+        return False
+    return not (detail.split()[1] == queryset.model._meta.db_table and walks_rowid(queryset))
+
+
+class Command(BaseCommand):
+    help = "Выполняет EXPLAIN QUERY PLAN для горячих запросов и падает, если какой-то из них сканирует таблицу целиком."
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Проверка планов поддерживается только для SQLite.")
+
+        failures = []
+        with connection.cursor() as cursor:
+            for name, queryset in canonical_queries():
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                details = [row[3] for row in cursor.fetchall()]
+                full_scans = [detail for detail in details if is_full_scan(detail, queryset)]
+                if full_scans:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"FAIL  {name}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"OK    {name}"))
+                if full_scans or options['verbosity'] > 1:
+                    for detail in details:
+                        self.stdout.write(f"        {detail}")
+
+        if failures:
+            raise CommandError(f"Полное сканирование таблицы в {len(failures)} запрос(ах): {', '.join(failures)}")
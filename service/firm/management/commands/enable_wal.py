@@ -0,0 +1,35 @@
+# firm/management/commands/enable_wal.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from firm.routers import REPLICA_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = ("Переводит базы SQLite в режим журнала WAL: читатели не блокируют писателя и наоборот. Режим "
+            "записывается в сам файл базы, поэтому это шаг развёртывания, а не настройка соединения: файлы, "
+            "для которых команду не запускали (например, db.sqlite3 из репозитория), остаются как есть.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help="Псевдоним базы, можно повторять (по умолчанию основная база и шарды).")
+        parser.add_argument('--off', action='store_true',
+                            help="Вернуть обычный журнал (DELETE), например перед тем как закоммитить файл базы.")
+
+    def handle(self, *args, **options):
+        # Реплику целиком перезаписывает replicate_db, её журнал задают явно через --database
+        aliases = options['databases'] or [alias for alias in settings.DATABASES if alias != REPLICA_DB_ALIAS]
+        unknown = set(aliases) - set(settings.DATABASES)
+        if unknown:
+            raise CommandError(f"Неизвестные базы: {', '.join(sorted(unknown))}")
+        mode = 'DELETE' if options['off'] else 'WAL'
+        for alias in aliases:
+            connection = connections[alias]
+            if connection.vendor != 'sqlite':
+                self.stdout.write(f"{alias}: не SQLite, пропущено")
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode = {mode}')
+                current = cursor.fetchone()[0]
+            self.stdout.write(self.style.SUCCESS(f"{alias}: journal_mode = {current}"))
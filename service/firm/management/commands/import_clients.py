@@ -0,0 +1,178 @@
+# firm/management/commands/import_clients.py
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, router, transaction
+
+from firm import search
+from firm.cache import invalidate_home_page
+from firm.models import Client
+from firm.validation import validate_record
+
+REJECT_FIELDS = ['line', 'surname', 'name', 'email', 'errors']
+DUPLICATE_EMAIL = "Клиент с таким email уже существует."
+
+
+def read_csv(path, encoding, delimiter):
+    with open(path, newline='', encoding=encoding) as f:
+        # Строка 1 — заголовок, данные начинаются со второй
+        for line, row in enumerate(csv.DictReader(f, delimiter=delimiter), start=2):
+            yield line, row
+
+
+def read_ndjson(path, encoding):
+    with open(path, encoding=encoding) as f:
+        for line, text in enumerate(f, start=1):
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+
+
+def validate_row(row):
+    """Проверяет строку по тем же правилам, что name_validator и ClientCreateForm."""
+    if row is None:
+        return {}, ["Строка не является JSON-объектом."]
+    data = {field: str(row.get(field) or '').strip() for field in ('surname', 'name', 'email')}
+    errors = validate_record(data)
+    return data, [message for messages in errors.values() for message in messages]
+
+
+class Command(BaseCommand):
+    help = ("Потоково импортирует клиентов из CSV или NDJSON (поля surname, name, email): "
+            "валидация, пакетная проверка email и bulk_create порциями.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу CSV или NDJSON.")
+        parser.add_argument('--created-by', required=True, help="Имя пользователя, от имени которого создаются клиенты.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Формат файла (по умолчанию определяется по расширению).")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Сколько строк проверять и вставлять за одну транзакцию.")
+        parser.add_argument('--rejects', help="Куда записать отклонённые строки (по умолчанию <файл>.rejected.csv).")
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument('--delimiter', default=',')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size должен быть положительным.")
+
+        User = get_user_model()
+        try:
+            created_by = User.objects.get(username=options['created_by'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['created_by']} не найден.")
+        # Клиенты пишутся в шард владельца: bulk_create сам базу по created_by не выбирает
+        self.using = router.db_for_write(Client, instance=created_by)
+
+        fmt = options['format'] or ('ndjson' if path.suffix.lower() in ('.ndjson', '.jsonl') else 'csv')
+        if fmt == 'csv':
+            rows = read_csv(path, options['encoding'], options['delimiter'])
+        else:
+            rows = read_ndjson(path, options['encoding'])
+
+        rejects_path = Path(options['rejects'] or f'{path}.rejected.csv')
+        self.created = self.rejected = self.processed = 0
+        started = time.monotonic()
+
+        with open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+            self.rejects = csv.DictWriter(rejects_file, fieldnames=REJECT_FIELDS)
+            self.rejects.writeheader()
+
+            # В памяти держится не больше одной порции строк, независимо от размера файла
+            chunk = []
+            for line, row in rows:
+                self.processed += 1
+                data, errors = validate_row(row)
+                if errors:
+                    self.reject(line, data, errors)
+                    continue
+                chunk.append((line, data))
+                if len(chunk) >= options['chunk_size']:
+                    self.flush(chunk, created_by)
+                    chunk = []
+            if chunk:
+                self.flush(chunk, created_by)
+
+        # bulk_create не шлёт post_save, поэтому кеш главной страницы сбрасываем сами
+        if self.created:
+            invalidate_home_page()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано строк: {self.processed}, создано клиентов: {self.created}, "
+            f"отклонено: {self.rejected} за {elapsed:.1f} с."
+        ))
+        if self.rejected:
+            self.stdout.write(f"Отклонённые строки записаны в {rejects_path}")
+
+    def reject(self, line, data, errors):
+        self.rejected += 1
+        self.rejects.writerow({'line': line, **data, 'errors': ' '.join(errors)})
+
+    def flush(self, chunk, created_by):
+        """
+        Отсеивает дубликаты одним запросом IN и вставляет порцию через bulk_create в транзакции.
+
+        Email, добавленный параллельно (например, через форму) между проверкой и вставкой, откатывает
+        только эту порцию: она повторяется построчно, и конфликтные строки уходят в отклонённые,
+        а уже записанные порции и остаток файла импортируются как обычно.
+        """
+        try:
+            with transaction.atomic(using=self.using):
+                new_clients, duplicates = self.insert_chunk(chunk, created_by)
+        except IntegrityError:
+            with transaction.atomic(using=self.using):
+                new_clients, duplicates = self.insert_rows(chunk, created_by)
+        # Отклонённые пишутся после коммита: откат порции не должен оставлять в файле лишних строк
+        for line, data in duplicates:
+            self.reject(line, data, [DUPLICATE_EMAIL])
+        self.created += len(new_clients)
+
+    def existing_emails(self, emails):
+        return set(Client.objects.using(self.using).filter(email__in=emails).values_list('email', flat=True))
+
+    def insert_chunk(self, chunk, created_by):
+        existing = self.existing_emails({data['email'] for _, data in chunk})
+        new_clients, duplicates = [], []
+        for line, data in chunk:
+            if data['email'] in existing:
+                duplicates.append((line, data))
+                continue
+            # Дубликаты внутри одной порции отсекаются здесь, из предыдущих — запросом выше
+            existing.add(data['email'])
+            new_clients.append(Client(created_by=created_by, **data))
+        Client.objects.using(self.using).bulk_create(new_clients)
+        self.index(new_clients)
+        return new_clients, duplicates
+
+    def insert_rows(self, chunk, created_by):
+        new_clients, duplicates = [], []
+        for line, data in chunk:
+            client = Client(created_by=created_by, **data)
+            try:
+                with transaction.atomic(using=self.using):
+                    Client.objects.using(self.using).bulk_create([client])
+            except IntegrityError:
+                duplicates.append((line, data))
+                continue
+            new_clients.append(client)
+        self.index(new_clients)
+        return new_clients, duplicates
+
+    @staticmethod
+    def index(clients):
+        # bulk_create не шлёт post_save, поэтому в полнотекстовый индекс порция добавляется здесь же
+        if clients and search.is_supported(clients[0]._state.db):
+            search.index_ids(Client, [client.pk for client in clients], using=clients[0]._state.db)
@@ -0,0 +1,44 @@
+# firm/management/commands/loadtest.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.loadtest import run_http
+
+
+class Command(BaseCommand):
+    help = ("HTTP-нагрузка на уже запущенные серверы для сравнения WSGI и ASGI. Например:\n"
+            "  gunicorn service.wsgi -w 4 -b :8001  и  uvicorn service.asgi:application --workers 4 --port 8002\n"
+            "  manage.py loadtest --target wsgi=http://127.0.0.1:8001 --target asgi=http://127.0.0.1:8002 "
+            "--path / --path /firm/async/ --concurrency 200")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help="имя=базовый URL сервера; можно указать несколько раз.")
+        parser.add_argument('--path', action='append', help="Путь для нагрузки (можно несколько), по умолчанию /.")
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--duration', type=float, default=10.0, help="Секунд на каждую пару сервер/путь.")
+        parser.add_argument('--sessionid', help="Cookie sessionid для страниц, требующих входа.")
+        parser.add_argument('--json', action='store_true', help="Вывести результаты в JSON.")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, base_url = target.partition('=')
+            if not sep or not base_url:
+                raise CommandError(f"--target должен иметь вид имя=URL, получено: {target}")
+            targets.append((name, base_url.rstrip('/')))
+        headers = {'Cookie': f"sessionid={options['sessionid']}"} if options['sessionid'] else {}
+
+        results = []
+        for path in options['path'] or ['/']:
+            for name, base_url in targets:
+                stats = run_http(base_url + path, options['concurrency'], options['duration'], headers)
+                results.append({'target': name, 'path': path, 'concurrency': options['concurrency'], **stats})
+                if not options['json']:
+                    self.stdout.write(
+                        f"{name:<8} {path:<28} {stats['throughput']:>9.1f} зап/с  p50 {stats['p50_ms']:>8.1f} мс  "
+                        f"p95 {stats['p95_ms']:>8.1f} мс  p99 {stats['p99_ms']:>8.1f} мс  ошибок {stats['errors']}"
+                    )
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
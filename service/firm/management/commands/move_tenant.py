@@ -0,0 +1,40 @@
+# firm/management/commands/move_tenant.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.sharding import TENANT_MODELS, TenantConflict, move_tenant, shard_aliases, shard_for_user
+
+
+class Command(BaseCommand):
+    help = ("Переносит данные пользователя-арендатора (клиенты, заказы, платежи, отзывы и их архив) в другой шард "
+            "без остановки чтения. Запись арендатора блокируется только на догоняющий проход. "
+            "Без --to печатает текущий шард.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--to', dest='target', help="Шард назначения из FIRM_SHARDS.")
+        parser.add_argument('--batch-size', type=int, help="Строк на порцию (по умолчанию FIRM_SHARD_BATCH_SIZE).")
+        parser.add_argument('--grace', type=float, default=2.0,
+                            help="Секунд ожидания после блокировки записи, чтобы завершились начатые запросы.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь {options['username']} не найден.")
+        if not options['target']:
+            self.stdout.write(f"{user.username}: {shard_for_user(user.pk)}")
+            return
+        if options['target'] not in shard_aliases():
+            raise CommandError(f"Шард должен быть одним из: {', '.join(shard_aliases())}")
+
+        try:
+            source, counts = move_tenant(user.pk, options['target'], options['batch_size'], options['grace'],
+                                         log=self.stdout.write)
+        except TenantConflict as exc:
+            raise CommandError(f"{exc}. Перенос не начат или отменён, {user.username} остаётся в прежнем шарде.")
+        if not counts:
+            self.stdout.write(f"{user.username} уже в {source}.")
+            return
+        moved = ', '.join(f"{model._meta.verbose_name_plural.lower()}: {counts[model]}" for model in TENANT_MODELS)
+        self.stdout.write(self.style.SUCCESS(f"{user.username}: {source} → {options['target']} ({moved})"))
@@ -0,0 +1,48 @@
+# firm/management/commands/purge_clients.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.deletion import claim_job, run_job
+from firm.models import ClientPurgeJob
+
+
+class Command(BaseCommand):
+    help = ("Выполняет задания ClientPurgeJob: удаляет клиентов с большой историей порциями сырых DELETE "
+            "снизу вверх (отзывы, платежи, позиции, заказы, затем клиент), записывая прогресс после каждой "
+            "порции. Память воркера не зависит от размера истории; прерванное задание продолжится с места остановки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help="Заказов в одной транзакции (по умолчанию FIRM_PURGE_BATCH_SIZE).")
+        parser.add_argument('--loop', action='store_true',
+                            help="Не выходить, а опрашивать очередь каждые --interval секунд.")
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError("--batch-size должен быть положительным.")
+
+        while True:
+            while True:
+                job = claim_job()
+                # После ошибки проход заканчивается: повтор — на следующем опросе, а не сразу же
+                if job is None or not self.run(job, options['batch_size']):
+                    break
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def run(self, job, batch_size):
+        started = time.perf_counter()
+        done = run_job(job, batch_size)
+        job.refresh_from_db()
+        elapsed = time.perf_counter() - started
+        if done:
+            self.stdout.write(self.style.SUCCESS(
+                f"{job.client_name}: удалено заказов {job.orders_deleted}, строк {job.rows_deleted} за {elapsed:.2f} с."))
+        elif job.status == ClientPurgeJob.STATUS_FAILED:
+            self.stderr.write(f"{job.client_name}: не удалось после {job.attempts} попыток — {job.last_error}")
+        else:
+            self.stderr.write(f"{job.client_name}: ошибка, задание вернётся в очередь — {job.last_error}")
+        return done
@@ -0,0 +1,27 @@
+# firm/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from firm import search
+
+MODELS = {model._meta.model_name: model for model in search.SEARCH_INDEXES}
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовые индексы FTS5 по клиентам, продуктам и отзывам."
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help=f"Какие индексы перестроить: {', '.join(sorted(MODELS))} (по умолчанию все).")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.is_supported(using):
+            raise CommandError("Полнотекстовый поиск поддерживается только для SQLite (FTS5).")
+        unknown = set(options['models']) - set(MODELS)
+        if unknown:
+            raise CommandError(f"Неизвестные индексы: {', '.join(sorted(unknown))}")
+        for name in options['models'] or sorted(MODELS):
+            with transaction.atomic(using=using):
+                count = search.rebuild(MODELS[name], using)
+            self.stdout.write(self.style.SUCCESS(f"{name}: проиндексировано записей {count}"))
@@ -0,0 +1,79 @@
+# firm/management/commands/recompute_order_totals.py
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from firm import sharding
+from firm.models import Order
+from firm.totals import CENTS, computed_totals
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает Order.total_amount и Order.item_count порциями (в каждом шарде) и сообщает о "
+            "расхождениях. С --verify только проверяет, ничего не меняя.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--verify', action='store_true', help="Только найти расхождения, не исправлять.")
+        parser.add_argument('--show', type=int, default=10, help="Сколько расхождений вывести подробно.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size должен быть положительным.")
+
+        self.checked = self.drifted = self.skipped = 0
+        for alias in sharding.shard_aliases():
+            self.recompute(alias, chunk_size, options)
+
+        action = "найдено" if options['verify'] else "исправлено"
+        style = self.style.WARNING if self.drifted else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Проверено заказов: {self.checked}, расхождений {action}: {self.drifted - self.skipped}"))
+        if self.skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Пропущено заказов, изменённых во время пересчёта: {self.skipped}; запустите команду ещё раз."))
+        if self.drifted and options['verify']:
+            raise CommandError("Итоги заказов расходятся с позициями.")
+
+    def recompute(self, using, chunk_size, options):
+        last_pk = 0
+        while True:
+            # Keyset по pk: каждая порция — один запрос по индексу, без OFFSET
+            orders = list(Order.objects.using(using).filter(pk__gt=last_pk).order_by('pk')
+                          .values_list('pk', 'total_amount', 'item_count')[:chunk_size])
+            if not orders:
+                break
+            last_pk = orders[-1][0]
+            expected = computed_totals([pk for pk, _, _ in orders], using)
+
+            fixes = []
+            for pk, total_amount, item_count in orders:
+                total, count = expected[pk]
+                if Decimal(total_amount or 0).quantize(CENTS) == total and item_count == count:
+                    continue
+                self.drifted += 1
+                if self.drifted <= options['show']:
+                    self.stdout.write(f"Заказ #{pk}: сумма {total_amount} -> {total}, позиций {item_count} -> {count}")
+                fixes.append((pk, total_amount, item_count, total, count))
+
+            if fixes and not options['verify']:
+                with transaction.atomic(using=using):
+                    self.skipped += self.apply(fixes, using)
+            self.checked += len(orders)
+
+    @staticmethod
+    def apply(fixes, using):
+        """
+        Записывает итоги условным UPDATE по прочитанным значениям; возвращает число пропущенных заказов.
+
+        Позиция, сохранённая после чтения, сдвигает итоги приращением F(): такой заказ не перезаписывается
+        абсолютными значениями (приращение потерялось бы), а пропускается до следующего запуска.
+        """
+        skipped = 0
+        for pk, old_total, old_count, total, count in fixes:
+            updated = (Order.objects.using(using).filter(pk=pk, total_amount=old_total, item_count=old_count)
+                       .update(total_amount=total, item_count=count))
+            skipped += not updated
+        return skipped
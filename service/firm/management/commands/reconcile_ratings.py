@@ -0,0 +1,23 @@
+# firm/management/commands/reconcile_ratings.py
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.ratings import reconcile
+
+
+class Command(BaseCommand):
+    help = ("Сверяет агрегаты оценок курьеров и продуктов с отзывами всех шардов и перезаписывает их при расхождении. "
+            "С --verify только проверяет.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Только найти расхождения, не исправлять.")
+
+    def handle(self, *args, **options):
+        drift = reconcile(fix=not options['verify'])
+        action = "найдено" if options['verify'] else "исправлено"
+        total = drift['couriers'] + drift['products']
+        style = self.style.WARNING if total else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Расхождений {action}: курьеры — {drift['couriers']}, продукты — {drift['products']}"
+        ))
+        if total and options['verify']:
+            raise CommandError("Агрегаты оценок расходятся с отзывами.")
@@ -0,0 +1,66 @@
+# firm/management/commands/replicate_db.py
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from firm.routers import REPLICA_DB_ALIAS, record_lag
+
+
+def replicate(source, target, timeout):
+    """
+    Копирует основную базу в файл реплики через sqlite3 backup API; возвращает секунды.
+
+    Копия снимается одним шагом (pages=-1) в пределах одной читающей транзакции источника: в режиме WAL
+    она не мешает писателям, а реплика получает согласованный снимок. Читатели реплики во время
+    копирования продолжают видеть предыдущую версию.
+    """
+    started = time.perf_counter()
+    src = sqlite3.connect(source, timeout=timeout)
+    dst = sqlite3.connect(target, timeout=timeout)
+    try:
+        src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ("Обновляет реплику для чтения (DATABASES['replica'], задаётся переменной FIRM_REPLICA_DB) копией "
+            "основной базы SQLite. С --loop повторяет копирование каждые --interval секунд и после каждой копии "
+            "записывает отставание реплики: окно чтения из основной базы после записи растёт вместе с ним.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Копировать непрерывно до прерывания.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Пауза между копиями в режиме --loop, с.")
+
+    def handle(self, *args, **options):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise CommandError("Реплика не настроена: задайте FIRM_REPLICA_DB с путём к файлу реплики.")
+        primary, replica = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[REPLICA_DB_ALIAS]
+        if 'sqlite3' not in primary['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError("replicate_db работает только с SQLite; для других СУБД используйте их репликацию.")
+        source, target = str(primary['NAME']), str(replica['NAME'])
+        if source == target:
+            raise CommandError("Файл реплики совпадает с основной базой.")
+        timeout = primary.get('OPTIONS', {}).get('timeout', 5)
+
+        copies = 0
+        try:
+            while True:
+                elapsed = replicate(source, target, timeout)
+                copies += 1
+                if not options['loop']:
+                    self.stdout.write(self.style.SUCCESS(f"Реплика {target} обновлена за {elapsed:.2f} с."))
+                    return
+                # Запись сразу после начала снимка попадёт лишь в следующую копию: она начнётся
+                # через max(interval, elapsed) и займёт ещё примерно столько же, сколько эта
+                record_lag(max(options['interval'], elapsed) + elapsed)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Копия #{copies}: {elapsed:.2f} с.")
+                time.sleep(max(0.0, options['interval'] - elapsed))
+        except KeyboardInterrupt:
+            self.stdout.write(f"Остановлено, сделано копий: {copies}.")
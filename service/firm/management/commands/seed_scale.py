@@ -0,0 +1,230 @@
+# firm/management/commands/seed_scale.py
+import random
+import time
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from firm import lookups
+from firm.bulk import insert_rows
+from firm.cache import invalidate_home_page
+from firm.models import (
+    Category, Client, Courier, Feedback, Order, OrderItem, OrderStatus, Payment, PaymentStatus, Product,
+)
+
+# Масштаб — число клиентов; остальные таблицы считаются от него (см. RATIOS)
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+RATIOS = {
+    'users': 1 / 1000,      # владельцев данных (created_by); не меньше 10
+    'couriers': 1 / 200,
+    'products': 1 / 20,
+    'orders': 2,            # на клиента
+    'payment_share': 0.8,   # доля заказов с платежом
+    'feedback_share': 0.3,  # доля доставленных заказов с отзывом
+}
+ORDER_STATUSES = ['Новый', 'Принят', 'Собирается', 'В пути', 'Доставлен', 'Отменён']
+PAYMENT_STATUSES = ['Ожидает оплаты', 'Оплачен', 'Возврат']
+CATEGORIES = ['Продукты', 'Напитки', 'Бытовая химия', 'Электроника', 'Одежда', 'Книги', 'Игрушки', 'Спорт']
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов',
+            'Новиков', 'Морозов', 'Волков', 'Алексеев', 'Фёдоров', 'Михайлов', 'Орлов']
+NAMES = ['Иван', 'Пётр', 'Алексей', 'Сергей', 'Андрей', 'Дмитрий', 'Мария', 'Анна', 'Елена', 'Ольга',
+         'Наталья', 'Татьяна', 'Николай', 'Михаил', 'Юлия', 'Светлана']
+COMMENTS = ['Всё отлично', 'Доставили вовремя', 'Курьер опоздал', 'Товар помят', 'Рекомендую',
+            'Упаковка порвана', 'Быстро и вежливо', 'Не тот товар']
+SEED_PASSWORD = 'seed-password'
+
+
+def next_id(model):
+    return (model.objects.aggregate(value=Max('pk'))['value'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = ("Генерирует детерминированный набор данных заданного масштаба (10k/1m/10m клиентов) по всем моделям "
+            "firm: пакетная вставка порциями с заранее назначенными id и датами, затем пересчёт производных таблиц "
+            "(рейтинги, полнотекстовый индекс, дневные агрегаты). Пароль пользователей seed_*: " + SEED_PASSWORD)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+        parser.add_argument('--clients', type=int, help="Точное число клиентов вместо --scale.")
+        parser.add_argument('--seed', type=int, default=42, help="Зерно генератора: один seed — одинаковые данные.")
+        parser.add_argument('--days', type=int, default=365, help="За сколько дней до сегодня распределять даты.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Строк на пакетную вставку и транзакцию.")
+        parser.add_argument('--append', action='store_true', help="Разрешить генерацию в непустую БД.")
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Не пересчитывать рейтинги, поисковый индекс и агрегаты продаж.")
+
+    def handle(self, *args, **options):
+        clients = options['clients'] or SCALES[options['scale']]
+        if clients < 1 or options['chunk_size'] < 1 or options['days'] < 1:
+            raise CommandError("--clients, --chunk-size и --days должны быть положительными.")
+        if Client.objects.exists() and not options['append']:
+            raise CommandError("В БД уже есть клиенты; используйте --append, чтобы дописать данные.")
+
+        self.rnd = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.now = timezone.now().replace(microsecond=0)
+        self.span = timedelta(days=options['days']).total_seconds()
+        started = time.perf_counter()
+
+        counts = {
+            'users': max(10, int(clients * RATIOS['users'])),
+            'couriers': max(5, int(clients * RATIOS['couriers'])),
+            'products': max(50, int(clients * RATIOS['products'])),
+            'clients': clients,
+            'orders': int(clients * RATIOS['orders']),
+        }
+        self.seed_reference()
+        self.seed_users(counts['users'])
+        self.seed_couriers(counts['couriers'])
+        self.seed_products(counts['products'])
+        self.seed_clients(counts['clients'])
+        self.seed_orders(counts['orders'])
+
+        for model, label in ((Client, 'клиентов'), (Courier, 'курьеров'), (Product, 'продуктов'), (Order, 'заказов'),
+                             (OrderItem, 'позиций'), (Payment, 'платежей'), (Feedback, 'отзывов')):
+            self.stdout.write(f"  {label}: {model.objects.count()}")
+        self.stdout.write(f"Данные сгенерированы за {time.perf_counter() - started:.1f} с")
+
+        # Пакетная вставка не шлёт сигналы: производные таблицы и кеши приводим в порядок сами
+        if not options['skip_derived']:
+            call_command('reconcile_ratings', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('rollup_sales', stdout=self.stdout)
+        for name in lookups.LOOKUPS:
+            lookups.invalidate(name)
+        invalidate_home_page()
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.perf_counter() - started:.1f} с"))
+
+    def moment(self, position):
+        """Дата для записи на позиции position (0..1) окна --days: чем больше id, тем новее запись."""
+        offset = self.span * (1 - position) + self.rnd.uniform(0, 3600)
+        return self.now - timedelta(seconds=min(offset, self.span))
+
+    def insert(self, model, rows):
+        """Вставляет строки из генератора (с их id и датами) порциями по chunk_size, каждая в своей транзакции."""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                with transaction.atomic():
+                    insert_rows(model, chunk)
+                chunk = []
+        if chunk:
+            with transaction.atomic():
+                insert_rows(model, chunk)
+
+    def seed_reference(self):
+        for model, field, names in ((OrderStatus, 'name', ORDER_STATUSES), (PaymentStatus, 'name', PAYMENT_STATUSES),
+                                    (Category, 'category_name', CATEGORIES)):
+            existing = set(model.objects.values_list(field, flat=True))
+            model.objects.bulk_create(model(**{field: name}) for name in names if name not in existing)
+        self.order_statuses = dict(OrderStatus.objects.filter(name__in=ORDER_STATUSES).values_list('name', 'pk'))
+        self.payment_statuses = list(PaymentStatus.objects.filter(name__in=PAYMENT_STATUSES)
+                                     .values_list('pk', flat=True))
+
+    def seed_users(self, count):
+        User = get_user_model()
+        password = make_password(SEED_PASSWORD)  # хеш считается один раз, а не на каждого пользователя
+        usernames = ['seed_admin'] + [f'seed_{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create(
+            User(username=username, password=password, email=f'{username}@seed.test', first_name='Иван',
+                 last_name='Иванов', patronymic='Иванович', is_staff=username == 'seed_admin',
+                 is_superuser=username == 'seed_admin')
+            for username in usernames if username not in existing
+        )
+        self.users = array('q', User.objects.filter(username__in=usernames[1:]).order_by('pk')
+                           .values_list('pk', flat=True))
+
+    def seed_couriers(self, count):
+        first = self.first_courier = next_id(Courier)
+        self.couriers = count
+        rnd, users = self.rnd, self.users
+        self.insert(Courier, (
+            Courier(pk=pk, surname=rnd.choice(SURNAMES), name=rnd.choice(NAMES), email=f'courier{pk}@seed.test',
+                    registration_date=self.moment(i / count), created_by_id=users[i % len(users)])
+            for i, pk in enumerate(range(first, first + count))
+        ))
+
+    def seed_products(self, count):
+        first = self.first_product = next_id(Product)
+        rnd = self.rnd
+        # Цены в копейках держим в array: позиции заказов берут цену продукта без запросов к БД
+        self.prices = array('q', (rnd.randint(50, 500_000) for _ in range(count)))
+        self.insert(Product, (
+            Product(pk=first + i, product_name=f'Товар {first + i}', price=Decimal(self.prices[i]) / 100,
+                    category=rnd.choice(CATEGORIES), stock=rnd.randint(0, 10_000))
+            for i in range(count)
+        ))
+
+    def seed_clients(self, count):
+        first = self.first_client = next_id(Client)
+        self.clients = count
+        rnd, users = self.rnd, self.users
+        # Владелец клиента вычисляется по id, поэтому заказы того же клиента получают того же created_by
+        self.insert(Client, (
+            Client(pk=pk, surname=rnd.choice(SURNAMES), name=rnd.choice(NAMES), email=f'client{pk}@seed.test',
+                   registration_date=self.moment(i / count), created_by_id=users[pk % len(users)])
+            for i, pk in enumerate(range(first, first + count))
+        ))
+
+    def seed_orders(self, count):
+        rnd, users = self.rnd, self.users
+        first_order, first_item = next_id(Order), next_id(OrderItem)
+        first_payment, first_feedback = next_id(Payment), next_id(Feedback)
+        statuses = list(self.order_statuses.values())
+        delivered = self.order_statuses['Доставлен']
+        item_pk, payment_pk, feedback_pk = first_item, first_payment, first_feedback
+
+        for chunk_start in range(0, count, self.chunk_size):
+            orders, items, payments, feedbacks = [], [], [], []
+            for i in range(chunk_start, min(count, chunk_start + self.chunk_size)):
+                pk = first_order + i
+                client_id = self.first_client + rnd.randrange(self.clients)
+                owner = users[client_id % len(users)]
+                created = self.moment(i / count)
+                status = rnd.choice(statuses)
+                courier_id = self.first_courier + rnd.randrange(self.couriers) if rnd.random() < 0.9 else None
+
+                total, lines, product_ids = 0, rnd.randint(1, 4), set()
+                for _ in range(lines):
+                    index = rnd.randrange(len(self.prices))
+                    product_ids.add(self.first_product + index)
+                    amount = rnd.randint(1, 5)
+                    total += self.prices[index] * amount
+                    items.append(OrderItem(pk=item_pk, order_id=pk, product_id=self.first_product + index,
+                                           amount=amount, price=Decimal(self.prices[index]) / 100))
+                    item_pk += 1
+                # Итоги известны при генерации, поэтому пересчитывать их через сигналы не нужно
+                orders.append(Order(pk=pk, order_status_id=status, client_id=client_id, courier_id=courier_id,
+                                    content=f'Заказ из {lines} позиций', creation_date=created, created_by_id=owner,
+                                    total_amount=Decimal(total) / 100, item_count=lines))
+
+                if rnd.random() < RATIOS['payment_share']:
+                    payments.append(Payment(pk=payment_pk, order_id=pk, client_id=client_id,
+                                            payment_date=created + timedelta(minutes=rnd.randint(1, 120)),
+                                            payment_status_id=rnd.choice(self.payment_statuses),
+                                            amount=Decimal(total) / 100, created_by_id=owner))
+                    payment_pk += 1
+                if status == delivered and rnd.random() < RATIOS['feedback_share']:
+                    feedbacks.append(Feedback(pk=feedback_pk, order_id=pk, client_id=client_id,
+                                              review_date=created + timedelta(days=rnd.randint(1, 7)),
+                                              comment=rnd.choice(COMMENTS), rating=rnd.choices(
+                                                  (1, 2, 3, 4, 5), weights=(5, 5, 15, 35, 40))[0],
+                                              created_by_id=owner, rated_courier_id=courier_id,
+                                              rated_products=sorted(product_ids)))
+                    feedback_pk += 1
+
+            with transaction.atomic():
+                for model, rows in ((Order, orders), (OrderItem, items), (Payment, payments), (Feedback, feedbacks)):
+                    insert_rows(model, rows)
+            if (chunk_start // self.chunk_size) % 20 == 0:
+                self.stdout.write(f"  заказов: {min(count, chunk_start + self.chunk_size)} из {count}")
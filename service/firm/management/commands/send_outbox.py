@@ -0,0 +1,59 @@
+# firm/management/commands/send_outbox.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firm.mail import delivery_connection, drain
+from firm.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = ("Доставляет письма из очереди OutboxEmail порциями через одно переиспользуемое SMTP-соединение, "
+            "с повторными попытками и экспоненциальной паузой; печатает скорость в письмах в секунду.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Сколько писем выбирать из очереди за раз.")
+        parser.add_argument('--loop', action='store_true',
+                            help="Не выходить, а опрашивать очередь каждые --interval секунд.")
+        parser.add_argument('--interval', type=float, default=5.0)
+        # Для проверки на локальном SMTP (например, python -m aiosmtpd -n -l localhost:1025)
+        parser.add_argument('--host', help="Переопределить EMAIL_HOST.")
+        parser.add_argument('--port', type=int, help="Переопределить EMAIL_PORT.")
+        parser.add_argument('--no-tls', action='store_true', help="Без STARTTLS и авторизации (локальный SMTP).")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size должен быть положительным.")
+        overrides = {}
+        if options['host']:
+            overrides['host'] = options['host']
+        if options['port']:
+            overrides['port'] = options['port']
+        if options['no_tls']:
+            overrides.update(use_tls=False, use_ssl=False, username='', password='')
+
+        while True:
+            if OutboxEmail.objects.filter(status=OutboxEmail.STATUS_PENDING).exists():
+                self.deliver(overrides, options['batch_size'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def deliver(self, overrides, batch_size):
+        # Одно соединение на весь проход: SMTP-рукопожатие и авторизация не повторяются на каждое письмо
+        connection = delivery_connection(**overrides)
+        try:
+            connection.open()
+        except Exception as exc:
+            self.stderr.write(f"Почтовый сервер недоступен: {exc}")
+            return
+        try:
+            sent, errors, elapsed = drain(connection, batch_size)
+        finally:
+            connection.close()
+        if sent or errors:
+            rate = sent / elapsed if elapsed else 0
+            self.stdout.write(f"Отправлено: {sent}, ошибок: {errors} за {elapsed:.2f} с ({rate:.0f} писем/с)")
+        failed = OutboxEmail.objects.filter(status=OutboxEmail.STATUS_FAILED).count()
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Писем, не доставленных после всех попыток: {failed}"))
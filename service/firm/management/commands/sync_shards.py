@@ -0,0 +1,45 @@
+# firm/management/commands/sync_shards.py
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from firm.sharding import REFERENCE_MODELS, pin_existing_users, prepare_shard, shard_aliases, sync_reference
+
+
+class Command(BaseCommand):
+    help = ("Готовит шарды из FIRM_SHARDS: применяет миграции, сдвигает счётчики id к диапазону шарда и копирует "
+            "справочники (пользователи, статусы, категории, продукты, курьеры) из основной базы. Сигналы держат "
+            "копии в актуальном виде; команда нужна для нового шарда и как полная сверка.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', help="Только указанные шарды (по умолчанию все).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip-migrate', action='store_true')
+        parser.add_argument('--pin-existing', action='store_true',
+                            help="Закрепить за основной базой всех пользователей без размещения — при включении "
+                                 "шардирования на существующих данных; дальше их можно переносить move_tenant.")
+
+    def handle(self, *args, **options):
+        aliases = [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+        if options['shard']:
+            unknown = set(options['shard']) - set(aliases)
+            if unknown:
+                raise CommandError(f"Неизвестные шарды: {', '.join(sorted(unknown))}")
+            aliases = options['shard']
+        if not aliases:
+            self.stdout.write("Шардирование не настроено: задайте FIRM_SHARD_DBS.")
+            return
+        if options['pin_existing']:
+            pinned = pin_existing_users()
+            self.stdout.write(f"Закреплено за {DEFAULT_DB_ALIAS}: {pinned} пользователей")
+
+        for alias in aliases:
+            started = time.perf_counter()
+            if not options['skip_migrate']:
+                call_command('migrate', database=alias, verbosity=0, interactive=False)
+            prepare_shard(alias)
+            counts = sync_reference(alias, options['batch_size'])
+            copied = ', '.join(f"{model._meta.verbose_name_plural.lower()}: {counts[model]}" for model in REFERENCE_MODELS)
+            self.stdout.write(self.style.SUCCESS(f"{alias}: {copied} за {time.perf_counter() - started:.1f} с"))
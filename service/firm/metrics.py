@@ -0,0 +1,98 @@
+# firm/metrics.py
+import threading
+from bisect import bisect_left
+
+# Границы корзин гистограмм (верхние, включительно), как в клиентских библиотеках Prometheus
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: счётчики по корзинам, сумма и количество наблюдений."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# Гистограммы с меткой view (имя URL): имя метрики -> (справка, корзины)
+HISTOGRAMS = {
+    'firm_request_duration_seconds': ("Время обработки запроса представлением", DURATION_BUCKETS),
+    'firm_request_sql_seconds': ("Суммарное время SQL-запросов за запрос", DURATION_BUCKETS),
+    'firm_request_queries': ("Количество SQL-запросов за запрос", QUERY_BUCKETS),
+}
+COUNTERS = {
+    'firm_request_n_plus_one_total': "Запросы, в которых один и тот же SQL повторялся подозрительно часто (N+1)",
+}
+
+_lock = threading.Lock()
+_histograms = {name: {} for name in HISTOGRAMS}
+_counters = {name: {} for name in COUNTERS}
+
+
+def record(view, duration, sql_time, queries, n_plus_one=False):
+    """Учитывает один обработанный запрос (вызывается из QueryMetricsMiddleware)."""
+    with _lock:
+        for name, value in (('firm_request_duration_seconds', duration),
+                            ('firm_request_sql_seconds', sql_time),
+                            ('firm_request_queries', queries)):
+            series = _histograms[name]
+            histogram = series.get(view)
+            if histogram is None:
+                histogram = series[view] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+        if n_plus_one:
+            counter = _counters['firm_request_n_plus_one_total']
+            counter[view] = counter.get(view, 0) + 1
+
+
+def reset():
+    with _lock:
+        for series in _histograms.values():
+            series.clear()
+        for series in _counters.values():
+            series.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Текстовый формат экспозиции Prometheus (text/plain; version=0.0.4).
+
+    Метрики хранятся в памяти процесса: при нескольких воркерах каждый отдаёт свои,
+    а суммирует их Prometheus (метка instance).
+    """
+    lines = []
+    with _lock:
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for view, histogram in sorted(_histograms[name].items()):
+                view = _label(view)
+                cumulative = 0
+                for bound, count in zip(buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{view}",le="{_number(bound)}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{view="{view}"}} {_number(histogram.sum)}')
+                lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        for name, help_text in COUNTERS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for view, value in sorted(_counters[name].items()):
+                lines.append(f'{name}{{view="{_label(view)}"}} {value}')
+    return '\n'.join(lines) + '\n'
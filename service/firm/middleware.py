@@ -0,0 +1,193 @@
+# firm/middleware.py
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from . import metrics, routers, sharding
+
+logger = logging.getLogger('firm.metrics')
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы, их суммарное время и повторы одинакового SQL."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.repeats = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            # Параметры в SQL не подставлены, поэтому «один и тот же запрос для разных id» совпадает по тексту.
+            # N+1 — это чтения; BEGIN/UPDATE порциями (firm/bulk.py) повторяются намеренно
+            if sql.startswith('SELECT'):
+                self.repeats[sql] = self.repeats.get(sql, 0) + 1
+
+
+class QueryMetricsMiddleware:
+    """
+    Замеряет для каждого запроса время представления, число SQL-запросов и их суммарное время
+    и складывает в гистограммы по имени URL (firm/metrics.py, отдаются на /metrics).
+
+    Если один и тот же SQL выполнился FIRM_N_PLUS_ONE_THRESHOLD раз и больше, запрос считается
+    вероятным N+1: увеличивается счётчик и в лог firm.metrics пишется предупреждение с текстом SQL.
+
+    Как и остальные middleware приложения, работает и в синхронной (WSGI), и в асинхронной (ASGI)
+    цепочке: под ASGI Django не оборачивает её в sync_to_async и не занимает поток на каждый запрос.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'FIRM_N_PLUS_ONE_THRESHOLD', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, started = QueryRecorder(), time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        self.record(request, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # Соединения общие для контекста запроса и потоков sync_to_async, так что обёртка видит и их запросы
+        recorder, started = QueryRecorder(), time.perf_counter()
+        with self.recording(recorder):
+            response = await self.get_response(request)
+        self.record(request, recorder, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record(self, request, recorder, duration):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        sql, repeats = max(recorder.repeats.items(), key=lambda item: item[1], default=(None, 0))
+        n_plus_one = repeats >= self.threshold
+        if n_plus_one:
+            logger.warning("Вероятный N+1 в %s: запрос выполнен %d раз: %s", view, repeats, sql[:300])
+        metrics.record(view, duration, recorder.sql_time, recorder.queries, n_plus_one)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Включает чтение из реплики для запросов GET/HEAD/OPTIONS (firm.routers.ReplicaRouter).
+
+    Изменяющий запрос целиком работает с основной базой и ставит cookie на время, за которое реплика
+    гарантированно догоняет (firm.routers.pin_seconds: не меньше FIRM_REPLICA_PIN_SECONDS и замеренного
+    отставания): пока она жива, чтения этого браузера тоже идут в основную базу, и пользователь сразу
+    видит свои изменения (и свою сессию после входа).
+    """
+    sync_capable = True
+    async_capable = True
+
+    PIN_COOKIE = 'firm_pin_primary'
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Выбор базы живёт в contextvar, поэтому виден и в потоках sync_to_async асинхронной цепочки
+        token = routers.route_reads(self.reads_from_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.reset_reads(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = routers.route_reads(self.reads_from_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.reset_reads(token)
+        return self.pin(request, response)
+
+    def reads_from_replica(self, request):
+        return request.method in self.SAFE_METHODS and self.PIN_COOKIE not in request.COOKIES
+
+    def pin(self, request, response):
+        if request.method not in self.SAFE_METHODS and routers.replica_configured():
+            response.set_cookie(self.PIN_COOKIE, '1', max_age=routers.pin_seconds(), httponly=True, samesite='Lax')
+        return response
+
+
+class TenantMiddleware:
+    """
+    Направляет данные пользователя в его шард (firm/sharding.py) на время запроса.
+
+    Пока move_tenant переносит арендатора, изменяющие запросы получают 503 с Retry-After,
+    чтение продолжается из старого шарда. Без шардирования ничего не делает.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        placement = self.placement(request)
+        if placement is None:
+            return self.get_response(request)
+        alias, locked = placement
+        if locked and request.method not in ReplicaRoutingMiddleware.SAFE_METHODS:
+            return self.moving()
+        with sharding.use_shard(alias):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # request.user загружается из сессии лениво, а размещение читается из кеша или БД — это синхронный код
+        placement = await sync_to_async(self.placement)(request)
+        if placement is None:
+            return await self.get_response(request)
+        alias, locked = placement
+        if locked and request.method not in ReplicaRoutingMiddleware.SAFE_METHODS:
+            return self.moving()
+        with sharding.use_shard(alias):
+            return await self.get_response(request)
+
+    @staticmethod
+    def placement(request):
+        """
+        (шард, идёт ли перенос) для пользователя запроса; None без шардирования или без входа.
+        Изменяющий запрос закрепляет арендатора за шардом, чтение — нет.
+        """
+        if not sharding.is_sharded() or not request.user.is_authenticated:
+            return None
+        return sharding.placement(request.user.pk,
+                                  assign=request.method not in ReplicaRoutingMiddleware.SAFE_METHODS)
+
+    @staticmethod
+    def moving():
+        response = HttpResponse("Данные переносятся, повторите запрос через несколько секунд.",
+                                status=503, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = '5'
+        return response
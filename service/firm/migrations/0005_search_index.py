@@ -0,0 +1,40 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:40
+
+from django.db import migrations
+
+# Таблица FTS5 -> (исходная таблица, поля). Определения продублированы из firm/search.py,
+# чтобы миграция не зависела от дальнейших изменений модуля.
+TABLES = {
+    'firm_client_fts': ('firm_client', ['surname', 'name', 'email']),
+    'firm_product_fts': ('firm_product', ['product_name', 'category']),
+    'firm_feedback_fts': ('firm_feedback', ['comment']),
+}
+FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'"
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (source, fields) in TABLES.items():
+        columns = ', '.join(fields)
+        values = ', '.join(f"REPLACE(REPLACE(COALESCE({field}, ''), 'ё', 'е'), 'Ё', 'Е')" for field in fields)
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5({columns}, {FTS_OPTIONS})")
+        schema_editor.execute(f"INSERT INTO {table} (rowid, {columns}) SELECT id, {values} FROM {source}")
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0004_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
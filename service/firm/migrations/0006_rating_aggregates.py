@@ -0,0 +1,50 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierRating',
+            fields=[
+                ('ratings_count', models.IntegerField(default=0, verbose_name='Количество оценок')),
+                ('ratings_sum', models.IntegerField(default=0, verbose_name='Сумма оценок')),
+                ('average', models.FloatField(blank=True, db_index=True, null=True, verbose_name='Средняя оценка')),
+                ('rating_1', models.IntegerField(default=0, verbose_name='Оценок «1»')),
+                ('rating_2', models.IntegerField(default=0, verbose_name='Оценок «2»')),
+                ('rating_3', models.IntegerField(default=0, verbose_name='Оценок «3»')),
+                ('rating_4', models.IntegerField(default=0, verbose_name='Оценок «4»')),
+                ('rating_5', models.IntegerField(default=0, verbose_name='Оценок «5»')),
+                ('courier', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='firm.courier', verbose_name='Курьер')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг курьера',
+                'verbose_name_plural': 'Рейтинги курьеров',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('ratings_count', models.IntegerField(default=0, verbose_name='Количество оценок')),
+                ('ratings_sum', models.IntegerField(default=0, verbose_name='Сумма оценок')),
+                ('average', models.FloatField(blank=True, db_index=True, null=True, verbose_name='Средняя оценка')),
+                ('rating_1', models.IntegerField(default=0, verbose_name='Оценок «1»')),
+                ('rating_2', models.IntegerField(default=0, verbose_name='Оценок «2»')),
+                ('rating_3', models.IntegerField(default=0, verbose_name='Оценок «3»')),
+                ('rating_4', models.IntegerField(default=0, verbose_name='Оценок «4»')),
+                ('rating_5', models.IntegerField(default=0, verbose_name='Оценок «5»')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='firm.product', verbose_name='Продукт')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг продукта',
+                'verbose_name_plural': 'Рейтинги продуктов',
+            },
+        ),
+    ]
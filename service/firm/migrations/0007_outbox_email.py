@@ -0,0 +1,39 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0006_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.TextField(verbose_name='Тема')),
+                ('body', models.TextField(blank=True, verbose_name='Текст')),
+                ('from_email', models.CharField(max_length=255, verbose_name='Отправитель')),
+                ('to', models.JSONField(default=list, verbose_name='Кому')),
+                ('cc', models.JSONField(blank=True, default=list, verbose_name='Копия')),
+                ('bcc', models.JSONField(blank=True, default=list, verbose_name='Скрытая копия')),
+                ('reply_to', models.JSONField(blank=True, default=list, verbose_name='Ответить')),
+                ('headers', models.JSONField(blank=True, default=dict, verbose_name='Заголовки')),
+                ('alternatives', models.JSONField(blank=True, default=list, verbose_name='Альтернативы')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Не доставлено')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(auto_now_add=True, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлено в очередь')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+            ],
+            options={
+                'verbose_name': 'Исходящее письмо',
+                'verbose_name_plural': 'Исходящие письма',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:38
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0007_outbox_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(blank=True, null=True, verbose_name='Содержание')),
+                ('creation_date', models.DateTimeField(verbose_name='Дата создания')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма заказа')),
+                ('item_count', models.IntegerField(default=0, verbose_name='Количество позиций')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='firm.client', verbose_name='Клиент')),
+                ('courier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='firm.courier', verbose_name='Курьер')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Создатель')),
+                ('order_status', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='firm.orderstatus', verbose_name='Статус заказа')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архив заказов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='firm.archivedorder', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='firm.product', verbose_name='Продукт')),
+            ],
+            options={
+                'verbose_name': 'Архивный элемент заказа',
+                'verbose_name_plural': 'Архив элементов заказа',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedFeedback',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_date', models.DateTimeField(verbose_name='Дата отзыва')),
+                ('comment', models.TextField(blank=True, null=True, verbose_name='Комментарий')),
+                ('rating', models.IntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)], verbose_name='Рейтинг')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_feedbacks', to='firm.client', verbose_name='Клиент')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Создатель')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='firm.archivedorder', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Архивный отзыв',
+                'verbose_name_plural': 'Архив отзывов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_date', models.DateTimeField(verbose_name='Дата платежа')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_payments', to='firm.client', verbose_name='Клиент')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Создатель')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='firm.archivedorder', verbose_name='Заказ')),
+                ('payment_status', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='firm.paymentstatus', verbose_name='Статус платежа')),
+            ],
+            options={
+                'verbose_name': 'Архивный платеж',
+                'verbose_name_plural': 'Архив платежей',
+                'indexes': [models.Index(fields=['payment_date', 'id'], name='archived_payment_date_idx'), models.Index(fields=['created_by', 'payment_date'], name='archived_payment_owner_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['creation_date', 'id'], name='archived_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['created_by', 'creation_date'], name='archived_order_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedfeedback',
+            index=models.Index(fields=['review_date', 'id'], name='archived_feedback_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedfeedback',
+            index=models.Index(fields=['created_by', 'review_date'], name='archived_feedback_owner_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0008_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantPlacement',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('shard', models.CharField(max_length=100, verbose_name='Шард')),
+                ('locked', models.BooleanField(default=False, verbose_name='Идёт перенос')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменено')),
+            ],
+            options={
+                'verbose_name': 'Размещение арендатора',
+                'verbose_name_plural': 'Размещения арендаторов',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0009_tenant_placement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientPurgeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.BigIntegerField(verbose_name='ID клиента')),
+                ('client_name', models.CharField(max_length=255, verbose_name='Клиент')),
+                ('shard', models.CharField(default='default', max_length=100, verbose_name='База')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('orders_total', models.IntegerField(default=0, verbose_name='Заказов к удалению')),
+                ('orders_deleted', models.IntegerField(default=0, verbose_name='Удалено заказов')),
+                ('rows_deleted', models.IntegerField(default=0, verbose_name='Удалено строк')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлено в очередь')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Прогресс обновлён')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Запросил')),
+            ],
+            options={
+                'verbose_name': 'Удаление клиента',
+                'verbose_name_plural': 'Удаления клиентов',
+                'indexes': [models.Index(fields=['status', 'id'], name='purge_due_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='clientpurgejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('shard', 'client_id'), name='purge_active_client_uniq'),
+        ),
+    ]
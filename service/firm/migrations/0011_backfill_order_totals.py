@@ -0,0 +1,52 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:58
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Заказов на один UPDATE: на больших таблицах блокировка записи не держится всю миграцию
+CHUNK_SIZE = 10000
+
+
+def backfill_order_totals(apps, schema_editor):
+    """
+    Заполняет total_amount и item_count заказов, созданных до 0003_order_totals (там они получили 0).
+
+    Итоги считаются коррелированными подзапросами по позициям прямо в UPDATE, порциями по диапазону id,
+    так что строки в Python не читаются. Для уже поддерживаемых заказов значения не меняются.
+    """
+    Order = apps.get_model('firm', 'Order')
+    OrderItem = apps.get_model('firm', 'OrderItem')
+    db = schema_editor.connection.alias
+    items = OrderItem.objects.using(db).filter(order=OuterRef('pk')).order_by().values('order')
+    total_field = DecimalField(max_digits=12, decimal_places=2)
+    line_total = ExpressionWrapper(F('amount') * F('price'), output_field=total_field)
+    total = Subquery(items.annotate(total=Sum(line_total)).values('total'))
+    count = Subquery(items.annotate(count=Count('id')).values('count'))
+
+    orders = Order.objects.using(db).order_by('pk')
+    last_pk = None
+    while True:
+        # Границы порции берутся по индексу первичного ключа, дальше — один UPDATE по диапазону
+        page = orders if last_pk is None else orders.filter(pk__gt=last_pk)
+        ids = list(page.values_list('pk', flat=True)[:CHUNK_SIZE])
+        if not ids:
+            break
+        orders.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(
+            total_amount=Coalesce(total, Value(Decimal('0.00')), output_field=total_field),
+            item_count=Coalesce(count, Value(0)),
+        )
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0010_client_purge_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop, elidable=True),
+    ]
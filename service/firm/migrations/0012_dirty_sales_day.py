@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0011_backfill_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtySalesDay',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='День')),
+                ('marked_at', models.DateTimeField(verbose_name='Отмечен')),
+            ],
+            options={
+                'verbose_name': 'День для пересчёта агрегатов',
+                'verbose_name_plural': 'Дни для пересчёта агрегатов',
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:10
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+# Отзывов на одну порцию: на больших таблицах блокировка записи не держится всю миграцию
+CHUNK_SIZE = 5000
+
+
+def snapshot_targets(apps, schema_editor):
+    """
+    Заполняет rated_courier и rated_products у существующих отзывов (горячих и архивных).
+
+    Снимок берётся с текущих курьера и позиций заказа — тех же, по которым агрегаты оценок считались
+    до этой миграции, поэтому CourierRating и ProductRating после неё не меняются.
+    """
+    db = schema_editor.connection.alias
+    for feedback_name, order_name, item_name in (('Feedback', 'Order', 'OrderItem'),
+                                                 ('ArchivedFeedback', 'ArchivedOrder', 'ArchivedOrderItem')):
+        Feedback = apps.get_model('firm', feedback_name)
+        Order = apps.get_model('firm', order_name)
+        OrderItem = apps.get_model('firm', item_name)
+        courier = Subquery(Order.objects.using(db).filter(pk=OuterRef('order_id')).values('courier_id')[:1])
+        feedbacks = Feedback.objects.using(db).order_by('pk')
+        last_pk = None
+        while True:
+            page = feedbacks if last_pk is None else feedbacks.filter(pk__gt=last_pk)
+            rows = list(page.values_list('pk', 'order_id')[:CHUNK_SIZE])
+            if not rows:
+                break
+            feedbacks.filter(pk__gte=rows[0][0], pk__lte=rows[-1][0]).update(rated_courier_id=courier)
+            products = defaultdict(set)
+            items = (OrderItem.objects.using(db).filter(order_id__in={order_id for _, order_id in rows})
+                     .values_list('order_id', 'product_id').distinct())
+            for order_id, product_id in items:
+                products[order_id].add(product_id)
+            Feedback.objects.using(db).bulk_update(
+                [Feedback(pk=pk, rated_products=sorted(products[order_id])) for pk, order_id in rows],
+                ['rated_products'], batch_size=500,
+            )
+            last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0012_dirty_sales_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedfeedback',
+            name='rated_courier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='firm.courier', verbose_name='Оцениваемый курьер'),
+        ),
+        migrations.AddField(
+            model_name='archivedfeedback',
+            name='rated_products',
+            field=models.JSONField(blank=True, default=list, verbose_name='Оцениваемые продукты'),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='rated_courier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='firm.courier', verbose_name='Оцениваемый курьер'),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='rated_products',
+            field=models.JSONField(blank=True, default=list, verbose_name='Оцениваемые продукты'),
+        ),
+        migrations.RunPython(snapshot_targets, migrations.RunPython.noop, elidable=True),
+    ]
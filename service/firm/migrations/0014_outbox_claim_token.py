@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firm', '0013_feedback_rating_targets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32, verbose_name='Метка захвата'),
+        ),
+    ]
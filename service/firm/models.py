@@ -3,12 +3,30 @@ from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser  # Импорт AbstractUser
 from django.contrib.auth import get_user_model
-from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
+from django.core.validators import MinValueValidator, MaxValueValidator
 
-# Регулярка для проверки, что имена начинаются с прописной буквы и содержат только кириллические буквы
-NAME_REGEX = r'^[А-ЯЁ][а-яё]+$'
-name_validator = RegexValidator(regex=NAME_REGEX,
-                                message="Поле должно начинаться с прописной буквы и содержать только кириллические буквы.")
+# Проверка, что имена начинаются с прописной буквы и содержат только кириллические буквы (общая для форм и моделей)
+from .validation import NAME_REGEX, name_validator
+
+
+class OwnedQuerySet(models.QuerySet):
+    """QuerySet записей с владельцем: проверка прав уходит в WHERE, а не в сравнение объектов в Python."""
+
+    # Путь от записи до пользователя-владельца
+    owner_field = 'created_by'
+
+    def visible_to(self, user):
+        # Админ видит все записи, обычный пользователь — только созданные им; аноним — ничего
+        if not user.is_authenticated:
+            return self.none()
+        if user.is_staff:
+            return self
+        return self.filter(**{self.owner_field: user})
+
+
+class OrderItemQuerySet(OwnedQuerySet):
+    # Своего владельца у позиции нет, она принадлежит создателю заказа
+    owner_field = 'order__created_by'
 
 
 class CustomUser(AbstractUser):
@@ -56,16 +74,24 @@ class PaymentStatus(models.Model):
 class Client(models.Model):
     surname = models.CharField("Фамилия", max_length=255, validators=[name_validator])
     name = models.CharField("Имя", max_length=255, validators=[name_validator])
+    # Уникален в пределах базы; при шардировании — в пределах шарда (см. firm/sharding.py)
     email = models.EmailField("E-mail", unique=True)
     registration_date = models.DateTimeField("Дата регистрации", auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='clients', verbose_name="Создатель") # Используем settings.AUTH_USER_MODEL
 
+    objects = OwnedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.surname} {self.name}"
 
     class Meta:
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
+        # Составные индексы под keyset-пагинацию списка клиентов (ClientListView) и главную страницу
+        indexes = [
+            models.Index(fields=['registration_date', 'id'], name='client_reg_date_idx'),
+            models.Index(fields=['created_by', 'registration_date', 'id'], name='client_owner_reg_date_idx'),
+        ]
 
 
 class Courier(models.Model):
@@ -75,6 +101,8 @@ class Courier(models.Model):
     registration_date = models.DateTimeField("Дата регистрации", auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='couriers', verbose_name="Создатель") # Используем settings.AUTH_USER_MODEL
 
+    objects = OwnedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.surname} {self.name}"
 
@@ -104,13 +132,34 @@ class Order(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name="Клиент")
     courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Курьер")
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders', verbose_name="Создатель") # Используем settings.AUTH_USER_MODEL
+    # Денормализованные итоги по позициям заказа, поддерживаются сигналами OrderItem (firm/signals.py)
+    total_amount = models.DecimalField("Сумма заказа", decimal_places=2, max_digits=12, default=0)
+    item_count = models.IntegerField("Количество позиций", default=0)
+
+    objects = OwnedQuerySet.as_manager()
+
+    # Итоги меняют только UPDATE с F-выражениями (firm/totals.py) и recompute_order_totals
+    DERIVED_FIELDS = ('total_amount', 'item_count')
 
     def __str__(self):
         return f"Заказ #{self.id} клиента {self.client}"
 
+    def save(self, *args, **kwargs):
+        # Сохранение из админки или API пишет все поля, и прочитанные до этого итоги затёрли бы
+        # параллельные сдвиги от позиций; поэтому существующий заказ сохраняется без них
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.DERIVED_FIELDS]
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        # Сортировка по дате на главной и в OrderAdmin (date_hierarchy), в том числе в пределах создателя
+        indexes = [
+            models.Index(fields=['creation_date'], name='order_creation_date_idx'),
+            models.Index(fields=['created_by', 'creation_date'], name='order_owner_creation_date_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -119,6 +168,8 @@ class OrderItem(models.Model):
     amount = models.IntegerField("Количество")
     price = models.DecimalField("Цена", decimal_places=2, max_digits=10)
 
+    objects = OrderItemQuerySet.as_manager()
+
     def __str__(self):
         return f"Элемент заказа #{self.id}"
 
@@ -136,12 +187,18 @@ class Payment(models.Model):
     amount = models.DecimalField("Сумма", decimal_places=2, max_digits=10)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='payments', verbose_name="Создатель") # Используем settings.AUTH_USER_MODEL
 
+    objects = OwnedQuerySet.as_manager()
+
     def __str__(self):
         return f"Платеж #{self.id} от клиента {self.client}"
 
     class Meta:
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
+        indexes = [
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+            models.Index(fields=['created_by', 'payment_date'], name='payment_owner_date_idx'),
+        ]
 
 
 class Feedback(models.Model):
@@ -151,6 +208,13 @@ class Feedback(models.Model):
     comment = models.TextField("Комментарий", blank=True, null=True)
     rating = models.IntegerField("Рейтинг", validators=[MinValueValidator(1), MaxValueValidator(5)])
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feedbacks', verbose_name="Создатель") # Используем settings.AUTH_USER_MODEL
+    # Кого оценивает отзыв: курьер и продукты заказа на момент отзыва (заполняются сигналом при создании).
+    # Рейтинги считаются по этому снимку, поэтому смена курьера или позиций заказа их не сдвигает.
+    rated_courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                      verbose_name="Оцениваемый курьер")
+    rated_products = models.JSONField("Оцениваемые продукты", default=list, blank=True)
+
+    objects = OwnedQuerySet.as_manager()
 
     def __str__(self):
         return f"Отзыв #{self.id} от клиента {self.client}"
@@ -158,6 +222,10 @@ class Feedback(models.Model):
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            models.Index(fields=['review_date'], name='feedback_review_date_idx'),
+            models.Index(fields=['created_by', 'review_date'], name='feedback_owner_date_idx'),
+        ]
 
 
 class Category(models.Model):
@@ -169,3 +237,348 @@ class Category(models.Model):
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
+
+
+# --- Агрегаты продаж по дням (заполняются командой rollup_sales, отчёты читают только их) ---
+
+class DailyProductSales(models.Model):
+    day = models.DateField("День")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Продукт")
+    quantity = models.IntegerField("Продано, шт.", default=0)
+    revenue = models.DecimalField("Выручка", decimal_places=2, max_digits=14, default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.product}"
+
+    class Meta:
+        verbose_name = "Продажи продукта за день"
+        verbose_name_plural = "Продажи продуктов по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='daily_product_sales_unique'),
+        ]
+
+
+class DailyCategorySales(models.Model):
+    day = models.DateField("День")
+    category = models.CharField("Категория", max_length=255, blank=True)
+    quantity = models.IntegerField("Продано, шт.", default=0)
+    revenue = models.DecimalField("Выручка", decimal_places=2, max_digits=14, default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.category or 'Без категории'}"
+
+    class Meta:
+        verbose_name = "Продажи категории за день"
+        verbose_name_plural = "Продажи категорий по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='daily_category_sales_unique'),
+        ]
+
+
+class DailyPaymentTotals(models.Model):
+    day = models.DateField("День")
+    payment_status = models.ForeignKey(PaymentStatus, on_delete=models.CASCADE, null=True, verbose_name="Статус платежа")
+    payments_count = models.IntegerField("Количество платежей", default=0)
+    amount = models.DecimalField("Сумма", decimal_places=2, max_digits=14, default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.payment_status or 'Без статуса'}"
+
+    class Meta:
+        verbose_name = "Платежи за день"
+        verbose_name_plural = "Платежи по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_status'], name='daily_payment_totals_unique'),
+        ]
+
+
+class Watermark(models.Model):
+    """Отметка, до какого момента фоновая обработка уже выполнена (например, rollup_sales)."""
+    name = models.CharField("Название", max_length=100, unique=True)
+    value = models.DateTimeField("Значение")
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    class Meta:
+        verbose_name = "Отметка обработки"
+        verbose_name_plural = "Отметки обработки"
+
+
+class DirtySalesDay(models.Model):
+    """
+    День, агрегаты которого устарели: строки за него изменены в обход обычного прохода rollup_sales
+    (позиции старых заказов, смена статусов платежей, архив, удаление клиентов). rollup_sales
+    пересчитывает отмеченные дни и снимает отметки.
+    """
+    day = models.DateField("День", primary_key=True)
+    marked_at = models.DateTimeField("Отмечен")
+
+    def __str__(self):
+        return str(self.day)
+
+    class Meta:
+        verbose_name = "День для пересчёта агрегатов"
+        verbose_name_plural = "Дни для пересчёта агрегатов"
+
+
+# --- Агрегаты оценок из отзывов (поддерживаются сигналами Feedback, сверяются командой reconcile_ratings) ---
+
+class RatingAggregate(models.Model):
+    ratings_count = models.IntegerField("Количество оценок", default=0)
+    ratings_sum = models.IntegerField("Сумма оценок", default=0)
+    # Хранится, чтобы сортировать по рейтингу по индексу, без GROUP BY по отзывам
+    average = models.FloatField("Средняя оценка", null=True, blank=True, db_index=True)
+    rating_1 = models.IntegerField("Оценок «1»", default=0)
+    rating_2 = models.IntegerField("Оценок «2»", default=0)
+    rating_3 = models.IntegerField("Оценок «3»", default=0)
+    rating_4 = models.IntegerField("Оценок «4»", default=0)
+    rating_5 = models.IntegerField("Оценок «5»", default=0)
+
+    @property
+    def histogram(self):
+        return {value: getattr(self, f'rating_{value}') for value in range(1, 6)}
+
+    class Meta:
+        abstract = True
+
+
+class CourierRating(RatingAggregate):
+    courier = models.OneToOneField(Courier, on_delete=models.CASCADE, primary_key=True, related_name='rating',
+                                   verbose_name="Курьер")
+
+    def __str__(self):
+        return f"Рейтинг курьера {self.courier_id}"
+
+    class Meta:
+        verbose_name = "Рейтинг курьера"
+        verbose_name_plural = "Рейтинги курьеров"
+
+
+class ProductRating(RatingAggregate):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='rating',
+                                   verbose_name="Продукт")
+
+    def __str__(self):
+        return f"Рейтинг продукта {self.product_id}"
+
+    class Meta:
+        verbose_name = "Рейтинг продукта"
+        verbose_name_plural = "Рейтинги продуктов"
+
+
+# --- Очередь исходящих писем (EMAIL_BACKEND = firm.mail.OutboxBackend, доставляет команда send_outbox) ---
+
+class OutboxEmail(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Не доставлено'),
+    )
+
+    subject = models.TextField("Тема")
+    body = models.TextField("Текст", blank=True)
+    from_email = models.CharField("Отправитель", max_length=255)
+    to = models.JSONField("Кому", default=list)
+    cc = models.JSONField("Копия", default=list, blank=True)
+    bcc = models.JSONField("Скрытая копия", default=list, blank=True)
+    reply_to = models.JSONField("Ответить", default=list, blank=True)
+    headers = models.JSONField("Заголовки", default=dict, blank=True)
+    # Альтернативные части письма (например, HTML): список пар [содержимое, mimetype]
+    alternatives = models.JSONField("Альтернативы", default=list, blank=True)
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField("Попыток", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", auto_now_add=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField("Поставлено в очередь", auto_now_add=True)
+    sent_at = models.DateTimeField("Отправлено", null=True, blank=True)
+    # Метка порции, захваченной воркером send_outbox (см. firm.mail.claim_batch)
+    claim_token = models.CharField("Метка захвата", max_length=32, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)}"
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        # Воркер выбирает готовые к отправке письма по (status, next_attempt_at)
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_due_idx'),
+        ]
+
+
+# --- Архив закрытых заказов (переносит команда archive_before, читает firm/archive.py) ---
+# Колонки совпадают с горячими таблицами, id сохраняются, поэтому перенос — INSERT ... SELECT без преобразований.
+# Ссылки внутри архива ведут на архивный заказ, справочники и клиенты остаются общими.
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField("ID", primary_key=True)
+    order_status = models.ForeignKey(OrderStatus, on_delete=models.SET_NULL, null=True, related_name='+',
+                                     verbose_name="Статус заказа")
+    content = models.TextField("Содержание", blank=True, null=True)
+    creation_date = models.DateTimeField("Дата создания")
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='archived_orders', verbose_name="Клиент")
+    courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                verbose_name="Курьер")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                                   verbose_name="Создатель")
+    total_amount = models.DecimalField("Сумма заказа", decimal_places=2, max_digits=12, default=0)
+    item_count = models.IntegerField("Количество позиций", default=0)
+
+    objects = OwnedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Архивный заказ #{self.id}"
+
+    class Meta:
+        verbose_name = "Архивный заказ"
+        verbose_name_plural = "Архив заказов"
+        indexes = [
+            models.Index(fields=['creation_date', 'id'], name='archived_order_date_idx'),
+            models.Index(fields=['created_by', 'creation_date'], name='archived_order_owner_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField("ID", primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, verbose_name="Заказ")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Продукт")
+    amount = models.IntegerField("Количество")
+    price = models.DecimalField("Цена", decimal_places=2, max_digits=10)
+
+    objects = OrderItemQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Архивный элемент заказа #{self.id}"
+
+    class Meta:
+        verbose_name = "Архивный элемент заказа"
+        verbose_name_plural = "Архив элементов заказа"
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField("ID", primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, verbose_name="Заказ")
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='archived_payments',
+                               verbose_name="Клиент")
+    payment_date = models.DateTimeField("Дата платежа")
+    payment_status = models.ForeignKey(PaymentStatus, on_delete=models.SET_NULL, null=True, related_name='+',
+                                       verbose_name="Статус платежа")
+    amount = models.DecimalField("Сумма", decimal_places=2, max_digits=10)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                                   verbose_name="Создатель")
+
+    objects = OwnedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Архивный платеж #{self.id}"
+
+    class Meta:
+        verbose_name = "Архивный платеж"
+        verbose_name_plural = "Архив платежей"
+        indexes = [
+            models.Index(fields=['payment_date', 'id'], name='archived_payment_date_idx'),
+            models.Index(fields=['created_by', 'payment_date'], name='archived_payment_owner_idx'),
+        ]
+
+
+class ArchivedFeedback(models.Model):
+    id = models.BigIntegerField("ID", primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, verbose_name="Заказ")
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='archived_feedbacks',
+                               verbose_name="Клиент")
+    review_date = models.DateTimeField("Дата отзыва")
+    comment = models.TextField("Комментарий", blank=True, null=True)
+    rating = models.IntegerField("Рейтинг", validators=[MinValueValidator(1), MaxValueValidator(5)])
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                                   verbose_name="Создатель")
+    rated_courier = models.ForeignKey(Courier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                      verbose_name="Оцениваемый курьер")
+    rated_products = models.JSONField("Оцениваемые продукты", default=list, blank=True)
+
+    objects = OwnedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Архивный отзыв #{self.id}"
+
+    class Meta:
+        verbose_name = "Архивный отзыв"
+        verbose_name_plural = "Архив отзывов"
+        indexes = [
+            models.Index(fields=['review_date', 'id'], name='archived_feedback_date_idx'),
+            models.Index(fields=['created_by', 'review_date'], name='archived_feedback_owner_idx'),
+        ]
+
+
+# --- Размещение арендаторов по шардам (firm/sharding.py) ---
+
+class TenantPlacement(models.Model):
+    """
+    Шард пользователя-арендатора. Запись создаётся при первой записи данных арендатора (шард выбирает
+    консистентное хеширование) и меняется только move_tenant. Хранится только в основной базе.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='+', verbose_name="Пользователь")
+    shard = models.CharField("Шард", max_length=100)
+    # Пока идёт перенос, изменяющие запросы арендатора отклоняются, чтение продолжается
+    locked = models.BooleanField("Идёт перенос", default=False)
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} → {self.shard}"
+
+    class Meta:
+        verbose_name = "Размещение арендатора"
+        verbose_name_plural = "Размещения арендаторов"
+
+
+# --- Очередь удаления клиентов с большой историей (firm/deletion.py, разбирает команда purge_clients) ---
+
+class ClientPurgeJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Ожидает'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    # Не внешний ключ: клиент удаляется в конце задания, а сама запись остаётся как журнал
+    client_id = models.BigIntegerField("ID клиента")
+    client_name = models.CharField("Клиент", max_length=255)
+    # База, в которой лежит клиент (при шардировании — его шард); задания хранятся в основной базе
+    shard = models.CharField("База", max_length=100, default='default')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='+', verbose_name="Запросил")
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    orders_total = models.IntegerField("Заказов к удалению", default=0)
+    orders_deleted = models.IntegerField("Удалено заказов", default=0)
+    rows_deleted = models.IntegerField("Удалено строк", default=0)
+    attempts = models.IntegerField("Попыток", default=0)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField("Поставлено в очередь", auto_now_add=True)
+    # Обновляется после каждой порции: по нему воркер находит задания, брошенные упавшим процессом
+    updated_at = models.DateTimeField("Прогресс обновлён", auto_now=True)
+    finished_at = models.DateTimeField("Завершено", null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.client_name} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Удаление клиента"
+        verbose_name_plural = "Удаления клиентов"
+        indexes = [
+            models.Index(fields=['status', 'id'], name='purge_due_idx'),
+        ]
+        # Одно активное задание на клиента: повторное нажатие «Удалить» не ставит второе
+        constraints = [
+            models.UniqueConstraint(fields=['shard', 'client_id'], condition=models.Q(status__in=['pending', 'running']),
+                                    name='purge_active_client_uniq'),
+        ]
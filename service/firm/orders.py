@@ -0,0 +1,164 @@
+# firm/orders.py
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import router, transaction
+from django.db.models import F
+
+from .cache import invalidate_home_page
+from .models import Order, OrderItem, Product
+from .totals import line_total
+
+
+class InsufficientStock(Exception):
+    """На складе не хватает товара: заказ целиком откатывается."""
+
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"Недостаточно товара #{product_id} на складе (запрошено {requested}).")
+
+
+def release(quantities, using):
+    """Возвращает на склад списанное количество {product_id: n} (компенсация несостоявшегося заказа)."""
+    with transaction.atomic(using=using):
+        for product_id in sorted(quantities):
+            Product.objects.using(using).filter(pk=product_id).update(stock=F('stock') + quantities[product_id])
+    invalidate_home_page()
+
+
+@contextmanager
+def reservation(quantities, using):
+    """
+    Списывает со склада quantities {product_id: n} и открывает транзакцию для записи заказа в базе using.
+
+    Каждый товар списывается одним условным UPDATE ... SET stock = stock - n WHERE stock >= n, так что
+    параллельные заказы не уводят остаток в минус; отрицательное n возвращает товар на склад. Товары
+    блокируются в порядке возрастания id, чтобы два заказа с одинаковыми товарами не ждали друг друга
+    по кругу. При нехватке бросается InsufficientStock; ошибка в теле блока откатывает и списание.
+    Вместо словаря можно передать функцию без аргументов: она вызывается уже внутри открытых транзакций,
+    так что количества, вычисленные по текущим строкам заказа, не устаревают до списания.
+
+    При шардировании товары живут в основной базе, а заказ — в шарде арендатора. Одного атомарного
+    коммита на две базы нет, поэтому порядок выбран так, чтобы сбой не приводил к перепродаже:
+    транзакция списания вложена в транзакцию заказа и фиксируется первой. Если затем не удастся
+    зафиксировать заказ, списание возвращается (release); если процесс упадёт между двумя коммитами,
+    товар останется зарезервированным без заказа — недопродажа, которую видно по остаткам, а не минус.
+    """
+    products_db = router.db_for_write(Product)
+    reserved = []
+    try:
+        with ExitStack() as stack:
+            if using != products_db:
+                stack.enter_context(transaction.atomic(using=using))
+            stack.enter_context(transaction.atomic(using=products_db))
+            if callable(quantities):
+                quantities = quantities()
+            for product_id in sorted(quantities):
+                amount = quantities[product_id]
+                products = Product.objects.using(products_db).filter(pk=product_id)
+                if amount < 0:
+                    products.update(stock=F('stock') - amount)
+                elif not products.filter(stock__gte=amount).update(stock=F('stock') - amount):
+                    raise InsufficientStock(product_id, amount)
+            # Остатки выводятся на главной, а update() не шлёт сигналы: кеш сбрасывается после коммита списания
+            transaction.on_commit(invalidate_home_page, using=products_db)
+            if using != products_db:
+                transaction.on_commit(lambda: reserved.append(True), using=products_db)
+            yield
+    except Exception:
+        if reserved:
+            # Списание уже зафиксировано, а заказ — нет
+            release(quantities, products_db)
+        raise
+
+
+def place_order(client, items, created_by, order_status=None, courier=None, content=None):
+    """
+    Оформляет заказ и резервирует товар на складе (см. reservation).
+
+    items — пары (product_id, количество). При нехватке любого товара бросается InsufficientStock
+    и откатываются все списания, заказ и позиции.
+    """
+    quantities = defaultdict(int)
+    for product_id, amount in items:
+        if amount <= 0:
+            raise ValueError("Количество товара должно быть положительным.")
+        quantities[product_id] += amount
+    if not quantities:
+        raise ValueError("Заказ должен содержать хотя бы одну позицию.")
+
+    orders_db = router.db_for_write(Order, instance=Order(created_by=created_by))
+    with reservation(quantities, orders_db):
+        prices = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'price'))
+        lines = [(product_id, quantities[product_id], prices[product_id]) for product_id in sorted(quantities)]
+        # Итоги считаются сразу: bulk_create позиций не шлёт сигналы, которые обычно их поддерживают
+        order = Order.objects.using(orders_db).create(
+            client=client,
+            created_by=created_by,
+            order_status=order_status,
+            courier=courier,
+            content=content,
+            total_amount=sum(line_total(amount, price) for _, amount, price in lines),
+            item_count=len(lines),
+        )
+        OrderItem.objects.using(orders_db).bulk_create(
+            OrderItem(order=order, product_id=product_id, amount=amount, price=price)
+            for product_id, amount, price in lines
+        )
+    return order
+
+
+def save_item(item):
+    """
+    Сохраняет позицию заказа с резервом товара: новая позиция списывает amount со склада,
+    изменённая — разницу с прежними товаром и количеством (уменьшение возвращает товар).
+    """
+    if item.amount <= 0:
+        raise ValueError("Количество товара должно быть положительным.")
+    using = router.db_for_write(OrderItem, instance=item)
+
+    def quantities():
+        # Прежняя строка читается в транзакции резерва и под блокировкой: параллельное изменение той же
+        # позиции ждёт коммита, а не списывает разницу от уже устаревшего количества
+        result = defaultdict(int)
+        result[item.product_id] += item.amount
+        if item.pk is not None:
+            old = (OrderItem.objects.using(using).select_for_update().filter(pk=item.pk)
+                   .values_list('product_id', 'amount').first())
+            if old is not None:
+                result[old[0]] -= old[1]
+        return {product_id: n for product_id, n in result.items() if n}
+
+    with reservation(quantities, using):
+        item.save(using=using)
+    return item
+
+
+def delete_item(item):
+    """Удаляет позицию заказа и в той же транзакции возвращает её количество на склад."""
+    using = router.db_for_write(OrderItem, instance=item)
+
+    def quantities():
+        # Количество берётся из текущей строки под блокировкой, а не из загруженного ранее экземпляра
+        old = (OrderItem.objects.using(using).select_for_update().filter(pk=item.pk)
+               .values_list('product_id', 'amount').first())
+        return {} if old is None else {old[0]: -old[1]}
+
+    with reservation(quantities, using):
+        item.delete(using=using)
+
+
+def delete_order(order):
+    """Удаляет заказ вместе с позициями и в той же транзакции возвращает их количество на склад."""
+    using = router.db_for_write(Order, instance=order)
+
+    def quantities():
+        result = defaultdict(int)
+        items = OrderItem.objects.using(using).select_for_update().filter(order_id=order.pk)
+        for product_id, amount in items.values_list('product_id', 'amount'):
+            result[product_id] -= amount
+        return {product_id: n for product_id, n in result.items() if n}
+
+    with reservation(quantities, using):
+        order.delete(using=using)
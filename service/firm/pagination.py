@@ -0,0 +1,155 @@
+# firm/pagination.py
+import base64
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось разобрать (подделан или устарел формат)."""
+
+
+class KeysetPage:
+    """Страница keyset-пагинации: строки и курсоры соседних страниц."""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(value, pk):
+    """Кодирует ключ (значение поля сортировки, pk) в строку для URL."""
+    raw = f"{value.isoformat() if hasattr(value, 'isoformat') else value}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(model, field, cursor):
+    """Разбирает курсор обратно в (значение поля, pk) с приведением типов полей модели."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        value, pk = raw.rsplit('|', 1)
+        opts = model._meta
+        return opts.get_field(field).to_python(value), opts.pk.to_python(pk)
+    except Exception as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def keyset_queryset(queryset, field, page_size, after=None, before=None):
+    """
+    Строит запрос одной страницы по ключу (field, pk) в порядке убывания.
+
+    after — курсор, после которого идёт следующая страница, before — курсор,
+    перед которым идёт предыдущая. Берётся на одну строку больше page_size,
+    чтобы понять, есть ли страница дальше, без COUNT(*).
+    """
+    model = queryset.model
+    if before:
+        value, pk = decode_cursor(model, field, before)
+        queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+        queryset = queryset.order_by(field, 'pk')
+    else:
+        if after:
+            value, pk = decode_cursor(model, field, after)
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+        queryset = queryset.order_by(f'-{field}', '-pk')
+    return queryset[:page_size + 1]
+
+
+def build_page(rows, field, page_size, after=None, before=None):
+    """
+    Собирает KeysetPage из строк, полученных по запросу keyset_queryset.
+
+    Строки могут быть экземплярами моделей или словарями из .values().
+    """
+    rows = list(rows)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+
+    def key(row):
+        if isinstance(row, dict):
+            return encode_cursor(row[field], row['pk'] if 'pk' in row else row['id'])
+        return encode_cursor(getattr(row, field), row.pk)
+
+    if not rows:
+        return KeysetPage(rows)
+    # Идя назад, лишняя строка означает, что есть ещё более новые записи;
+    # идя вперёд — что есть более старые.
+    has_next = (has_more and not before) or bool(before)
+    has_prev = (has_more and bool(before)) or bool(after)
+    return KeysetPage(
+        rows,
+        next_cursor=key(rows[-1]) if has_next else None,
+        prev_cursor=key(rows[0]) if has_prev else None,
+    )
+
+
+def keyset_paginate(queryset, field, page_size, after=None, before=None):
+    """Выполняет запрос одной страницы и возвращает KeysetPage."""
+    rows = keyset_queryset(queryset, field, page_size, after=after, before=before)
+    return build_page(rows, field, page_size, after=after, before=before)
+
+
+def estimated_table_rows(model, using):
+    """
+    Оценка числа строк таблицы без COUNT(*): статистика планировщика, а если её нет — MAX(pk).
+
+    SQLite хранит число строк в sqlite_stat1 (заполняется ANALYZE), PostgreSQL — в pg_class.reltuples.
+    MAX(pk) берётся по индексу первичного ключа и завышает оценку только на число удалённых строк.
+    """
+    table = model._meta.db_table
+    connection = connections[using]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+                rows = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat]
+                if rows:
+                    return max(rows)
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+                row = cursor.fetchone()
+                if row and row[0] > 0:
+                    return row[0]
+    except DatabaseError:
+        pass  # нет таблицы статистики (ANALYZE не запускался)
+    return model._default_manager.using(using).aggregate(value=Max('pk'))['value'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших списков админки: не делает COUNT(*) по всей таблице.
+
+    Без фильтров берётся оценка estimated_table_rows (для маленьких таблиц — точный COUNT),
+    с фильтрами — COUNT по подзапросу с LIMIT FIRM_ADMIN_COUNT_LIMIT + 1: показанный итог
+    не растёт с размером таблицы. Граница ограничивает только итог, а не листание: для
+    запрошенной страницы page счёт продлевается до неё, и лишняя строка открывает следующую.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, page=1):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.requested_page = page
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = max(getattr(settings, 'FIRM_ADMIN_COUNT_LIMIT', 10000), self.requested_page * self.per_page)
+        if not queryset.query.where:
+            estimate = estimated_table_rows(queryset.model, queryset.db)
+            if estimate > limit:
+                return estimate
+        return queryset[:limit + 1].count()
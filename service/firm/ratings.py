@@ -0,0 +1,183 @@
+# firm/ratings.py
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast, NullIf
+
+from . import sharding
+from .models import ArchivedFeedback, CourierRating, Feedback, Order, OrderItem, ProductRating
+
+RATING_VALUES = range(1, 6)
+
+
+def targets(order_id, using=None):
+    """Курьер и продукты заказа, к которым относится отзыв: (courier_id или None, [product_id, ...])."""
+    courier_id = Order.objects.using(using).filter(pk=order_id).values_list('courier_id', flat=True).first()
+    product_ids = sorted(OrderItem.objects.using(using).filter(order_id=order_id)
+                         .values_list('product_id', flat=True).distinct())
+    return courier_id, product_ids
+
+
+def snapshot(feedback, using=None):
+    """Запоминает в отзыве, кого он оценивает: текущих курьера и продукты его заказа."""
+    feedback.rated_courier_id, feedback.rated_products = targets(feedback.order_id, using)
+
+
+def apply(model, ids, changes):
+    """
+    Сдвигает агрегаты одним UPDATE с F-выражениями.
+
+    changes — {оценка: +1/-1}. Недостающие строки агрегатов создаются заранее
+    (bulk_create с ignore_conflicts), так что обновление всегда находит строку.
+    """
+    ids = [pk for pk in ids if pk is not None]
+    changes = {rating: delta for rating, delta in changes.items() if delta}
+    if not ids or not changes:
+        return
+    # Снимок отзыва может ссылаться на уже удалённый продукт: для него агрегата больше нет
+    target = model._meta.pk.remote_field.model
+    ids = list(target.objects.filter(pk__in=ids).values_list('pk', flat=True))
+    key = model._meta.pk.attname
+    model.objects.bulk_create([model(**{key: pk}) for pk in ids], ignore_conflicts=True)
+
+    count_delta = sum(changes.values())
+    sum_delta = sum(rating * delta for rating, delta in changes.items())
+    updates = {
+        'ratings_count': F('ratings_count') + count_delta,
+        'ratings_sum': F('ratings_sum') + sum_delta,
+        # В UPDATE правая часть видит старые значения столбцов, поэтому среднее считается по новым сумме и количеству
+        'average': Cast(F('ratings_sum') + sum_delta, FloatField()) / NullIf(F('ratings_count') + count_delta, 0),
+    }
+    for rating, delta in changes.items():
+        updates[f'rating_{rating}'] = F(f'rating_{rating}') + delta
+    model.objects.filter(pk__in=ids).update(**updates)
+
+
+def apply_feedback(targets, changes):
+    """Сдвигает агрегаты курьера и продуктов из снимка отзыва: targets — (courier_id, [product_id, ...])."""
+    courier_id, product_ids = targets
+    apply(CourierRating, [courier_id], changes)
+    apply(ProductRating, product_ids, changes)
+
+
+def feedback_saved(feedback, old):
+    """
+    Учитывает новый или изменённый отзыв; old — {'rated_courier_id', 'rated_products', 'rating'}
+    до сохранения или None для нового отзыва.
+    """
+    new_targets = (feedback.rated_courier_id, feedback.rated_products)
+    if old is not None:
+        old_targets = (old['rated_courier_id'], old['rated_products'])
+        if old_targets == new_targets:
+            # Изменилась только оценка: одна пара UPDATE вместо вычитания и прибавления
+            if old['rating'] != int(feedback.rating):
+                apply_feedback(new_targets, {old['rating']: -1, int(feedback.rating): 1})
+            return
+        apply_feedback(old_targets, {old['rating']: -1})
+    apply_feedback(new_targets, {int(feedback.rating): 1})
+
+
+def feedback_deleted(feedback):
+    # Цели берутся из снимка в самом отзыве: при каскадном удалении заказа его позиции могут быть уже удалены
+    apply_feedback((feedback.rated_courier_id, feedback.rated_products), {int(feedback.rating): -1})
+
+
+FEEDBACK_MODELS = (Feedback, ArchivedFeedback)
+
+
+def collect(feedback, couriers, products, ids=None, using=None):
+    """
+    Добавляет в гистограммы couriers и products ({pk: {оценка: n}}) отзывы модели feedback по их снимкам целей.
+
+    ids ограничивает подсчёт конкретными отзывами, using — база, из которой они читаются.
+    """
+    rows = feedback.objects.using(using).all() if ids is None else feedback.objects.using(using).filter(pk__in=ids)
+    histograms = (rows.filter(rated_courier__isnull=False)
+                  .values('rated_courier_id', 'rating').annotate(n=Count('id')).order_by())
+    for row in histograms:
+        couriers[row['rated_courier_id']][row['rating']] += row['n']
+
+    # Продукты снимка хранятся списком в JSON: отзывы читаются потоком, по два поля на строку
+    for product_ids, rating in rows.values_list('rated_products', 'rating').iterator(chunk_size=2000):
+        for product_id in product_ids:
+            products[product_id][rating] += 1
+
+
+def expected_aggregates():
+    """
+    Пересчитывает агрегаты по всем отзывам: ({courier_id: {оценка: n}}, {product_id: {оценка: n}}).
+
+    Отзывы, перенесённые в архив (firm/archive.py), продолжают учитываться: рейтинг — за всё время.
+    Отзывы лежат в шардах арендаторов, а агрегаты общие, поэтому читается каждый шард.
+    """
+    couriers = defaultdict(lambda: defaultdict(int))
+    products = defaultdict(lambda: defaultdict(int))
+    for alias in sharding.shard_aliases():
+        for feedback in FEEDBACK_MODELS:
+            collect(feedback, couriers, products, using=alias)
+    return couriers, products
+
+
+def feedbacks_removed(feedback, ids, using=None):
+    """
+    Вычитает из агрегатов отзывы ids перед их удалением сырым DELETE (firm/deletion.py).
+
+    Курьеры и продукты с одинаковым сдвигом гистограммы обновляются одним UPDATE, так что число
+    запросов зависит от числа разных целей в порции, а не от числа отзывов.
+    """
+    couriers = defaultdict(lambda: defaultdict(int))
+    products = defaultdict(lambda: defaultdict(int))
+    collect(feedback, couriers, products, ids=ids, using=using)
+    for model, histograms in ((CourierRating, couriers), (ProductRating, products)):
+        groups = defaultdict(list)
+        for pk, histogram in histograms.items():
+            groups[tuple(sorted(histogram.items()))].append(pk)
+        for histogram, pks in groups.items():
+            apply(model, pks, {rating: -n for rating, n in histogram})
+
+
+def build_row(model, pk, histogram):
+    count = sum(histogram.values())
+    total = sum(rating * n for rating, n in histogram.items())
+    row = model(pk=pk, ratings_count=count, ratings_sum=total, average=total / count if count else None)
+    for rating in RATING_VALUES:
+        setattr(row, f'rating_{rating}', histogram.get(rating, 0))
+    return row
+
+
+def summary(histogram):
+    # Сравнимое представление агрегата: (количество, сумма, гистограмма без нулей)
+    histogram = {rating: n for rating, n in histogram.items() if n}
+    return sum(histogram.values()), sum(rating * n for rating, n in histogram.items()), histogram
+
+
+def current_summaries(model):
+    fields = [f'rating_{rating}' for rating in RATING_VALUES]
+    summaries = {}
+    for pk, count, total, *histogram in model.objects.values_list('pk', 'ratings_count', 'ratings_sum', *fields):
+        summaries[pk] = (count, total, {rating: n for rating, n in zip(RATING_VALUES, histogram) if n})
+    return summaries
+
+
+def reconcile(fix=True):
+    """
+    Сверяет агрегаты с отзывами. Возвращает {'couriers': расхождений, 'products': расхождений};
+    при fix=True таблицы агрегатов перезаписываются пересчитанными значениями.
+    """
+    couriers, products = expected_aggregates()
+    drift = {}
+    with transaction.atomic():
+        for name, model, expected in (('couriers', CourierRating, couriers), ('products', ProductRating, products)):
+            # Снимки старых отзывов могут ссылаться на удалённых курьеров и продукты
+            existing = set(model._meta.pk.remote_field.model.objects.values_list('pk', flat=True))
+            expected = {pk: histogram for pk, histogram in expected.items() if pk in existing}
+            current = current_summaries(model)
+            keys = set(current) | set(expected)
+            empty = (0, 0, {})
+            drift[name] = sum(current.get(pk, empty) != summary(expected.get(pk, {})) for pk in keys)
+            if fix and drift[name]:
+                model.objects.all().delete()
+                model.objects.bulk_create(build_row(model, pk, histogram) for pk, histogram in expected.items())
+    return drift
+
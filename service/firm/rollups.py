@@ -0,0 +1,170 @@
+# firm/rollups.py
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from . import archive
+from .models import (ArchivedOrder, ArchivedOrderItem, ArchivedPayment, DailyCategorySales, DailyPaymentTotals,
+                     DailyProductSales, DirtySalesDay, Order, OrderItem, Payment, Watermark)
+from .totals import LINE_TOTAL
+
+WATERMARK_NAME = 'rollup_sales'
+
+# Поле, задающее день агрегата для строк модели: позиции считаются по дате заказа, платежи — по своей
+DAY_FIELDS = {
+    Order: 'creation_date',
+    OrderItem: 'order__creation_date',
+    Payment: 'payment_date',
+    ArchivedOrder: 'creation_date',
+    ArchivedOrderItem: 'order__creation_date',
+    ArchivedPayment: 'payment_date',
+}
+
+# Модели, значения строк которых входят в агрегаты: их массовое изменение делает дни устаревшими
+ROLLED_UP_MODELS = (OrderItem, Payment, ArchivedOrderItem, ArchivedPayment)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def sum_rows(querysets, keys, fields):
+    """Складывает сгруппированные строки нескольких запросов (горячая таблица и архив) с одинаковым ключом."""
+    totals = {}
+    for queryset in querysets:
+        for row in queryset.order_by():
+            key = tuple(row[name] for name in keys)
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = dict(zip(keys, key), **{name: 0 for name in fields})
+            for name in fields:
+                total[name] += row[name] or 0
+    return totals.values()
+
+
+def rollup_range(first_day, last_day):
+    """
+    Пересчитывает агрегаты за дни [first_day, last_day] в одной транзакции.
+
+    Старые строки за эти дни удаляются и вставляются заново, поэтому повторный запуск
+    по тому же периоду даёт тот же результат. Если период заходит в архив (firm/archive.py),
+    те же группировки выполняются и по архивным таблицам, и результаты складываются — так же, как
+    результаты всех шардов: агрегаты общие, а заказы и платежи лежат в шардах арендаторов.
+    """
+    from . import sharding  # firm.sharding импортирует firm.bulk, а тот — этот модуль
+    start, end = day_start(first_day), day_start(last_day + timedelta(days=1))
+    aliases = sharding.shard_aliases()
+    item_querysets = [model.objects.using(alias).filter(order__creation_date__gte=start, order__creation_date__lt=end)
+                      for alias in aliases for model in archive.with_archive(OrderItem, start)]
+    payment_querysets = [model.objects.using(alias).filter(payment_date__gte=start, payment_date__lt=end)
+                         for alias in aliases for model in archive.with_archive(Payment, start)]
+
+    with transaction.atomic():
+        product_rows = sum_rows(
+            (items.annotate(day=TruncDate('order__creation_date'))
+             .values('day', 'product_id')
+             .annotate(quantity=Sum('amount'), revenue=Sum(LINE_TOTAL)) for items in item_querysets),
+            ('day', 'product_id'), ('quantity', 'revenue'),
+        )
+        category_rows = sum_rows(
+            (items.annotate(day=TruncDate('order__creation_date'), category=Coalesce('product__category', Value('')))
+             .values('day', 'category')
+             .annotate(quantity=Sum('amount'), revenue=Sum(LINE_TOTAL)) for items in item_querysets),
+            ('day', 'category'), ('quantity', 'revenue'),
+        )
+        payment_rows = sum_rows(
+            (payments.annotate(day=TruncDate('payment_date'))
+             .values('day', 'payment_status_id')
+             .annotate(payments_count=Count('id'), total=Sum('amount')) for payments in payment_querysets),
+            ('day', 'payment_status_id'), ('payments_count', 'total'),
+        )
+        for model in (DailyProductSales, DailyCategorySales, DailyPaymentTotals):
+            model.objects.filter(day__gte=first_day, day__lte=last_day).delete()
+        DailyProductSales.objects.bulk_create(
+            DailyProductSales(day=row['day'], product_id=row['product_id'],
+                              quantity=row['quantity'], revenue=row['revenue'])
+            for row in product_rows
+        )
+        DailyCategorySales.objects.bulk_create(
+            DailyCategorySales(day=row['day'], category=row['category'],
+                               quantity=row['quantity'], revenue=row['revenue'])
+            for row in category_rows
+        )
+        DailyPaymentTotals.objects.bulk_create(
+            DailyPaymentTotals(day=row['day'], payment_status_id=row['payment_status_id'],
+                               payments_count=row['payments_count'], amount=row['total'])
+            for row in payment_rows
+        )
+
+
+def mark_dirty(days):
+    """
+    Отмечает дни для пересчёта следующим запуском rollup_sales.
+
+    Сегодняшний и будущие дни не отмечаются: обычный проход от отметки их и так пересчитывает.
+    Повторная отметка обновляет marked_at, чтобы идущий запуск не снял её раньше времени.
+    """
+    today = timezone.localdate()
+    days = {day for day in days if day is not None and day < today}
+    if not days:
+        return
+    now = timezone.now()
+    DirtySalesDay.objects.bulk_create([DirtySalesDay(day=day, marked_at=now) for day in days],
+                                      update_conflicts=True, unique_fields=['day'], update_fields=['marked_at'])
+
+
+def mark_dirty_rows(queryset):
+    """Отмечает дни строк queryset — перед их изменением или удалением в обход сигналов (update(), сырой DELETE)."""
+    field = DAY_FIELDS[queryset.model]
+    mark_dirty(queryset.order_by().annotate(day=TruncDate(field)).values_list('day', flat=True).distinct())
+
+
+def dirty_days():
+    return list(DirtySalesDay.objects.order_by('day').values_list('day', flat=True))
+
+
+def clear_dirty(before):
+    """Снимает отметки, поставленные до начала запуска; поставленные во время него дождутся следующего."""
+    DirtySalesDay.objects.filter(marked_at__lte=before).delete()
+
+
+def day_ranges(days):
+    """Разбивает отсортированные дни на непрерывные отрезки [(первый, последний), ...]."""
+    ranges = []
+    for day in days:
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def get_watermark():
+    return Watermark.objects.filter(name=WATERMARK_NAME).values_list('value', flat=True).first()
+
+
+def set_watermark(value):
+    Watermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': value})
+
+
+def sales_report(first_day, last_day):
+    """Сводка за период, собранная только из таблиц агрегатов (без обращения к заказам и платежам)."""
+    period = {'day__gte': first_day, 'day__lte': last_day}
+    categories = DailyCategorySales.objects.filter(**period)
+    return {
+        'by_day': list(categories.values('day').annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+                       .order_by('day')),
+        'by_category': list(categories.values('category').annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+                            .order_by('-revenue')),
+        'top_products': list(DailyProductSales.objects.filter(**period)
+                             .values('product_id', 'product__product_name')
+                             .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+                             .order_by('-revenue')[:20]),
+        'payments': list(DailyPaymentTotals.objects.filter(**period)
+                         .values('payment_status_id')
+                         .annotate(payments_count=Sum('payments_count'), amount=Sum('amount'))
+                         .order_by('-amount')),
+    }
@@ -0,0 +1,71 @@
+# firm/routers.py
+import math
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Наибольшее отставание реплики по замеру replicate_db --loop; кеш общий для всех процессов
+REPLICA_LAG_CACHE_KEY = 'firm:replica_lag'
+
+# Откуда читать в текущем запросе. Значение ставит ReplicaRoutingMiddleware; вне запросов
+# (команды, воркеры) оно пустое и всё идёт в основную базу — там читают то, что только что записали.
+_read_alias = ContextVar('firm_read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def route_reads(to_replica):
+    """Направляет чтения текущего контекста в реплику или в основную базу; возвращает токен для reset_reads."""
+    return _read_alias.set(REPLICA_DB_ALIAS if to_replica and replica_configured() else DEFAULT_DB_ALIAS)
+
+
+def reset_reads(token):
+    _read_alias.reset(token)
+
+
+def record_lag(seconds):
+    cache.set(REPLICA_LAG_CACHE_KEY, seconds, None)
+
+
+def pin_seconds():
+    """
+    Сколько секунд после записи читать из основной базы: FIRM_REPLICA_PIN_SECONDS, но не меньше
+    отставания реплики по последнему замеру replicate_db — если копия замедлится, окно растёт вместе с ней.
+    """
+    lag = cache.get(REPLICA_LAG_CACHE_KEY) or 0
+    return max(getattr(settings, 'FIRM_REPLICA_PIN_SECONDS', 5), math.ceil(lag))
+
+
+class ReplicaRouter:
+    """
+    Чтение в запросах без изменений — из реплики, запись и всё остальное — в основную базу.
+
+    Внутри транзакции основной базы чтение тоже идёт в неё: иначе код, который пишет и тут же
+    перечитывает (get_or_create, select_for_update), увидел бы устаревшую реплику.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_alias.get() != REPLICA_DB_ALIAS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы, объекты из обеих можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит вместе с данными из replicate_db
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,96 @@
+# firm/scheduling.py
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import sharding
+from .cache import invalidate_home_page
+from .models import Courier, Order
+
+
+def open_orders():
+    """Заказы, которые ещё не закрыты (статус не входит в FIRM_CLOSED_ORDER_STATUSES)."""
+    closed = getattr(settings, 'FIRM_CLOSED_ORDER_STATUSES', ())
+    return Order.objects.exclude(order_status__name__in=closed)
+
+
+def plan_assignments(order_ids, loads, capacity=None):
+    """
+    Распределяет заказы по курьерам: каждый следующий заказ получает наименее загруженный курьер.
+
+    loads — {courier_id: текущее число открытых заказов}. Куча (загрузка, id курьера) даёт
+    O(log m) на заказ; при равной загрузке выбирается курьер с меньшим id, поэтому план
+    детерминирован. Возвращает список пар (order_id, courier_id); если задан capacity,
+    заказы сверх лимита остаются неназначенными.
+    """
+    heap = [(load, courier_id) for courier_id, load in loads.items()]
+    heapq.heapify(heap)
+    plan = []
+    for order_id in order_ids:
+        if not heap:
+            break
+        load, courier_id = heap[0]
+        if capacity is not None and load >= capacity:
+            break
+        plan.append((order_id, courier_id))
+        heapq.heapreplace(heap, (load + 1, courier_id))
+    return plan
+
+
+def assign_couriers(capacity=None, batch_size=500):
+    """
+    Назначает курьеров всем открытым заказам без курьера за один проход.
+
+    Читаются только id: заказы без курьера (старые первыми) и загрузка курьеров одним GROUP BY.
+    Результат пишется в одной транзакции одним UPDATE ... WHERE id IN (...) на курьера:
+    bulk_update строит CASE WHEN на каждую строку и на 10k заказов тратит секунды только
+    на сборку выражений в Python. UPDATE затрагивает только заказы, у которых курьера всё ещё нет:
+    назначение, сделанное параллельно между чтением и записью, не перезаписывается.
+
+    Возвращает пару (назначено, пропущено): пропущенные — заказы из плана, которые к моменту
+    записи уже получили курьера.
+
+    Курьеры общие для всех арендаторов, поэтому при шардировании загрузка складывается по всем шардам,
+    а заказы шардов сливаются в один поток по (дата, id); каждый шард пишется своей транзакцией.
+    """
+    loads = dict.fromkeys(Courier.objects.values_list('pk', flat=True), 0)
+    if not loads:
+        return 0, 0
+    aliases = sharding.shard_aliases()
+    for alias in aliases:
+        busy = (open_orders().using(alias).filter(courier__isnull=False)
+                .values('courier_id').annotate(load=Count('id')).values_list('courier_id', 'load'))
+        for courier_id, load in busy.order_by():
+            loads[courier_id] += load
+
+    pending = heapq.merge(*(pending_orders(alias) for alias in aliases))
+    plan = plan_assignments(((alias, pk) for _, pk, alias in pending), loads, capacity)
+
+    by_shard = defaultdict(lambda: defaultdict(list))
+    for (alias, order_id), courier_id in plan:
+        by_shard[alias][courier_id].append(order_id)
+
+    assigned = 0
+    for alias, by_courier in by_shard.items():
+        with transaction.atomic(using=alias):
+            shard_assigned = 0
+            for courier_id, ids in by_courier.items():
+                for start in range(0, len(ids), batch_size):
+                    shard_assigned += (Order.objects.using(alias)
+                                       .filter(pk__in=ids[start:start + batch_size], courier__isnull=True)
+                                       .update(courier_id=courier_id))
+            if shard_assigned:
+                # update() не шлёт сигналы, поэтому заказы на главной сбрасываются здесь, после коммита
+                transaction.on_commit(invalidate_home_page, using=alias)
+        assigned += shard_assigned
+    return assigned, len(plan) - assigned
+
+
+def pending_orders(alias):
+    """Открытые заказы без курьера в шарде alias: (дата, id, шард), старые первыми."""
+    rows = (open_orders().using(alias).filter(courier__isnull=True)
+            .order_by('creation_date', 'pk').values_list('creation_date', 'pk'))
+    return ((created, pk, alias) for created, pk in rows.iterator())
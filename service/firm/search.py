@@ -0,0 +1,145 @@
+# firm/search.py
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Client, Feedback, Product
+
+# Модель -> (виртуальная FTS5-таблица, индексируемые поля). rowid в FTS-таблице равен pk записи.
+SEARCH_INDEXES = {
+    Client: ('firm_client_fts', ['surname', 'name', 'email']),
+    Product: ('firm_product_fts', ['product_name', 'category']),
+    Feedback: ('firm_feedback_fts', ['comment']),
+}
+
+# Сами таблицы создаёт миграция 0005_search_index: unicode61 приводит кириллицу к нижнему
+# регистру и убирает диакритику (ё -> е), префиксные индексы ускоряют запросы вида "слово*".
+
+# Частые окончания русских слов: отбрасываются перед префиксным поиском, чтобы
+# «заказами» находило «заказ» и «заказа». Это не полноценный стеммер, а дешёвое приближение.
+ENDINGS = sorted(
+    ['ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ов', 'ев', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя',
+     'ое', 'ее', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'а', 'я', 'у', 'ю', 'ы', 'и', 'е', 'о', 'ь'],
+    key=len, reverse=True,
+)
+CYRILLIC = re.compile(r'^[а-яё]+$')
+WORD = re.compile(r'\w+')
+
+
+def is_supported(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def normalize(text):
+    # unicode61 не считает «ё» буквой с диакритикой, поэтому приводим её к «е» и в индексе, и в запросе
+    return (text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def stem(word):
+    word = normalize(word.lower())
+    if len(word) > 4 and CYRILLIC.match(word):
+        for ending in ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 3:
+                return word[:-len(ending)]
+    return word
+
+
+def build_match(query):
+    """Превращает пользовательский запрос в выражение MATCH: все слова обязательны, каждое — как префикс."""
+    words = [stem(word) for word in WORD.findall(query)]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+
+def _insert_select(model):
+    # INSERT ... SELECT из основной таблицы с той же нормализацией «ё», что и normalize()
+    table, fields = SEARCH_INDEXES[model]
+    values = ', '.join(f"REPLACE(REPLACE(COALESCE({field}, ''), 'ё', 'е'), 'Ё', 'Е')" for field in fields)
+    return f"INSERT INTO {table} (rowid, {', '.join(fields)}) SELECT id, {values} FROM {model._meta.db_table}"
+
+
+def rebuild(model, using='default'):
+    """Перестраивает индекс модели одним INSERT ... SELECT, без выборки строк в Python."""
+    table, _ = SEARCH_INDEXES[model]
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(_insert_select(model))
+        cursor.execute(f"SELECT count(*) FROM {table}")
+        return cursor.fetchone()[0]
+
+
+def index_ids(model, ids, using='default'):
+    """Индексирует строки ids одним INSERT ... SELECT — для записей, созданных без post_save (bulk_create)."""
+    table, _ = SEARCH_INDEXES[model]
+    ids = list(ids)
+    if not ids:
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid IN ({placeholders})", ids)
+        cursor.execute(f"{_insert_select(model)} WHERE id IN ({placeholders})", ids)
+
+
+def index_instance(instance, using='default'):
+    table, fields = SEARCH_INDEXES[type(instance)]
+    placeholders = ', '.join(['%s'] * (len(fields) + 1))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [instance.pk])
+        cursor.execute(
+            f"INSERT INTO {table} (rowid, {', '.join(fields)}) VALUES ({placeholders})",
+            [instance.pk] + [normalize(getattr(instance, field)) for field in fields],
+        )
+
+
+def remove_ids(model, ids, using='default'):
+    table, _ = SEARCH_INDEXES[model]
+    ids = list(ids)
+    if not ids:
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids)
+
+
+def matching(model, query):
+    """
+    Подзапрос pk записей, найденных индексом, — для условий вида pk__in=matching(...).
+
+    Без LIMIT и без порядка: годится для объединения с другими условиями (например, через OR).
+    В запросе должно быть хотя бы одно слово (build_match не пуст).
+    """
+    table, _ = SEARCH_INDEXES[model]
+    return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [build_match(query)])
+
+
+def ranked(queryset, query):
+    """
+    Оставляет в queryset записи, найденные индексом, и упорядочивает их по релевантности (bm25).
+
+    FTS-таблица присоединяется к основной по rowid = pk в том же запросе, поэтому фильтры queryset
+    (например, по владельцу) применяются до среза: LIMIT не отбрасывает видимые пользователю записи
+    в пользу чужих. Ранг доступен как поле search_rank.
+    """
+    match = build_match(query)
+    if not match:
+        return queryset.none()
+    table, _ = SEARCH_INDEXES[queryset.model]
+    opts = queryset.model._meta
+    return queryset.extra(
+        select={'search_rank': f'{table}.rank'},
+        tables=[table],
+        where=[f'{table}.rowid = {opts.db_table}.{opts.pk.column}', f'{table} MATCH %s'],
+        params=[match],
+    ).order_by('search_rank')
+
+
+def search(queryset, query, limit=20):
+    """Ищет по индексу и возвращает объекты из queryset (с учётом его фильтров) в порядке релевантности."""
+    if not is_supported(queryset.db):
+        # Без FTS5 — обычный поиск подстроки по тем же полям
+        _, fields = SEARCH_INDEXES[queryset.model]
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        return list(queryset.filter(condition)[:limit])
+    return list(ranked(queryset, query)[:limit])
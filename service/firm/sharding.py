@@ -0,0 +1,474 @@
+# firm/sharding.py
+import bisect
+import hashlib
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import search
+from .bulk import delete_ids, insert_rows
+from .models import (ArchivedFeedback, ArchivedOrder, ArchivedOrderItem, ArchivedPayment, Category, Client, Courier,
+                     CustomUser, Feedback, Order, OrderItem, OrderStatus, Payment, PaymentStatus, Product,
+                     TenantPlacement)
+from .pagination import build_page, keyset_queryset
+
+# Данные арендатора (пользователя-создателя) -> путь до владельца. Такие строки лежат в шарде владельца;
+# порядок — порядок копирования: сначала строки, на которые ссылаются остальные.
+TENANT_MODELS = {
+    Client: 'created_by',
+    Order: 'created_by',
+    OrderItem: 'order__created_by',
+    Payment: 'created_by',
+    Feedback: 'created_by',
+    ArchivedOrder: 'created_by',
+    ArchivedOrderItem: 'order__created_by',
+    ArchivedPayment: 'created_by',
+    ArchivedFeedback: 'created_by',
+}
+
+# Уникальность Client.email держит индекс своей базы, то есть при шардировании — только в пределах шарда:
+# клиенты арендаторов из разных шардов могут совпасть по email. Общей проверки нет (она потребовала бы таблицы
+# email в основной базе и записи в две базы на каждого клиента); move_tenant ищет такие совпадения до переноса
+# (email_conflicts), потому что в одном шарде они уже нарушили бы индекс.
+
+# Справочники: пишутся в основную базу и копируются во все шарды, потому что на них ссылаются
+# внешние ключи строк арендатора. Курьеры — общий ресурс: заказ любого арендатора может достаться
+# любому курьеру, поэтому они тоже справочник, а не данные арендатора.
+REFERENCE_MODELS = (CustomUser, OrderStatus, PaymentStatus, Category, Product, Courier)
+
+# id строк арендатора в шарде с номером i начинаются с i * ID_BLOCK: id уникальны во всех шардах,
+# поэтому результаты разных шардов можно сливать по (дата, id), а перенос арендатора сохраняет id.
+ID_BLOCK = 10 ** 12
+
+PLACEMENT_CACHE_KEY = 'firm:shard:v2:{}'
+
+# Шард, с которым работает текущий запрос или команда (ставит TenantMiddleware или use_shard)
+_current_shard = ContextVar('firm_current_shard', default=None)
+
+
+def shard_aliases():
+    return list(getattr(settings, 'FIRM_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Консистентное хеширование: каждый шард занимает replicas точек на кольце, ключ принадлежит
+    ближайшей точке по часовой стрелке. Добавление шарда переносит лишь ~1/N арендаторов.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.points = sorted((_hash(f'{node}#{index}'), node) for node in nodes for index in range(replicas))
+        self.keys = [point for point, _ in self.points]
+
+    def node_for(self, key):
+        index = bisect.bisect(self.keys, _hash(str(key))) % len(self.points)
+        return self.points[index][1]
+
+
+@lru_cache(maxsize=8)
+def _ring(nodes):
+    return HashRing(nodes, getattr(settings, 'FIRM_SHARD_RING_REPLICAS', 100))
+
+
+def placement(user_id, assign=False):
+    """
+    (шард, идёт ли перенос) для арендатора.
+
+    Шард хранится в TenantPlacement. Чтение строку не создаёт: арендатора без записи ведёт кольцо.
+    Закрепляется арендатор при первой записи (assign=True — роутер при записи и изменяющие запросы
+    в TenantMiddleware) через get_or_create, и из параллельных первых записей выигрывает одна. Поэтому
+    добавление шарда в FIRM_SHARDS не уводит арендаторов с данными от их шарда — переносит их только
+    move_tenant, — а GET-запросы в основную базу не пишут. Ответ кешируется в общем кеше, move_tenant
+    сбрасывает его при каждом шаге переноса.
+    """
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0], False
+    key = PLACEMENT_CACHE_KEY.format(user_id)
+    value = cache.get(key)
+    # Третий элемент — закреплён ли арендатор строкой TenantPlacement
+    if value is None or (assign and not value[2]):
+        placements = TenantPlacement.objects.using(DEFAULT_DB_ALIAS)
+        ring_node = _ring(tuple(aliases)).node_for(user_id)
+        if assign:
+            row, _ = placements.get_or_create(user_id=user_id, defaults={'shard': ring_node})
+        else:
+            row = placements.filter(user_id=user_id).first()
+        if row is None:
+            value = (ring_node, False, False)
+        elif row.shard in aliases:
+            value = (row.shard, row.locked, True)
+        else:
+            # Шард, убранный из FIRM_SHARDS, — ошибка настройки: пока её не исправят, арендатора ведёт кольцо
+            value = (ring_node, False, True)
+        cache.set(key, value, getattr(settings, 'FIRM_SHARD_PLACEMENT_TIMEOUT', 300))
+    return value[0], value[1]
+
+
+def shard_for_user(user_id, assign=False):
+    return placement(user_id, assign)[0]
+
+
+def set_placement(user_id, alias, locked=False):
+    TenantPlacement.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'shard': alias, 'locked': locked})
+    cache.delete(PLACEMENT_CACHE_KEY.format(user_id))
+
+
+def pin_existing_users():
+    """Закрепляет всех пользователей без размещения за основной базой, где лежат их данные до шардирования."""
+    user_ids = (CustomUser.objects.using(DEFAULT_DB_ALIAS)
+                .exclude(pk__in=TenantPlacement.objects.using(DEFAULT_DB_ALIAS).values('user_id'))
+                .values_list('pk', flat=True))
+    placements = [TenantPlacement(user_id=user_id, shard=DEFAULT_DB_ALIAS) for user_id in user_ids]
+    TenantPlacement.objects.using(DEFAULT_DB_ALIAS).bulk_create(placements, batch_size=1000)
+    for placement_row in placements:
+        cache.delete(PLACEMENT_CACHE_KEY.format(placement_row.user_id))
+    return len(placements)
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    """Направляет данные арендаторов в шард alias (для команд, которые обходят шарды по очереди)."""
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+class ShardRouter:
+    """
+    Данные арендаторов — в шард текущего арендатора, справочники и служебные таблицы — в основную базу.
+
+    Объект, уже прочитанный из шарда, сохраняется и удаляется там же (подсказка instance), поэтому
+    сотрудник, открывший чужую запись через fan-out, меняет её в правильном шарде. Без шардов
+    (FIRM_SHARDS = ['default']) роутер ни во что не вмешивается и решение принимает ReplicaRouter.
+    """
+
+    def _tenant_db(self, model, hints, write=False):
+        if model not in TENANT_MODELS or not is_sharded():
+            return None
+        # Подсказка instance — сама строка или связанный объект (при присваивании внешнего ключа Django
+        # спрашивает базу по присваиваемому значению, например по пользователю в created_by)
+        instance = hints.get('instance')
+        if type(instance) in TENANT_MODELS:
+            if instance._state.db:
+                return instance._state.db
+            owner_id = getattr(instance, 'created_by_id', None)
+            if owner_id is not None:
+                return shard_for_user(owner_id, assign=write)
+        elif isinstance(instance, CustomUser):
+            return shard_for_user(instance.pk, assign=write)
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._tenant_db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        if model in TENANT_MODELS:
+            return self._tenant_db(model, hints, write=True)
+        return DEFAULT_DB_ALIAS if is_sharded() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Справочники есть в каждом шарде, строки арендатора ссылаются только на строки своего шарда
+        if type(obj1) not in TENANT_MODELS or type(obj2) not in TENANT_MODELS:
+            return True
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема во всех шардах одинакова
+        return None
+
+
+# --- Чтение для сотрудников: один запрос в каждый шард и слияние отсортированных результатов ---
+
+def fans_out(user, model):
+    return is_sharded() and user.is_staff and model in TENANT_MODELS
+
+
+def per_shard(queryset, user):
+    """
+    Копии queryset для всех шардов, если сотруднику нужны данные всех арендаторов, иначе — сам queryset,
+    привязанный к базе, выбранной сейчас (пока действует контекст запроса).
+    """
+    if fans_out(user, queryset.model):
+        return [queryset.using(alias) for alias in shard_aliases()]
+    return [queryset.using(queryset.db)]
+
+
+def merge(querysets, key, reverse=False, limit=None):
+    """Сливает уже отсортированные по key результаты нескольких запросов (heapq.merge, без общей сортировки)."""
+    if len(querysets) == 1:
+        rows = querysets[0]
+        return list(rows if limit is None else rows[:limit])
+    merged = heapq.merge(*querysets, key=key, reverse=reverse)
+    return list(itertools.islice(merged, limit))
+
+
+def _row_key(field):
+    def key(row):
+        if isinstance(row, dict):
+            return row[field], row['pk'] if 'pk' in row else row['id']
+        return getattr(row, field), row.pk
+    return key
+
+
+def keyset_page(queryset, user, field, page_size, after=None, before=None):
+    """
+    Страница keyset-пагинации (firm/pagination.py) с учётом шардов.
+
+    Каждый шард отдаёт page_size + 1 строк по тому же курсору, слияние берёт из них лучшие
+    page_size + 1: глубина страницы по-прежнему не влияет на стоимость, а курсоры совпадают
+    с нешардированными, потому что id уникальны во всех шардах.
+    """
+    page_query = keyset_queryset(queryset, field, page_size, after=after, before=before)
+    rows = merge(per_shard(page_query, user), _row_key(field), reverse=not before, limit=page_size + 1)
+    return build_page(rows, field, page_size, after=after, before=before)
+
+
+def get_visible(queryset, user, **lookup):
+    """queryset.get(**lookup) по всем шардам для сотрудника и по своему шарду для остальных."""
+    for shard_queryset in per_shard(queryset, user):
+        obj = shard_queryset.filter(**lookup).first()
+        if obj is not None:
+            return obj
+    raise queryset.model.DoesNotExist(f"{queryset.model._meta.object_name} не найден.")
+
+
+def search_visible(queryset, user, query, limit=20):
+    """
+    search.search по всем шардам для сотрудника и по своему шарду для остальных.
+
+    Найденное в разных шардах сливается по рангу bm25 (search_rank). Ранг считается по индексу
+    своего шарда, поэтому порядок между шардами приблизительный; без FTS5 ранга нет и шарды идут подряд.
+    """
+    shard_querysets = per_shard(queryset, user)
+    if len(shard_querysets) == 1:
+        return search.search(shard_querysets[0], query, limit)
+    found = [obj for shard_queryset in shard_querysets for obj in search.search(shard_queryset, query, limit)]
+    found.sort(key=lambda obj: getattr(obj, 'search_rank', 0))
+    return found[:limit]
+
+
+# --- Подготовка шардов и копии справочников ---
+
+def prepare_shard(alias):
+    """
+    Сдвигает счётчики AUTOINCREMENT таблиц арендаторов шарда к его диапазону id (номер шарда * ID_BLOCK).
+
+    Работает для SQLite; для других СУБД диапазоны задаются последовательностями вручную.
+    """
+    index = shard_aliases().index(alias)
+    connection = connections[alias]
+    if not index or connection.vendor != 'sqlite':
+        return
+    base = index * ID_BLOCK
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        for model in TENANT_MODELS:
+            if not model._meta.pk.get_internal_type().endswith('AutoField'):
+                continue  # архивные таблицы хранят исходные id
+            table = model._meta.db_table
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s", [base, table])
+            if not cursor.rowcount:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, base])
+
+
+def upsert(model, objs, alias):
+    """Вставляет строки с их id и датами или обновляет уже существующие."""
+    return insert_rows(model, objs, alias, update_conflicts=True)
+
+
+def sync_reference(alias, batch_size=1000):
+    """Приводит справочники шарда к основной базе: вставка и обновление порциями, удаление лишних строк."""
+    counts = {}
+    for model in REFERENCE_MODELS:
+        source = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+        copied, last_pk = 0, None
+        while True:
+            page = source if last_pk is None else source.filter(pk__gt=last_pk)
+            objs = list(page[:batch_size])
+            if not objs:
+                break
+            copied += upsert(model, objs, alias)
+            last_pk = objs[-1].pk
+        counts[model] = copied
+    # Удаление — в обратном порядке: сначала строки, которые ссылаются на другие справочники
+    for model in reversed(REFERENCE_MODELS):
+        known = set(model._base_manager.using(DEFAULT_DB_ALIAS).values_list('pk', flat=True))
+        stale = [pk for pk in model._base_manager.using(alias).values_list('pk', flat=True) if pk not in known]
+        for start in range(0, len(stale), batch_size):
+            model._base_manager.using(alias).filter(pk__in=stale[start:start + batch_size]).delete()
+    return counts
+
+
+def sync_instance(instance, deleted=False):
+    """Повторяет сохранение или удаление строки справочника во всех шардах, кроме основной базы."""
+    model = type(instance)
+    for alias in shard_aliases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        if deleted:
+            model._base_manager.using(alias).filter(pk=instance.pk).delete()
+        else:
+            upsert(model, [model._base_manager.using(DEFAULT_DB_ALIAS).get(pk=instance.pk)], alias)
+
+
+# --- Перенос арендатора между шардами ---
+
+class TenantConflict(Exception):
+    """В шарде назначения уже есть строки, с которыми строки арендатора нарушили бы уникальность."""
+
+
+def tenant_rows(model, user_id, alias):
+    return model._base_manager.using(alias).filter(**{TENANT_MODELS[model]: user_id}).order_by('pk')
+
+
+def copy_tenant(user_id, source, target, batch_size):
+    """Копирует (вставляет или обновляет) все строки арендатора из source в target; возвращает {модель: строк}."""
+    counts = {}
+    for model in TENANT_MODELS:
+        rows, last_pk = 0, None
+        while True:
+            page = tenant_rows(model, user_id, source)
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            objs = list(page[:batch_size])
+            if not objs:
+                break
+            with transaction.atomic(using=target):
+                rows += upsert(model, objs, target)
+            last_pk = objs[-1].pk
+        counts[model] = rows
+    return counts
+
+
+def email_conflicts(user_id, source, target, batch_size):
+    """
+    E-mail клиентов арендатора, занятые в target другими клиентами.
+
+    Client.email уникален в пределах одной базы, а не всех шардов, поэтому такой клиент оборвал бы
+    копирование на середине. Свои строки арендатора (тот же id после прошлого прохода) конфликтом не считаются.
+    """
+    conflicts, last_pk = [], None
+    while True:
+        page = tenant_rows(Client, user_id, source)
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        rows = list(page.values_list('email', 'pk')[:batch_size])
+        if not rows:
+            break
+        own = dict(rows)
+        taken = Client._base_manager.using(target).filter(email__in=own).values_list('email', 'pk')
+        conflicts += sorted(email for email, pk in taken if own[email] != pk)
+        last_pk = rows[-1][1]
+    return conflicts
+
+
+def check_conflicts(user_id, source, target, batch_size):
+    conflicts = email_conflicts(user_id, source, target, batch_size)
+    if conflicts:
+        shown = ', '.join(conflicts[:10]) + (f" и ещё {len(conflicts) - 10}" if len(conflicts) > 10 else "")
+        raise TenantConflict(f"В {target} уже есть клиенты с e-mail: {shown}")
+
+
+def drop_missing(user_id, source, target, batch_size):
+    """Удаляет из target строки арендатора, которых уже нет в source (удалены во время копирования)."""
+    removed = 0
+    for model in reversed(list(TENANT_MODELS)):
+        last_pk = None
+        while True:
+            page = tenant_rows(model, user_id, target)
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            ids = list(page.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            present = set(model._base_manager.using(source).filter(pk__in=ids).values_list('pk', flat=True))
+            with transaction.atomic(using=target):
+                removed += delete_ids(model, [pk for pk in ids if pk not in present], target)
+            last_pk = ids[-1]
+    return removed
+
+
+def delete_tenant(user_id, alias, batch_size):
+    """Удаляет строки арендатора из шарда порциями, снизу вверх (позиции и платежи раньше заказов)."""
+    removed = 0
+    for model in reversed(list(TENANT_MODELS)):
+        while True:
+            ids = list(tenant_rows(model, user_id, alias).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(using=alias):
+                if model in search.SEARCH_INDEXES and search.is_supported(alias):
+                    search.remove_ids(model, ids, using=alias)
+                removed += delete_ids(model, ids, alias)
+    return removed
+
+
+def move_tenant(user_id, target, batch_size=None, grace=2.0, log=None):
+    """
+    Переносит арендатора в шард target, не останавливая чтение.
+
+    1. Строки копируются порциями, пока арендатор работает как обычно.
+    2. Арендатор блокируется на запись (TenantMiddleware отвечает 503), после паузы grace на завершение
+       начатых запросов копирование повторяется: догоняются изменения и удаления первого прохода.
+    3. Размещение переключается на target и блокировка снимается; после этого строки удаляются из
+       старого шарда порциями. Полнотекстовый индекс нового шарда перестраивается.
+    Перед каждым проходом e-mail клиентов проверяются на занятость в target: при конфликте
+    TenantConflict поднимается до копирования, и арендатор остаётся в source без блокировки.
+    Возвращает (исходный шард, {модель: строк}).
+    """
+    log = log or (lambda message: None)
+    batch_size = batch_size or getattr(settings, 'FIRM_SHARD_BATCH_SIZE', 1000)
+    source = shard_for_user(user_id)
+    if source == target:
+        return source, {}
+    prepare_shard(target)
+    sync_instance(CustomUser.objects.using(DEFAULT_DB_ALIAS).get(pk=user_id))
+
+    check_conflicts(user_id, source, target, batch_size)
+    started = time.perf_counter()
+    copy_tenant(user_id, source, target, batch_size)
+    log(f"Первый проход: {time.perf_counter() - started:.1f} с")
+
+    set_placement(user_id, source, locked=True)
+    try:
+        time.sleep(grace)
+        # За первый проход в target мог появиться клиент с тем же e-mail у другого арендатора
+        check_conflicts(user_id, source, target, batch_size)
+        started = time.perf_counter()
+        counts = copy_tenant(user_id, source, target, batch_size)
+        drop_missing(user_id, source, target, batch_size)
+        log(f"Догоняющий проход (запись заблокирована): {time.perf_counter() - started:.1f} с")
+    except Exception:
+        set_placement(user_id, source, locked=False)
+        raise
+    set_placement(user_id, target, locked=False)
+
+    if search.is_supported(target):
+        for model in search.SEARCH_INDEXES:
+            if model in TENANT_MODELS:
+                search.rebuild(model, using=target)
+    removed = delete_tenant(user_id, source, batch_size)
+    log(f"Удалено из {source}: {removed} строк")
+    return source, counts
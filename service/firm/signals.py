@@ -0,0 +1,138 @@
+# firm/signals.py
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import lookups, ratings, rollups, search, sharding, totals
+from .cache import invalidate_home_page
+from .models import Client, Feedback, Order, OrderItem, OrderStatus, Payment, PaymentStatus, Product
+
+
+@receiver([post_save, post_delete], sender=Client)
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Product)
+def drop_home_page_cache(sender, **kwargs):
+    # Сбрасываем после коммита: иначе параллельный запрос успеет закешировать ещё старые строки
+    transaction.on_commit(invalidate_home_page)
+
+
+# Справочники в памяти процессов (firm/lookups.py) перечитываются при смене версии в общем кеше
+@receiver([post_save, post_delete], sender=OrderStatus)
+@receiver([post_save, post_delete], sender=PaymentStatus)
+def bump_lookup_version(sender, **kwargs):
+    name = {OrderStatus: 'order_status', PaymentStatus: 'payment_status'}[sender]
+    transaction.on_commit(lambda: lookups.invalidate(name))
+
+
+# Итоги заказа (Order.total_amount, Order.item_count) поддерживаются инкрементально.
+# bulk_create/update/delete сигналы не шлют — расхождения находит и чинит recompute_order_totals.
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item(sender, instance, using, raw=False, **kwargs):
+    instance._totals_old = None
+    if instance.pk and not raw:
+        instance._totals_old = (OrderItem.objects.using(using).filter(pk=instance.pk)
+                                .values('order_id', 'amount', 'price').first())
+
+
+@receiver(post_save, sender=OrderItem)
+def update_order_totals_on_save(sender, instance, using, raw=False, **kwargs):
+    # Итоги сдвигаются в той же базе (шарде), куда записана позиция
+    if not raw:
+        totals.item_saved(instance, getattr(instance, '_totals_old', None), using)
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_order_totals_on_delete(sender, instance, using, **kwargs):
+    totals.item_deleted(instance, using)
+
+
+# Дневные агрегаты (firm/rollups.py): правка позиции или платежа за прошедший день отмечает день для rollup_sales
+@receiver([post_save, post_delete], sender=OrderItem)
+def mark_item_day(sender, instance, using, raw=False, **kwargs):
+    if raw:
+        return
+    order_ids = {instance.order_id}
+    old = getattr(instance, '_totals_old', None)
+    if old is not None:
+        order_ids.add(old['order_id'])
+    rollups.mark_dirty_rows(Order._base_manager.using(using).filter(pk__in=order_ids))
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def mark_payment_day(sender, instance, raw=False, **kwargs):
+    if not raw and instance.payment_date is not None:
+        rollups.mark_dirty([timezone.localdate(instance.payment_date)])
+
+
+# Полнотекстовый индекс (firm/search.py) обновляется в той же транзакции, что и сама запись
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Feedback)
+def update_search_index(sender, instance, using, raw=False, **kwargs):
+    if not raw and search.is_supported(using):
+        search.index_instance(instance, using)
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Feedback)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    if search.is_supported(using):
+        search.remove_ids(sender, [instance.pk], using)
+
+
+# Агрегаты оценок курьеров и продуктов (CourierRating, ProductRating) сдвигаются на каждый отзыв —
+# по снимку курьера и продуктов заказа, сделанному при создании отзыва
+@receiver(pre_save, sender=Feedback)
+def remember_feedback(sender, instance, using, raw=False, **kwargs):
+    instance._rating_old = None
+    if raw:
+        return
+    if instance.pk:
+        instance._rating_old = (Feedback.objects.using(using).filter(pk=instance.pk)
+                                .values('order_id', 'rated_courier_id', 'rated_products', 'rating').first())
+    old = instance._rating_old
+    if old is None or old['order_id'] != instance.order_id:
+        # Новый отзыв (или отзыв к другому заказу) оценивает текущих курьера и продукты заказа
+        ratings.snapshot(instance, using)
+
+
+@receiver(post_save, sender=Feedback)
+def update_ratings_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ratings.feedback_saved(instance, getattr(instance, '_rating_old', None))
+
+
+@receiver(post_delete, sender=Feedback)
+def update_ratings_on_delete(sender, instance, **kwargs):
+    ratings.feedback_deleted(instance)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # Настройки из FIRM_SQLITE_PRAGMAS; с CONN_MAX_AGE выполняются один раз на соединение, а не на запрос
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'FIRM_SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_save)
+def sync_reference_on_save(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    # Справочники копируются во все шарды после коммита; вход пользователя (last_login) в шардах не нужен
+    if raw or sender not in sharding.REFERENCE_MODELS or using != DEFAULT_DB_ALIAS or not sharding.is_sharded():
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(lambda: sharding.sync_instance(instance), using=using)
+
+
+@receiver(post_delete)
+def sync_reference_on_delete(sender, instance, using=None, **kwargs):
+    if sender not in sharding.REFERENCE_MODELS or using != DEFAULT_DB_ALIAS or not sharding.is_sharded():
+        return
+    transaction.on_commit(lambda: sharding.sync_instance(instance, deleted=True), using=using)
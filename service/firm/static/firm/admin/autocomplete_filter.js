@@ -0,0 +1,13 @@
+// Фильтр списка в админке через autocomplete (firm.admin.AutocompleteFilter):
+// при выборе значения переходим на тот же список с параметром фильтра, при очистке — без него.
+'use strict';
+{
+    const $ = django.jQuery;
+    $(document).on('change', 'select[data-filter-param]', function() {
+        const url = new URL(this.dataset.filterUrl, window.location.href);
+        if (this.value) {
+            url.searchParams.set(this.dataset.filterParam, this.value);
+        }
+        window.location.href = url.toString();
+    });
+}
@@ -0,0 +1,17 @@
+# firm/templatetags/firm_lookups.py
+from django import template
+
+from firm import lookups
+
+register = template.Library()
+
+
+# Названия по id из справочников в памяти процесса: {{ order.order_status_id|order_status_name }}
+@register.filter
+def order_status_name(pk):
+    return lookups.get_order_status_name(pk, '')
+
+
+@register.filter
+def payment_status_name(pk):
+    return lookups.get_payment_status_name(pk, '')
@@ -1,3 +1,1259 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.admin import site
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import archive, lookups, routers, scheduling, search, sharding
+from .bulk import chunked_update, insert_rows
+from .cache import HOME_PAGE_CACHE_KEY, get_home_page_data
+from .deletion import purge_client
+from .forms import ClientCreateForm
+from .mail import claim_batch, deliver_batch
+from .management.commands.import_clients import Command as ImportClientsCommand
+from .middleware import QueryMetricsMiddleware, ReplicaRoutingMiddleware, TenantMiddleware
+from .models import (ArchivedFeedback, ArchivedOrder, ArchivedOrderItem, ArchivedPayment, Client, ClientPurgeJob,
+                     Courier, CourierRating, DailyPaymentTotals, DailyProductSales, DirtySalesDay, Feedback, Order,
+                     OrderItem, OrderStatus, OutboxEmail, Payment, PaymentStatus, Product, ProductRating,
+                     TenantPlacement)
+from .orders import InsufficientStock, place_order, save_item
+from .pagination import EstimatedCountPaginator, InvalidCursor, keyset_paginate
+from .ratings import reconcile
+from .scheduling import assign_couriers
+from .totals import computed_totals
+from .validation import EMAIL_MESSAGE, FIRST_NAME_MESSAGE, validate_many, validate_record
+
+# Кеш в памяти процесса: тесты не должны трогать файловый кеш разработчика
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class AdminChangelistScaleTests(TestCase):
+    """Число запросов в списках админки не должно зависеть от числа строк и размера связанных таблиц."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'admin', patronymic='Иванович')
+        cls.order_status = OrderStatus.objects.create(name='Новый')
+        cls.payment_status = PaymentStatus.objects.create(name='Оплачен')
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=100)
+        cls.serial = 0
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_orders(self, count):
+        # Каждый заказ — со своим клиентом и курьером, чтобы N+1 по внешним ключам был заметен
+        for _ in range(count):
+            AdminChangelistScaleTests.serial += 1
+            n = self.serial
+            client = Client.objects.create(surname='Иванов', name='Иван', email=f'client{n}@example.com',
+                                           created_by=self.admin)
+            courier = Courier.objects.create(surname='Петров', name='Пётр', email=f'courier{n}@example.com',
+                                             created_by=self.admin)
+            order = Order.objects.create(order_status=self.order_status, client=client, courier=courier,
+                                         created_by=self.admin)
+            OrderItem.objects.create(order=order, product=self.product, amount=1, price=Decimal('10.00'))
+            Payment.objects.create(order=order, client=client, payment_status=self.payment_status,
+                                   amount=Decimal('10.00'), created_by=self.admin)
+            Feedback.objects.create(order=order, client=client, rating=5, created_by=self.admin)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = ['/admin/firm/order/', '/admin/firm/payment/', '/admin/firm/feedback/', '/admin/firm/orderitem/']
+        self.add_orders(2)
+        baseline = {url: self.changelist_queries(url) for url in urls}
+        self.add_orders(20)
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertNumQueries(baseline[url]):
+                    self.client.get(url)
+
+    def test_order_changelist_queries(self):
+        self.add_orders(10)
+        # сессия, пользователь, счёт строк, строки с select_related, даты date_hierarchy, статусы для фильтра
+        # и для формы массовых действий...
+        with self.assertNumQueries(10):
+            response = self.client.get('/admin/firm/order/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_related_filters_do_not_list_every_row(self):
+        self.add_orders(5)
+        response = self.client.get('/admin/firm/order/')
+        # Фильтры по клиенту и курьеру — autocomplete, а не ссылка на каждую строку связанной таблицы
+        self.assertNotContains(response, '?client__id__exact=')
+        self.assertNotContains(response, '?courier__id__exact=')
+        self.assertContains(response, 'data-filter-param="client__id__exact"')
+
+    def test_autocomplete_filter_applies(self):
+        self.add_orders(3)
+        order = Order.objects.order_by('pk').first()
+        response = self.client.get(f'/admin/firm/order/?client__id__exact={order.client_id}')
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+        # Выбранный клиент выводится в поле фильтра
+        self.assertContains(response, f'<option value="{order.client_id}" selected>')
+
+    @override_settings(FIRM_ADMIN_COUNT_LIMIT=1)
+    def test_filtered_pages_past_count_limit(self):
+        self.add_orders(5)
+        url = f'/admin/firm/order/?order_status__id__exact={self.order_status.pk}'
+        with mock.patch.object(site._registry[Order], 'list_per_page', 2):
+            response = self.client.get(url + '&p=3')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['cl'].result_list), 1)
+            # С первой страницы следующая тоже достижима, хотя граница счёта — одна строка
+            self.assertEqual(self.client.get(url).context['cl'].paginator.num_pages, 2)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(Product(product_name=f'Товар {i}', price=Decimal('1.00')) for i in range(12))
+
+    @override_settings(FIRM_ADMIN_COUNT_LIMIT=5)
+    def test_unfiltered_count_is_estimated_without_count_star(self):
+        paginator = EstimatedCountPaginator(Product.objects.order_by('-pk'), 5)
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+        self.assertGreaterEqual(count, 12)
+        self.assertFalse(any('COUNT(*)' in query['sql'] for query in queries))
+
+    @override_settings(FIRM_ADMIN_COUNT_LIMIT=5)
+    def test_filtered_count_is_capped(self):
+        paginator = EstimatedCountPaginator(Product.objects.filter(price__gt=0).order_by('-pk'), 5)
+        self.assertEqual(paginator.count, 6)
+
+    @override_settings(FIRM_ADMIN_COUNT_LIMIT=5)
+    def test_requested_page_is_reachable_past_cap(self):
+        queryset = Product.objects.filter(price__gt=0).order_by('-pk')
+        page = EstimatedCountPaginator(queryset, 5, page=3).page(3)
+        self.assertEqual(len(page.object_list), 2)
+        self.assertFalse(page.has_next())
+
+    def test_small_table_counts_exactly(self):
+        paginator = EstimatedCountPaginator(Product.objects.order_by('-pk'), 5)
+        self.assertEqual(paginator.count, 12)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(TestCase):
+    """Страницы по (registration_date, id): без пропусков и повторов, в том числе на одинаковых датах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        clients = [Client.objects.create(surname='Иванов', name='Иван', email=f'c{n}@example.com', created_by=cls.user)
+                   for n in range(7)]
+        # Три клиента с одной датой: порядок между ними задаёт id
+        same = clients[2].registration_date
+        Client.objects.filter(pk__in=[clients[3].pk, clients[4].pk]).update(registration_date=same)
+        cls.expected = list(Client.objects.order_by('-registration_date', '-pk').values_list('pk', flat=True))
+
+    def walk_forward(self, page_size):
+        pages, after = [], None
+        while True:
+            page = keyset_paginate(Client.objects.all(), 'registration_date', page_size, after=after)
+            pages.append(page)
+            if not page.has_next:
+                return pages
+            after = page.next_cursor
+
+    def ids(self, page):
+        return [client.pk for client in page.object_list]
+
+    def test_forward_walk_covers_every_row_once(self):
+        pages = self.walk_forward(3)
+        self.assertEqual([len(page.object_list) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertFalse(pages[0].has_previous)
+        self.assertTrue(pages[-1].has_previous)
+
+    def test_backward_walk_returns_the_same_pages(self):
+        pages = self.walk_forward(3)
+        page = pages[-1]
+        for previous in reversed(pages[:-1]):
+            page = keyset_paginate(Client.objects.all(), 'registration_date', 3, before=page.prev_cursor)
+            self.assertEqual(self.ids(page), self.ids(previous))
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    def test_last_full_page_has_no_next(self):
+        pages = self.walk_forward(7)
+        self.assertEqual(len(pages), 1)
+        self.assertFalse(pages[0].has_next)
+        self.assertIsNone(pages[0].next_cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(Client.objects.all(), 'registration_date', 3, after='не-курсор')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/firm/clients/', {'after': 'не-курсор'}).status_code, 404)
+
+    def test_list_view_follows_cursor(self):
+        self.client.force_login(self.user)
+        first = self.client.get('/firm/clients/', {'page_size': 4})
+        self.assertEqual([client.pk for client in first.context['clients']], self.expected[:4])
+        second = self.client.get('/firm/clients/', {'page_size': 4, 'after': first.context['next_cursor']})
+        self.assertEqual([client.pk for client in second.context['clients']], self.expected[4:])
+        self.assertIsNone(second.context['next_cursor'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OwnerScopingTests(TestCase):
+    """Чужие записи не видны ни в списке, ни по прямой ссылке: 404, а не redirect и не 403."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.alice = users.create_user('alice', 'alice@example.com', 'pw', patronymic='Иванович')
+        cls.bob = users.create_user('bob', 'bob@example.com', 'pw', patronymic='Петрович')
+        cls.staff = users.create_user('staff', 'staff@example.com', 'pw', patronymic='Сидорович', is_staff=True)
+        cls.alice_client = Client.objects.create(surname='Иванов', name='Иван', email='a@example.com',
+                                                 created_by=cls.alice)
+        cls.bob_client = Client.objects.create(surname='Петров', name='Пётр', email='b@example.com',
+                                               created_by=cls.bob)
+
+    def test_visible_to(self):
+        self.assertEqual(list(Client.objects.visible_to(self.alice)), [self.alice_client])
+        self.assertEqual(set(Client.objects.visible_to(self.staff)), {self.alice_client, self.bob_client})
+        self.assertFalse(Client.objects.visible_to(AnonymousUser()).exists())
+
+    def test_list_shows_only_own_clients(self):
+        self.client.force_login(self.alice)
+        response = self.client.get('/firm/clients/')
+        self.assertEqual(list(response.context['clients']), [self.alice_client])
+
+    def test_foreign_client_is_not_found(self):
+        self.client.force_login(self.alice)
+        pk = self.bob_client.pk
+        self.assertEqual(self.client.get(f'/firm/clients/{pk}/').status_code, 404)
+        response = self.client.post(f'/firm/clients/{pk}/update/',
+                                    {'surname': 'Взломов', 'name': 'Пётр', 'email': 'b@example.com'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.post(f'/firm/clients/{pk}/delete/').status_code, 404)
+        self.assertEqual(self.client.get(f'/firm/api/clients/{pk}/').status_code, 404)
+        self.bob_client.refresh_from_db()
+        self.assertEqual(self.bob_client.surname, 'Петров')
+
+    def test_staff_sees_every_client(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(f'/firm/clients/{self.bob_client.pk}/').status_code, 200)
+        response = self.client.get('/firm/clients/')
+        self.assertEqual(set(response.context['clients']), {self.alice_client, self.bob_client})
+
+
+class FullTextSearchTests(TestCase):
+    """Поиск по индексу учитывает владельца до среза, а в админке не обрезает и не теряет порядок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.alice = users.create_user('alice', 'alice@example.com', 'pw', patronymic='Ивановна')
+        cls.bob = users.create_user('bob', 'bob@example.com', 'pw', patronymic='Петрович')
+        cls.admin = users.create_superuser('admin', 'admin@example.com', 'pw', patronymic='Иванович')
+        # Чужих совпадений больше, чем когда-то помещалось в LIMIT индекса
+        strangers = Client.objects.bulk_create(
+            Client(surname='Иванов', name=f'Иван {n}', email=f'bob{n}@example.com', created_by=cls.bob)
+            for n in range(600)
+        )
+        search.index_ids(Client, [client.pk for client in strangers])
+        cls.own = Client.objects.create(surname='Иванова', name='Анна', email='anna@example.com', created_by=cls.alice)
+        order = Order.objects.create(client=cls.own, created_by=cls.alice)
+        cls.feedback = Feedback.objects.create(order=order, client=cls.own, rating=5, comment='Быстрая доставка',
+                                               created_by=cls.alice)
+
+    def test_owner_scope_is_applied_before_limit(self):
+        found = search.search(Client.objects.visible_to(self.alice), 'Иванов')
+        self.assertEqual(found, [self.own])
+
+    def test_admin_search_is_not_capped_and_ranked(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/firm/client/', {'q': 'Иванов'})
+        changelist = response.context['cl']
+        self.assertEqual(changelist.queryset.count(), 601)
+        self.assertEqual(changelist.queryset.query.order_by[0], 'search_rank')
+
+    def test_admin_searches_unindexed_fields(self):
+        self.client.force_login(self.admin)
+        for term in ('Анна', 'доставка'):
+            response = self.client.get('/admin/firm/feedback/', {'q': term})
+            self.assertEqual(list(response.context['cl'].result_list), [self.feedback])
+
+    def test_staff_search_merges_shards_by_rank(self):
+        # Два «шарда» — две части одной базы: слияние должно идти по рангу, а не шард за шардом
+        clients = Client.objects.visible_to(self.admin)
+        parts = [clients.filter(created_by=self.bob), clients.filter(created_by=self.alice)]
+        with mock.patch.object(sharding, 'per_shard', return_value=parts):
+            found = sharding.search_visible(clients, self.admin, 'Иванова', limit=5)
+        self.assertEqual(found[0], self.own)
+        self.assertEqual(len(found), 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HomePageCacheTests(TestCase):
+    """Главная читается из кеша, и любая запись, меняющая её блоки, кеш сбрасывает — в том числе update()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=10)
+        Courier.objects.create(surname='Петров', name='Пётр', email='courier@example.com', created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def cached_stock(self):
+        return {product.pk: product.stock for product in get_home_page_data()['latest_products']}[self.product.pk]
+
+    def test_second_read_is_served_from_cache(self):
+        get_home_page_data()
+        with self.assertNumQueries(0):
+            get_home_page_data()
+
+    def test_model_signals_invalidate(self):
+        get_home_page_data()
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(surname='Петров', name='Пётр', email='new@example.com', created_by=self.user)
+        self.assertIsNone(cache.get(HOME_PAGE_CACHE_KEY))
+
+    def test_stock_reservation_invalidates(self):
+        self.assertEqual(self.cached_stock(), 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.customer, [(self.product.pk, 3)], self.user)
+        self.assertEqual(self.cached_stock(), 7)
+
+    def test_chunked_update_of_products_invalidates(self):
+        self.assertEqual(self.cached_stock(), 10)
+        chunked_update(Product.objects.filter(pk=self.product.pk), {'stock': 0})
+        self.assertEqual(self.cached_stock(), 0)
+
+    def test_courier_assignment_invalidates(self):
+        Order.objects.create(client=self.customer, created_by=self.user)
+        get_home_page_data()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(assign_couriers(), (1, 0))
+        self.assertIsNone(cache.get(HOME_PAGE_CACHE_KEY))
+
+    # Пути без сигналов (bulk_create, update(), сырой DELETE) сбрасывают кеш сами — сразу, без on_commit
+
+    def test_import_clients_invalidates(self):
+        get_home_page_data()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'clients.csv'
+            path.write_text('surname,name,email\nКозлов,Олег,oleg@example.com\n', encoding='utf-8')
+            call_command('import_clients', str(path), created_by='owner', stdout=StringIO())
+        self.assertIn('oleg@example.com', [client.email for client in get_home_page_data()['latest_clients']])
+
+    def test_bulk_set_invalidates(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        delivered = OrderStatus.objects.create(name='Доставлен')
+        get_home_page_data()
+        call_command('bulk_set', 'orders', '--set', f'order_status={delivered.pk}', '--filter', f'pk={order.pk}',
+                     stdout=StringIO())
+        self.assertEqual(get_home_page_data()['latest_orders'][0].order_status_id, delivered.pk)
+
+    def test_purge_client_invalidates(self):
+        Order.objects.create(client=self.customer, created_by=self.user)
+        self.assertEqual(len(get_home_page_data()['latest_orders']), 1)
+        purge_client(self.customer.pk)
+        data = get_home_page_data()
+        self.assertEqual((data['latest_clients'], data['latest_orders']), ([], []))
+
+
+class StockReservationTests(TestCase):
+    """Заказ списывает товар условным UPDATE: остаток не уходит в минус, а неудачный заказ откатывается целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.scarce = Product.objects.create(product_name='Дефицит', price=Decimal('10.00'), stock=5)
+        cls.plenty = Product.objects.create(product_name='Запас', price=Decimal('1.00'), stock=100)
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock
+
+    def test_order_over_stock_is_rejected(self):
+        with self.assertRaises(InsufficientStock):
+            place_order(self.customer, [(self.scarce.pk, 6)], self.user)
+        self.assertEqual(self.stock(self.scarce), 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_order_releases_other_products(self):
+        with self.assertRaises(InsufficientStock):
+            place_order(self.customer, [(self.plenty.pk, 10), (self.scarce.pk, 6)], self.user)
+        self.assertEqual((self.stock(self.plenty), self.stock(self.scarce)), (100, 5))
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_repeated_lines_are_summed(self):
+        with self.assertRaises(InsufficientStock):
+            place_order(self.customer, [(self.scarce.pk, 3), (self.scarce.pk, 3)], self.user)
+        self.assertEqual(self.stock(self.scarce), 5)
+
+    def test_stock_never_goes_negative(self):
+        placed = 0
+        for _ in range(8):
+            try:
+                place_order(self.customer, [(self.scarce.pk, 2)], self.user)
+                placed += 1
+            except InsufficientStock:
+                pass
+            self.assertGreaterEqual(self.stock(self.scarce), 0)
+        self.assertEqual((placed, self.stock(self.scarce)), (2, 1))
+        self.assertEqual(OrderItem.objects.filter(product=self.scarce).count(), 2)
+
+    def test_changed_item_reserves_difference(self):
+        order = place_order(self.customer, [(self.scarce.pk, 2)], self.user)
+        item = OrderItem.objects.get(order=order)
+        item.amount = 3
+        with CaptureQueriesContext(connection) as queries:
+            save_item(item)
+        self.assertEqual(self.stock(self.scarce), 2)
+        # Прежнее количество читается уже внутри транзакции резерва, а не до неё
+        statements = [query['sql'] for query in queries]
+        savepoint = next(i for i, sql in enumerate(statements) if sql.startswith('SAVEPOINT'))
+        read = next(i for i, sql in enumerate(statements) if sql.startswith('SELECT') and 'firm_orderitem' in sql)
+        self.assertLess(savepoint, read)
+
+        item.product, item.amount = self.plenty, 1
+        save_item(item)
+        self.assertEqual((self.stock(self.scarce), self.stock(self.plenty)), (5, 99))
+
+
+class ConcurrentStockReservationTests(TransactionTestCase):
+    """Параллельные заказы из нескольких потоков продают не больше, чем лежит на складе."""
+
+    def test_parallel_orders_do_not_oversell(self):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=user)
+        product = Product.objects.create(product_name='Дефицит', price=Decimal('10.00'), stock=10)
+        placed, rejected = [], []
+
+        def buy():
+            try:
+                for _ in range(5):
+                    while True:
+                        try:
+                            place_order(customer, [(product.pk, 1)], user)
+                            placed.append(1)
+                        except InsufficientStock:
+                            rejected.append(1)
+                        except OperationalError:
+                            # Общая in-memory база SQLite не ждёт блокировку, а сразу отказывает: повторяем
+                            continue
+                        break
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual((len(placed), len(rejected), product.stock), (10, 10, 0))
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 10)
+
+
+class ApiWriteTests(TestCase):
+    """Запись через API ссылается только на свои записи, а заказы и позиции резервируют товар на складе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.user = users.create_user('alice', 'alice@example.com', 'pw', patronymic='Ивановна')
+        cls.stranger = users.create_user('bob', 'bob@example.com', 'pw', patronymic='Петрович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.courier = Courier.objects.create(surname='Петров', name='Пётр', email='p@example.com', created_by=cls.user)
+        cls.foreign_courier = Courier.objects.create(surname='Сидоров', name='Сидор', email='s@example.com',
+                                                     created_by=cls.stranger)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=5)
+        cls.status = OrderStatus.objects.create(name='Новый')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, resource, data):
+        return self.client.post(f'/firm/api/{resource}/', data, content_type='application/json')
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_order_reserves_stock(self):
+        response = self.post('orders', {'client': self.customer.pk, 'order_status': self.status.pk,
+                                        'courier': self.courier.pk,
+                                        'items': [{'product': self.product.pk, 'amount': 3}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['item_count'], self.stock()), (1, 2))
+
+    def test_order_over_stock_is_rejected(self):
+        response = self.post('orders', {'client': self.customer.pk, 'order_status': self.status.pk,
+                                        'items': [{'product': self.product.pk, 'amount': 6}]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((Order.objects.count(), self.stock()), (0, 5))
+
+    def test_order_without_items_is_rejected(self):
+        response = self.post('orders', {'client': self.customer.pk, 'order_status': self.status.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.json()['errors'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_foreign_courier_is_not_a_choice(self):
+        response = self.post('orders', {'client': self.customer.pk, 'order_status': self.status.pk,
+                                        'courier': self.foreign_courier.pk,
+                                        'items': [{'product': self.product.pk, 'amount': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('courier', response.json()['errors'])
+
+    def test_order_items_reserve_difference(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        response = self.post('order-items', {'order': order.pk, 'product': self.product.pk, 'amount': 2,
+                                             'price': '10.00'})
+        self.assertEqual((response.status_code, self.stock()), (201, 3))
+        item_url = f"/firm/api/order-items/{response.json()['id']}/"
+        response = self.client.patch(item_url, {'amount': 4}, content_type='application/json')
+        self.assertEqual((response.status_code, self.stock()), (200, 1))
+        response = self.client.patch(item_url, {'amount': 7}, content_type='application/json')
+        self.assertEqual((response.status_code, self.stock()), (409, 1))
+        response = self.client.patch(item_url, {'amount': -3}, content_type='application/json')
+        self.assertEqual((response.status_code, self.stock()), (400, 1))
+
+    def test_deletes_release_stock(self):
+        response = self.post('orders', {'client': self.customer.pk, 'order_status': self.status.pk,
+                                        'items': [{'product': self.product.pk, 'amount': 2}]})
+        order_id = response.json()['id']
+        response = self.post('order-items', {'order': order_id, 'product': self.product.pk, 'amount': 1,
+                                             'price': '10.00'})
+        self.assertEqual(self.stock(), 2)
+        response = self.client.delete(f"/firm/api/order-items/{response.json()['id']}/")
+        self.assertEqual((response.status_code, self.stock()), (204, 3))
+        response = self.client.delete(f'/firm/api/orders/{order_id}/')
+        self.assertEqual((response.status_code, self.stock()), (204, 5))
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class CourierAssignmentTests(TestCase):
+    """Назначение курьеров выравнивает загрузку и не перезаписывает курьера, назначенного параллельно."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.first = Courier.objects.create(surname='Петров', name='Пётр', email='p@example.com', created_by=cls.user)
+        cls.second = Courier.objects.create(surname='Сидоров', name='Сидор', email='s@example.com', created_by=cls.user)
+
+    def test_orders_are_spread_evenly(self):
+        for _ in range(4):
+            Order.objects.create(client=self.customer, created_by=self.user)
+        self.assertEqual(assign_couriers(), (4, 0))
+        loads = Counter(Order.objects.values_list('courier_id', flat=True))
+        self.assertEqual(loads, {self.first.pk: 2, self.second.pk: 2})
+
+    def test_concurrent_assignment_is_kept_and_skipped(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        real_plan = scheduling.plan_assignments
+
+        def plan_then_assign_elsewhere(*args, **kwargs):
+            plan = real_plan(*args, **kwargs)
+            # Другой процесс назначает курьера между чтением и записью
+            Order.objects.filter(pk=order.pk).update(courier=self.second)
+            return plan
+
+        with mock.patch.object(scheduling, 'plan_assignments', plan_then_assign_elsewhere):
+            self.assertEqual(assign_couriers(), (0, 1))
+        order.refresh_from_db()
+        self.assertEqual(order.courier_id, self.second.pk)
+
+
+class RatingSnapshotTests(TestCase):
+    """Отзыв оценивает курьера и продукты заказа на момент отзыва: последующие правки заказа рейтинги не сдвигают."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.courier = Courier.objects.create(surname='Петров', name='Пётр', email='p@example.com', created_by=cls.user)
+        cls.other = Courier.objects.create(surname='Сидоров', name='Сидор', email='s@example.com', created_by=cls.user)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=10)
+        cls.extra = Product.objects.create(product_name='Другой', price=Decimal('5.00'), stock=10)
+
+    def setUp(self):
+        self.order = Order.objects.create(client=self.customer, courier=self.courier, created_by=self.user)
+        OrderItem.objects.create(order=self.order, product=self.product, amount=1, price=Decimal('10.00'))
+        OrderItem.objects.create(order=self.order, product=self.product, amount=2, price=Decimal('10.00'))
+        self.feedback = Feedback.objects.create(order=self.order, client=self.customer, rating=4, created_by=self.user)
+
+    def counts(self):
+        return {
+            'courier': CourierRating.objects.filter(pk=self.courier.pk).values_list('ratings_count', flat=True).first(),
+            'other': CourierRating.objects.filter(pk=self.other.pk).values_list('ratings_count', flat=True).first(),
+            'product': ProductRating.objects.filter(pk=self.product.pk).values_list('ratings_count', flat=True).first(),
+            'extra': ProductRating.objects.filter(pk=self.extra.pk).values_list('ratings_count', flat=True).first(),
+        }
+
+    def test_feedback_snapshots_targets(self):
+        self.assertEqual((self.feedback.rated_courier_id, self.feedback.rated_products),
+                         (self.courier.pk, [self.product.pk]))
+        self.assertEqual(self.counts(), {'courier': 1, 'other': None, 'product': 1, 'extra': None})
+
+    def test_order_changes_do_not_shift_ratings(self):
+        chunked_update(Order.objects.filter(pk=self.order.pk), {'courier': self.other})
+        OrderItem.objects.create(order=self.order, product=self.extra, amount=1, price=Decimal('5.00'))
+        OrderItem.objects.filter(order=self.order, product=self.product).delete()
+        self.assertEqual(self.counts(), {'courier': 1, 'other': None, 'product': 1, 'extra': None})
+        self.assertEqual(reconcile(fix=False), {'couriers': 0, 'products': 0})
+
+    def test_cascade_delete_removes_all_ratings(self):
+        self.order.delete()
+        self.assertEqual(self.counts(), {'courier': 0, 'other': None, 'product': 0, 'extra': None})
+        self.assertEqual(reconcile(fix=False), {'couriers': 0, 'products': 0})
+
+    def test_rating_change_keeps_targets(self):
+        self.order.courier = self.other
+        self.order.save()
+        self.feedback.rating = 2
+        self.feedback.save()
+        rating = CourierRating.objects.get(pk=self.courier.pk)
+        self.assertEqual((rating.ratings_count, rating.ratings_sum), (1, 2))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FIRM_LOOKUP_CHECK_INTERVAL=0)
+class LookupTablesTests(TestCase):
+    """Справочники статусов читаются из памяти процесса и перечитываются после изменения."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.new = OrderStatus.objects.create(name='Новый')
+        cls.paid = PaymentStatus.objects.create(name='Оплачен')
+
+    def setUp(self):
+        cache.clear()
+        lookups._tables.clear()
+
+    def test_table_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(lookups.get_order_status_name(self.new.pk), 'Новый')
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.get_order_status_name(self.new.pk), 'Новый')
+            self.assertIsNone(lookups.get_order_status_name(None))
+
+    def test_save_and_delete_invalidate(self):
+        for model, pk, get_name in ((OrderStatus, self.new.pk, lookups.get_order_status_name),
+                                    (PaymentStatus, self.paid.pk, lookups.get_payment_status_name)):
+            get_name(pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                model.objects.filter(pk=pk).get().save()
+            with self.assertNumQueries(1):
+                get_name(pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                status = model.objects.create(name='Временный')
+            self.assertEqual(get_name(status.pk), 'Временный')
+            deleted_pk = status.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                status.delete()
+            with self.assertNumQueries(1):
+                self.assertIsNone(get_name(deleted_pk))
+
+    def test_other_process_sees_new_version(self):
+        # Другой воркер сменил версию в общем кеше: локальная копия перечитывается при следующей сверке
+        lookups.get_order_status_name(self.new.pk)
+        cache.set(lookups._version_key('order_status'), 'changed', None)
+        with self.assertNumQueries(1):
+            lookups.get_order_status_name(self.new.pk)
+
+
+class OutboxDeliveryTests(TestCase):
+    """Воркер захватывает письма перед отправкой и не считает отправленным то, что бэкенд не отправил."""
+
+    def setUp(self):
+        self.email = OutboxEmail.objects.create(subject='Тема', body='Текст', from_email='shop@example.com',
+                                                to=['client@example.com'])
+
+    def test_delivered_email_is_marked_sent(self):
+        self.assertEqual(deliver_batch(get_connection('django.core.mail.backends.locmem.EmailBackend'), 10)[:2], (1, 0))
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, len(mail.outbox)), (OutboxEmail.STATUS_SENT, 1))
+
+    def test_claimed_batch_is_hidden_from_other_workers(self):
+        token, rows = claim_batch(10)
+        self.assertEqual(rows, [self.email])
+        self.assertEqual(claim_batch(10), (None, []))
+
+    def test_zero_sent_is_a_failed_attempt(self):
+        connection = mock.Mock()
+        connection.send_messages.return_value = 0
+        self.assertEqual(deliver_batch(connection, 10)[:2], (0, 1))
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), (OutboxEmail.STATUS_PENDING, 1))
+        self.assertIn('NotDelivered', self.email.last_error)
+
+
+class OrderTotalsTests(TestCase):
+    """Итоги заказа сдвигаются позициями и не затираются сохранением заказа, прочитанного раньше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=10)
+
+    def test_items_shift_totals(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        item = OrderItem.objects.create(order=order, product=self.product, amount=2, price=Decimal('10.50'))
+        OrderItem.objects.create(order=order, product=self.product, amount=1, price=Decimal('5.00'))
+        item.delete()
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('5.00'), 1))
+
+    def test_saving_stale_order_keeps_totals(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        stale = Order.objects.get(pk=order.pk)
+        OrderItem.objects.create(order=order, product=self.product, amount=3, price=Decimal('10.00'))
+        stale.content = 'Позвонить заранее'
+        stale.save()
+        order.refresh_from_db()
+        self.assertEqual(order.content, 'Позвонить заранее')
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('30.00'), 1))
+
+    def test_recompute_fixes_drift(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        OrderItem.objects.create(order=order, product=self.product, amount=2, price=Decimal('10.00'))
+        Order.objects.filter(pk=order.pk).update(total_amount=0, item_count=0)
+        call_command('recompute_order_totals', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('20.00'), 1))
+
+    def test_recompute_keeps_concurrent_increment(self):
+        order = Order.objects.create(client=self.customer, created_by=self.user)
+        OrderItem.objects.create(order=order, product=self.product, amount=2, price=Decimal('10.00'))
+        Order.objects.filter(pk=order.pk).update(total_amount=0, item_count=0)
+
+        def computed_then_item_added(order_ids, using=None):
+            # Позиция сохраняется между чтением итогов и записью исправления
+            expected = computed_totals(order_ids, using)
+            OrderItem.objects.create(order=order, product=self.product, amount=1, price=Decimal('5.00'))
+            return expected
+
+        out = StringIO()
+        with mock.patch('firm.management.commands.recompute_order_totals.computed_totals', computed_then_item_added):
+            call_command('recompute_order_totals', stdout=out)
+        self.assertIn('Пропущено заказов', out.getvalue())
+        call_command('recompute_order_totals', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('25.00'), 2))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RollupDirtyDaysTests(TestCase):
+    """Правки строк за дни до отметки rollup_sales попадают в агрегаты следующим запуском, без --from."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=10)
+        cls.paid = PaymentStatus.objects.create(name='Оплачен')
+        cls.refunded = PaymentStatus.objects.create(name='Возвращён')
+        cls.past = timezone.now() - timezone.timedelta(days=10)
+        cls.day = timezone.localdate(cls.past)
+        cls.order = Order.objects.create(client=cls.customer, created_by=cls.user)
+        OrderItem.objects.create(order=cls.order, product=cls.product, amount=1, price=Decimal('10.00'))
+        cls.payment = Payment.objects.create(order=cls.order, client=cls.customer, payment_status=cls.paid,
+                                             amount=Decimal('10.00'), created_by=cls.user)
+        Order.objects.filter(pk=cls.order.pk).update(creation_date=cls.past)
+        Payment.objects.filter(pk=cls.payment.pk).update(payment_date=cls.past)
+
+    def rollup(self):
+        call_command('rollup_sales', stdout=StringIO())
+
+    def test_item_added_to_old_order(self):
+        self.rollup()
+        self.assertEqual(DailyProductSales.objects.get(day=self.day).quantity, 1)
+        OrderItem.objects.create(order=self.order, product=self.product, amount=2, price=Decimal('10.00'))
+        self.assertTrue(DirtySalesDay.objects.filter(day=self.day).exists())
+        self.rollup()
+        self.assertEqual(DailyProductSales.objects.get(day=self.day).quantity, 3)
+        self.assertFalse(DirtySalesDay.objects.exists())
+
+    def test_bulk_payment_status_change(self):
+        self.rollup()
+        chunked_update(Payment.objects.filter(pk=self.payment.pk), {'payment_status': self.refunded})
+        self.rollup()
+        totals = DailyPaymentTotals.objects.filter(day=self.day)
+        self.assertEqual(list(totals.values_list('payment_status_id', flat=True)), [self.refunded.pk])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SalesReportViewTests(TestCase):
+    def setUp(self):
+        staff = get_user_model().objects.create_user(username='staff', password='pass', is_staff=True)
+        self.client.force_login(staff)
+
+    def test_period(self):
+        response = self.client.get('/firm/reports/sales/', {'date_from': '2024-02-01', 'date_to': '2024-02-29'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['date_from'], date(2024, 2, 1))
+
+    def test_invalid_date(self):
+        # Формат верный, но такого дня нет: ответ 400, а не 500
+        for params in ({'date_to': '2024-02-30'}, {'date_from': '2023-13-01'}):
+            self.assertEqual(self.client.get('/firm/reports/sales/', params).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FIRM_METRICS_TOKEN='secret-token')
+class MetricsAccessTests(TestCase):
+    def test_token_or_staff_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret-token').status_code, 200)
+        staff = get_user_model().objects.create_user(username='staff', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(FIRM_METRICS_TOKEN=None)
+    def test_no_token_configured(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+    async def test_async_request(self):
+        # Под ASGI цепочка middleware остаётся асинхронной, и метрики по-прежнему собираются
+        for middleware in (QueryMetricsMiddleware, ReplicaRoutingMiddleware, TenantMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(self.async_view)))
+        headers = {'Authorization': 'Bearer secret-token'}
+        await AsyncClient().get('/metrics', headers=headers)
+        response = await AsyncClient().get('/metrics', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('firm_request_queries_count{view="metrics"}', response.content.decode())
+
+    @staticmethod
+    async def async_view(request):
+        return HttpResponse()
+
+
+class InsertRowsTests(TestCase):
+    """insert_rows сохраняет заданные даты, не трогая общие определения полей модели."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='owner', password='pass')
+
+    def test_dates_are_kept_and_fields_untouched(self):
+        past = timezone.now() - timezone.timedelta(days=30)
+        insert_rows(Client, [Client(pk=1000, surname='Иванов', name='Иван', email='old@example.com',
+                                    registration_date=past, created_by=self.user)])
+        self.assertEqual(Client.objects.get(pk=1000).registration_date, past)
+        fresh = Client.objects.create(surname='Петров', name='Пётр', email='new@example.com', created_by=self.user)
+        self.assertGreater(fresh.registration_date, past + timezone.timedelta(days=29))
+
+    def test_update_conflicts_overwrites_existing_row(self):
+        client = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=self.user)
+        client.surname = 'Сидоров'
+        self.assertEqual(insert_rows(Client, [client], update_conflicts=True), 1)
+        self.assertEqual(Client.objects.get(pk=client.pk).surname, 'Сидоров')
+        self.assertEqual(Client.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, FIRM_REPLICA_PIN_SECONDS=5)
+class ReplicaPinTests(TestCase):
+    """Окно чтения из основной базы после записи не короче замеренного отставания реплики."""
+
+    def setUp(self):
+        cache.clear()
+
+    def pin_cookie(self):
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        with mock.patch.object(routers, 'replica_configured', return_value=True):
+            response = middleware(RequestFactory().post('/'))
+        return response.cookies[ReplicaRoutingMiddleware.PIN_COOKIE]['max-age']
+
+    def test_pin_follows_measured_lag(self):
+        self.assertEqual(self.pin_cookie(), 5)
+        routers.record_lag(12.3)
+        self.assertEqual(self.pin_cookie(), 13)
+        routers.record_lag(0.4)
+        self.assertEqual(self.pin_cookie(), 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TenantPlacementTests(TestCase):
+    """Арендатор закрепляется за шардом при первой записи и остаётся в нём, когда шардов становится больше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.user_ids = [users.create_user(username=f'tenant{i}', password='pass').pk for i in range(20)]
+
+    def setUp(self):
+        cache.clear()
+
+    def resolve(self, shards, assign=False):
+        cache.clear()
+        with override_settings(FIRM_SHARDS=shards):
+            return {pk: sharding.shard_for_user(pk, assign) for pk in self.user_ids}
+
+    def test_existing_tenant_keeps_shard_after_shard_added(self):
+        before = self.resolve(['default', 'shard_1'], assign=True)
+        self.assertEqual(TenantPlacement.objects.count(), len(self.user_ids))
+        # Одно кольцо увело бы часть арендаторов в новый пустой шард
+        ring = sharding.HashRing(['default', 'shard_1', 'shard_2'])
+        self.assertTrue(any(ring.node_for(pk) != shard for pk, shard in before.items()))
+        self.assertEqual(self.resolve(['default', 'shard_1', 'shard_2']), before)
+
+    def test_new_tenant_is_placed_by_ring(self):
+        shards = ['default', 'shard_1', 'shard_2']
+        ring = sharding.HashRing(shards)
+        self.assertEqual(self.resolve(shards), {pk: ring.node_for(pk) for pk in self.user_ids})
+
+    def test_read_does_not_pin(self):
+        shards = ['default', 'shard_1']
+        with override_settings(FIRM_SHARDS=shards):
+            shard = sharding.shard_for_user(self.user_ids[0])
+            self.assertFalse(TenantPlacement.objects.exists())
+            # Первая запись закрепляет тот же шард, хотя чтение уже закешировало незакреплённый ответ
+            self.assertEqual(sharding.shard_for_user(self.user_ids[0], assign=True), shard)
+            self.assertEqual(TenantPlacement.objects.get().shard, shard)
+            self.assertEqual(sharding.shard_for_user(self.user_ids[0]), shard)
+
+    def test_only_unsafe_requests_pin(self):
+        request = RequestFactory().get('/firm/clients/')
+        request.user = get_user_model().objects.get(pk=self.user_ids[0])
+        with override_settings(FIRM_SHARDS=['default', 'shard_1']):
+            TenantMiddleware.placement(request)
+            self.assertFalse(TenantPlacement.objects.exists())
+            request.method = 'POST'
+            TenantMiddleware.placement(request)
+            self.assertTrue(TenantPlacement.objects.filter(user_id=self.user_ids[0]).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ApiClientDeleteTests(TestCase):
+    """Удаление клиента через API идёт порциями deletion.delete_client и отмечает дни агрегатов для пересчёта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=10)
+        cls.status = PaymentStatus.objects.create(name='Оплачен')
+        cls.past = timezone.now() - timezone.timedelta(days=10)
+        order = Order.objects.create(client=cls.customer, created_by=cls.user)
+        OrderItem.objects.create(order=order, product=cls.product, amount=1, price=Decimal('10.00'))
+        Payment.objects.create(order=order, client=cls.customer, payment_status=cls.status, amount=Decimal('10.00'),
+                               created_by=cls.user)
+        Order.objects.filter(pk=order.pk).update(creation_date=cls.past)
+        Payment.objects.filter(order=order).update(payment_date=cls.past)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def delete(self):
+        return self.client.delete(f'/firm/api/clients/{self.customer.pk}/')
+
+    def test_small_history_is_purged_inline(self):
+        response = self.delete()
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Client.objects.exists())
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(DirtySalesDay.objects.values_list('day', flat=True)), [timezone.localdate(self.past)])
+
+    @override_settings(FIRM_PURGE_INLINE_ORDERS=0)
+    def test_large_history_is_queued(self):
+        response = self.delete()
+        self.assertEqual(response.status_code, 202)
+        job = ClientPurgeJob.objects.get()
+        self.assertEqual(response.json(), {'job': job.pk, 'status': ClientPurgeJob.STATUS_PENDING})
+        self.assertTrue(Client.objects.filter(pk=self.customer.pk).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImportClientsTests(TestCase):
+    """import_clients: проверка строк, дубликаты (в базе, в файле и вставленные параллельно), порции и поиск."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        Client.objects.create(surname='Старов', name='Пётр', email='taken@example.com', created_by=cls.user)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'clients.csv'
+
+    def run_import(self, rows, chunk_size=2):
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['surname', 'name', 'email'])
+            writer.writerows(rows)
+        call_command('import_clients', str(self.path), created_by='owner', chunk_size=chunk_size, stdout=StringIO())
+        with open(f'{self.path}.rejected.csv', newline='', encoding='utf-8') as f:
+            return {int(row['line']): row['errors'] for row in csv.DictReader(f)}
+
+    def test_valid_invalid_and_duplicate_rows(self):
+        rejected = self.run_import([
+            ['Иванов', 'Иван', 'ivan@example.com'],
+            ['ivanov', 'Иван', 'lower@example.com'],
+            ['Петров', 'Пётр', 'taken@example.com'],
+            ['Сидоров', 'Сидор', 'sidor@example.com'],
+            ['Сидорова', 'Анна', 'sidor@example.com'],
+            ['Козлов', 'Олег', 'oleg@example.com'],
+        ])
+        self.assertEqual(set(rejected), {3, 4, 6})
+        self.assertIn('Фамилия', rejected[3])
+        self.assertIn('уже существует', rejected[4])
+        self.assertEqual(set(Client.objects.filter(created_by=self.user).values_list('email', flat=True)),
+                         {'taken@example.com', 'ivan@example.com', 'sidor@example.com', 'oleg@example.com'})
+
+    def test_imported_clients_are_searchable(self):
+        self.run_import([['Иванов', 'Иван', 'ivan@example.com'], ['Козлов', 'Олег', 'oleg@example.com'],
+                         ['Лебедев', 'Олег', 'lebedev@example.com']])
+        self.assertEqual([client.email for client in search.search(Client.objects.all(), 'Лебедев')],
+                         ['lebedev@example.com'])
+
+    def test_concurrent_duplicate_rejects_only_its_row(self):
+        # Проверка дубликатов «не увидела» email, добавленный параллельно: порция повторяется построчно
+        with mock.patch.object(ImportClientsCommand, 'existing_emails', return_value=set()):
+            rejected = self.run_import([['Иванов', 'Иван', 'ivan@example.com'],
+                                        ['Петров', 'Пётр', 'taken@example.com'],
+                                        ['Козлов', 'Олег', 'oleg@example.com']])
+        self.assertEqual(list(rejected), [3])
+        self.assertEqual(Client.objects.count(), 3)
+        self.assertEqual(search.search(Client.objects.all(), 'Иванов')[0].email, 'ivan@example.com')
+
+
+class BatchValidationTests(TestCase):
+    """validate_many/validate_record дают те же ошибки по полям, что ClientCreateForm на тех же записях."""
+
+    RECORDS = [
+        {'surname': 'Иванов', 'name': 'Иван', 'email': 'ivan@example.com'},
+        {'surname': 'иванов', 'name': 'Иван', 'email': 'lower@example.com'},
+        {'surname': 'Ivanov', 'name': 'Ivan', 'email': 'latin@example.com'},
+        {'surname': 'Петров', 'name': 'Пётр', 'email': 'petr@example.museum'},
+        {'surname': 'Сидоров-Петров', 'name': 'Анна1', 'email': 'anna@example.co.uk'},
+    ]
+
+    def form_errors(self, record):
+        form = ClientCreateForm(data=record)
+        return {field: [error['message'] for error in errors] for field, errors in form.errors.get_json_data().items()}
+
+    def test_matches_form_errors(self):
+        errors = validate_many(self.RECORDS)
+        for index, record in enumerate(self.RECORDS):
+            with self.subTest(record=record):
+                expected = self.form_errors(record)
+                self.assertEqual(errors.get(index, {}), expected)
+                self.assertEqual(validate_record(record), expected)
+        # Ошибки возвращаются только для некорректных записей
+        self.assertEqual(sorted(errors), [1, 2, 3, 4])
+
+    def test_structure_for_missing_and_non_string_values(self):
+        records = [{'surname': 'Иванов', 'name': None}, {'surname': 'Иванов', 'name': 'Иван', 'email': 42}]
+        errors = validate_many(records)
+        self.assertEqual(errors, {0: {'name': [FIRST_NAME_MESSAGE], 'email': [EMAIL_MESSAGE]},
+                                  1: {'email': [EMAIL_MESSAGE]}})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SeedScaleTests(TestCase):
+    """Генератор данных в малом масштабе: все таблицы заполнены, производные таблицы сходятся с исходными."""
+
+    def test_tiny_seed(self):
+        call_command('seed_scale', clients=20, chunk_size=7, days=30, stdout=StringIO())
+        self.assertEqual(Client.objects.count(), 20)
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertTrue(OrderItem.objects.exists() and Payment.objects.exists())
+        # Итоги заказов и рейтинги посчитаны так же, как их поддерживают сигналы
+        call_command('recompute_order_totals', verify=True, stdout=StringIO())
+        self.assertEqual(reconcile(fix=False), {'couriers': 0, 'products': 0})
+        self.assertTrue(search.search(Client.objects.all(), Client.objects.first().surname))
+
+        with self.assertRaises(CommandError):
+            call_command('seed_scale', clients=5, stdout=StringIO())
+        call_command('seed_scale', clients=5, append=True, skip_derived=True, stdout=StringIO())
+        self.assertEqual(Client.objects.count(), 25)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchiveTests(TestCase):
+    """Перенос закрытых заказов в архив и чтение периодов, которые в него заходят."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', patronymic='Иванович')
+        cls.customer = Client.objects.create(surname='Иванов', name='Иван', email='c@example.com', created_by=cls.user)
+        cls.product = Product.objects.create(product_name='Товар', price=Decimal('10.00'), stock=10)
+        cls.delivered = OrderStatus.objects.create(name='Доставлен')
+        cls.accepted = OrderStatus.objects.create(name='Принят')
+        cls.paid = PaymentStatus.objects.create(name='Оплачен')
+        cls.past = timezone.now() - timezone.timedelta(days=60)
+        cls.old_closed = cls.make_order(cls.delivered, cls.past)
+        cls.old_open = cls.make_order(cls.accepted, cls.past)
+        cls.recent = cls.make_order(cls.delivered, timezone.now())
+
+    @classmethod
+    def make_order(cls, status, created):
+        order = Order.objects.create(client=cls.customer, created_by=cls.user, order_status=status)
+        OrderItem.objects.create(order=order, product=cls.product, amount=1, price=Decimal('10.00'))
+        payment = Payment.objects.create(order=order, client=cls.customer, payment_status=cls.paid,
+                                         amount=Decimal('10.00'), created_by=cls.user)
+        Feedback.objects.create(order=order, client=cls.customer, rating=5, created_by=cls.user)
+        Order.objects.filter(pk=order.pk).update(creation_date=created)
+        Payment.objects.filter(pk=payment.pk).update(payment_date=created)
+        return order
+
+    def archive(self):
+        return archive.archive_before(timezone.now() - timezone.timedelta(days=30))[0]
+
+    def test_moves_only_old_closed_orders(self):
+        moved = self.archive()
+        self.assertEqual(moved, {Order: 1, OrderItem: 1, Payment: 1, Feedback: 1})
+        self.assertEqual(list(ArchivedOrder.objects.values_list('pk', flat=True)), [self.old_closed.pk])
+        for model in (ArchivedOrderItem, ArchivedPayment, ArchivedFeedback):
+            self.assertEqual(list(model.objects.values_list('order_id', flat=True)), [self.old_closed.pk])
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.old_open.pk, self.recent.pk})
+        # Повторный запуск ничего не находит
+        self.assertEqual(self.archive()[Order], 0)
+
+    def test_move_batch_keeps_columns(self):
+        archive.move_batch([self.old_open.pk])
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.pk, archived.order_status_id, archived.total_amount, archived.item_count),
+                         (self.old_open.pk, self.accepted.pk, Decimal('10.00'), 1))
+        self.assertFalse(Order.objects.filter(pk=self.old_open.pk).exists())
+
+    def test_horizons_choose_sources(self):
+        self.assertEqual(archive.with_archive(Order, None), [Order])
+        self.archive()
+        self.assertEqual(archive.get_horizon(Order), self.past)
+        self.assertEqual(archive.get_horizon(Payment), self.past)
+        self.assertEqual(archive.with_archive(Order, None), [Order, ArchivedOrder])
+        self.assertEqual(archive.with_archive(OrderItem, self.past), [OrderItem, ArchivedOrderItem])
+        self.assertEqual(archive.with_archive(Order, timezone.now() - timezone.timedelta(days=1)), [Order])
+        self.assertEqual(archive.with_archive(Client, None), [Client])
+
+    def test_export_merges_archive(self):
+        self.archive()
+        self.client.force_login(self.user)
+        response = self.client.get('/firm/export/orders/', {'format': 'ndjson'})
+        ids = [json.loads(line)['id'] for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(ids, [self.old_closed.pk, self.old_open.pk, self.recent.pk])
+        response = self.client.get('/firm/export/orders/', {'format': 'ndjson',
+                                                           'date_from': timezone.localdate().isoformat()})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+    def test_rollups_read_archive(self):
+        day = timezone.localdate(self.past)
+        call_command('rollup_sales', stdout=StringIO())
+        before = DailyProductSales.objects.get(day=day).quantity
+        call_command('archive_before', (timezone.localdate() - timezone.timedelta(days=30)).isoformat(),
+                     stdout=StringIO())
+        self.assertTrue(DirtySalesDay.objects.filter(day=day).exists())
+        call_command('rollup_sales', stdout=StringIO())
+        self.assertEqual(DailyProductSales.objects.get(day=day).quantity, before)
+        self.assertEqual(DailyPaymentTotals.objects.get(day=day).payments_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewsTests(TestCase):
+    """Асинхронные страницы чтения отдают то же, что синхронные, включая анонима и обход шардов сотрудником."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.alice = users.create_user('alice', 'alice@example.com', 'pw', patronymic='Ивановна')
+        cls.bob = users.create_user('bob', 'bob@example.com', 'pw', patronymic='Петрович')
+        cls.staff = users.create_user('staff', 'staff@example.com', 'pw', patronymic='Сидорович', is_staff=True)
+        for i in range(5):
+            Client.objects.create(surname=f'Иванов{i}', name='Иван', email=f'a{i}@example.com', created_by=cls.alice)
+        cls.foreign = Client.objects.create(surname='Петров', name='Пётр', email='b@example.com', created_by=cls.bob)
+        cls.own = Client.objects.filter(created_by=cls.alice).first()
+
+    def setUp(self):
+        cache.clear()
+        self.async_client = AsyncClient()
+
+    def login(self, user):
+        # force_login работает с базой синхронно, поэтому вызывается до асинхронной части теста
+        self.client.force_login(user)
+        self.async_client.force_login(user)
+
+    @staticmethod
+    def ids(response, name):
+        return [obj.pk for obj in response.context[name]]
+
+    async def compare_lists(self, params):
+        sync = await sync_to_async(self.client.get)('/firm/clients/', params)
+        response = await self.async_client.get('/firm/async/clients/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response, 'clients'), self.ids(sync, 'clients'))
+        self.assertEqual((response.context['next_cursor'], response.context['prev_cursor']),
+                         (sync.context['next_cursor'], sync.context['prev_cursor']))
+        return response
+
+    async def test_index_matches_sync(self):
+        sync = await sync_to_async(self.client.get)('/')
+        await sync_to_async(cache.clear)()
+        response = await self.async_client.get('/firm/async/')
+        self.assertEqual(response.status_code, 200)
+        for name in ('latest_clients', 'latest_orders', 'latest_products'):
+            self.assertEqual(self.ids(response, name), self.ids(sync, name))
+
+    async def test_client_list_matches_sync(self):
+        await sync_to_async(self.login)(self.alice)
+        first = await self.compare_lists({'page_size': 2})
+        self.assertEqual(len(first.context['clients']), 2)
+        await self.compare_lists({'page_size': 2, 'after': first.context['next_cursor']})
+        self.assertEqual((await self.async_client.get('/firm/async/clients/', {'after': 'не-курсор'})).status_code,
+                         404)
+
+    async def test_anonymous(self):
+        response = await self.compare_lists({})
+        self.assertEqual(self.ids(response, 'clients'), [])
+        response = await self.async_client.get(f'/firm/async/clients/{self.own.pk}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/login', response['Location'])
+
+    async def test_client_detail(self):
+        await sync_to_async(self.login)(self.alice)
+        response = await self.async_client.get(f'/firm/async/clients/{self.own.pk}/')
+        self.assertEqual((response.status_code, response.context['client'].pk), (200, self.own.pk))
+        self.assertEqual((await self.async_client.get(f'/firm/async/clients/{self.foreign.pk}/')).status_code, 404)
+
+    async def test_staff_fans_out(self):
+        # Ветка шардирования: сотрудник собирает страницу и ищет клиента через sharding.keyset_page/get_visible
+        await sync_to_async(self.login)(self.staff)
+        with mock.patch.object(sharding, 'fans_out', return_value=True) as fans_out, \
+                mock.patch.object(sharding, 'keyset_page', wraps=sharding.keyset_page) as keyset_page:
+            response = await self.compare_lists({'page_size': 4})
+            self.assertEqual(len(response.context['clients']), 4)
+            response = await self.async_client.get(f'/firm/async/clients/{self.foreign.pk}/')
+        self.assertTrue(fans_out.called)
+        self.assertEqual(keyset_page.call_count, 2)
+        self.assertEqual(response.context['client'].pk, self.foreign.pk)
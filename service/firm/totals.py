@@ -0,0 +1,56 @@
+# firm/totals.py
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+from .models import Order, OrderItem
+
+LINE_TOTAL = ExpressionWrapper(F('amount') * F('price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+CENTS = Decimal('0.01')
+
+
+def line_total(amount, price):
+    # Значения могут прийти строками (например, OrderItem.objects.create(price='10.50')), до сохранения Django их не приводит
+    return (Decimal(str(price)) * int(amount)).quantize(CENTS)
+
+
+def apply_delta(order_id, total_delta, count_delta, using=None):
+    """Сдвигает итоги заказа одним UPDATE с F-выражениями, без чтения строки заказа; using — база заказа."""
+    if not total_delta and not count_delta:
+        return
+    Order.objects.using(using).filter(pk=order_id).update(
+        total_amount=F('total_amount') + total_delta,
+        item_count=F('item_count') + count_delta,
+    )
+
+
+def item_saved(item, old, using=None):
+    """Учитывает создание или изменение позиции; old — значения до сохранения (order_id, amount, price) или None."""
+    new_total = line_total(item.amount, item.price)
+    if old is None:
+        apply_delta(item.order_id, new_total, 1, using)
+        return
+    old_total = line_total(old['amount'], old['price'])
+    if old['order_id'] == item.order_id:
+        apply_delta(item.order_id, new_total - old_total, 0, using)
+    else:
+        # Позицию перенесли в другой заказ
+        apply_delta(old['order_id'], -old_total, -1, using)
+        apply_delta(item.order_id, new_total, 1, using)
+
+
+def item_deleted(item, using=None):
+    # При каскадном удалении самого заказа UPDATE просто не найдёт строку
+    apply_delta(item.order_id, -line_total(item.amount, item.price), -1, using)
+
+
+def computed_totals(order_ids, using=None):
+    """Пересчитывает итоги по позициям для набора заказов: {order_id: (total_amount, item_count)}."""
+    rows = (OrderItem.objects.using(using).filter(order_id__in=order_ids)
+            .values('order_id')
+            .annotate(total=Sum(LINE_TOTAL), count=Count('id'))
+            .values_list('order_id', 'total', 'count'))
+    totals = {order_id: (Decimal(0), 0) for order_id in order_ids}
+    for order_id, total, count in rows:
+        totals[order_id] = (Decimal(total or 0).quantize(CENTS), count)
+    return totals
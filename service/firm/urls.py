@@ -25,6 +25,23 @@ urlpatterns = [
     # URL для удаления клиента (с передачей id клиента в URL)
     path('clients/<int:pk>/delete/', views.client_delete, name='client_delete'),
 
+    # Асинхронные версии страниц для чтения (выигрыш дают при запуске через ASGI)
+    path('async/', views.index_async, name='index_async'),
+    path('async/clients/', views.AsyncClientListView.as_view(), name='client_list_async'),
+    path('async/clients/<int:pk>/', views.client_detail_async, name='client_detail_async'),
+
+    # Потоковая выгрузка (clients, orders, payments): ?format=csv|ndjson&date_from=...&date_to=...
+    path('export/<slug:resource>/', views.export, name='export'),
+
+    # Полнотекстовый поиск
+    path('search/', views.search_view, name='search'),
+
+    # Отчёт о продажах по дневным агрегатам
+    path('reports/sales/', views.sales_report, name='sales_report'),
+
+    # JSON API: clients, orders, order-items, payments, products (?fields=, ?after=/?before=, ?page_size=)
+    path('api/<slug:resource>/', views.api_list, name='api_list'),
+    path('api/<slug:resource>/<int:pk>/', views.api_detail, name='api_detail'),
 
     path('register/', views.register, name='register'),
     path('login/', CustomLoginView.as_view(), name='login'), # Убедитесь, что используете CustomLoginView.as_view()
@@ -0,0 +1,71 @@
+# firm/validation.py
+import re
+
+from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator
+
+# Регулярные выражения (строки оставлены для миграций и внешнего кода, проверки идут по скомпилированным)
+NAME_REGEX = r'^[А-ЯЁ][а-яё]+$'
+# Улучшенная регулярка для email (поддержка доменов до 5 уровней, только латиница)
+EMAIL_REGEX = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,5}(\.[a-zA-Z]{2,3}){0,4}$'
+PASSWORD_REGEX = r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$'
+
+NAME_RE = re.compile(NAME_REGEX)
+EMAIL_RE = re.compile(EMAIL_REGEX)
+PASSWORD_RE = re.compile(PASSWORD_REGEX)
+
+NAME_MESSAGE = "Поле должно начинаться с прописной буквы и содержать только кириллические буквы."
+FIRST_NAME_MESSAGE = "Имя должно начинаться с прописной буквы и содержать только кириллические буквы."
+SURNAME_MESSAGE = "Фамилия должна начинаться с прописной буквы и содержать только кириллические буквы."
+PATRONYMIC_MESSAGE = "Отчество должно начинаться с прописной буквы и содержать только кириллические буквы."
+EMAIL_MESSAGE = "Введите корректный email адрес (латинские буквы, @ и домен до 5 уровней)."
+PASSWORD_MESSAGE = ("Пароль должен быть не менее 8 символов, содержать прописные и строчные латинские буквы, "
+                    "цифры и специальные символы.")
+
+# Валидатор получает строку, чтобы миграции не менялись; re.compile кеширует шаблон, так что объект тот же, что NAME_RE
+name_validator = RegexValidator(regex=NAME_REGEX, message=NAME_MESSAGE)
+
+# Правила для записей клиента: поле -> (скомпилированный шаблон, сообщение об ошибке)
+CLIENT_RULES = {
+    'surname': (NAME_RE, SURNAME_MESSAGE),
+    'name': (NAME_RE, FIRST_NAME_MESSAGE),
+    'email': (EMAIL_RE, EMAIL_MESSAGE),
+}
+
+
+def check(value, pattern, message):
+    """Проверяет значение по шаблону и возвращает его; иначе бросает ValidationError (подходит для clean_<поле>)."""
+    if not pattern.match(value or ''):
+        raise ValidationError(message)
+    return value
+
+
+def validate_record(record, rules=CLIENT_RULES):
+    """Возвращает {поле: [сообщения]} для одной записи; пустой словарь, если запись корректна."""
+    errors = {}
+    for field, (pattern, message) in rules.items():
+        value = record.get(field)
+        if not isinstance(value, str) or not pattern.match(value):
+            errors[field] = [message]
+    return errors
+
+
+def validate_many(records, rules=CLIENT_RULES):
+    """
+    Проверяет пачку записей (словарей) без создания форм.
+
+    Возвращает {индекс записи: {поле: [сообщения]}} только для некорректных записей,
+    так что пустой словарь означает, что вся пачка прошла проверку.
+    """
+    # Локальные ссылки экономят поиск атрибутов в горячем цикле
+    compiled = [(field, pattern.match, message) for field, (pattern, message) in rules.items()]
+    errors = {}
+    for index, record in enumerate(records):
+        record_errors = None
+        for field, match, message in compiled:
+            value = record.get(field)
+            if not isinstance(value, str) or match(value) is None:
+                if record_errors is None:
+                    record_errors = errors[index] = {}
+                record_errors[field] = [message]
+    return errors
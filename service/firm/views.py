@@ -1,24 +1,31 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import hmac
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
 from .forms import RegistrationForm, LoginForm, CustomPasswordResetForm, CustomSetPasswordForm, ClientCreateForm, ClientUpdateForm, ClientViewForm
 from .models import CustomUser, Client, Order, Product, OrderStatus, PaymentStatus, Courier, OrderItem, Payment, Feedback, Category # Импортируем все модели
+from django.views import View
+from django.views.decorators.http import require_http_methods
 from django.views.generic import ListView
 from django.contrib.auth.views import LoginView, LogoutView, PasswordResetView, PasswordResetDoneView, PasswordResetConfirmView, PasswordResetCompleteView
 from django.contrib.auth import login # Импортируем функцию login (если нужно автоматический вход после регистрации)
+from . import api, deletion, exports, metrics, rollups, search, sharding
+from .cache import aget_home_page_data, get_home_page_data
+from .pagination import InvalidCursor, build_page, keyset_queryset
 
 
 # Представление для главной страницы
 def index(request):
-    latest_clients = Client.objects.order_by('-registration_date')[:5]
-    latest_orders = Order.objects.order_by('-creation_date')[:5]
-    latest_products = Product.objects.order_by('-id')[:5]
-
-    context = {
-        'latest_clients': latest_clients,
-        'latest_orders': latest_orders,
-        'latest_products': latest_products,
-    }
+    # Блоки «последние клиенты/заказы/продукты» берутся из кеша и сбрасываются сигналами (firm/signals.py)
+    context = get_home_page_data()
     return render(request, 'firm/index.html', context)
 
 # Представление для регистрации
@@ -86,25 +93,128 @@ class CustomPasswordResetCompleteView(PasswordResetCompleteView):
     template_name = 'firm/password_reset_complete.html'
 
 
+def _page_size(request):
+    # Размер страницы настраивается в settings и может быть уменьшен/увеличен через ?page_size= (не больше максимума)
+    default = getattr(settings, 'FIRM_CLIENT_LIST_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'FIRM_MAX_PAGE_SIZE', 200)
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
 # Представление для просмотра списка клиентов (Class-Based View)
 # @login_required # Если страница требует входа, используйте декоратор
 class ClientListView(ListView):
     model = Client
     template_name = 'firm/client_list.html'
     context_object_name = 'clients'
+    # Keyset-пагинация по (registration_date, id): глубокие страницы стоят столько же, сколько первая
+    cursor_field = 'registration_date'
 
     def get_queryset(self):
-        # Логика фильтрации по правам доступа
-        if self.request.user.is_authenticated: # Проверка аутентификации
-            if self.request.user.is_staff: # Проверка на админа (предполагая, что is_staff означает админа)
-                return Client.objects.all()
+        # Только колонки, которые выводит шаблон; created_by_id сравнивается без загрузки пользователя.
+        # Права доступа проверяются в самом запросе (OwnedQuerySet.visible_to)
+        return Client.objects.visible_to(self.request.user).only(
+            'id', 'surname', 'name', 'email', 'registration_date', 'created_by_id'
+        )
+
+    def get_paginate_by(self, queryset):
+        return _page_size(self.request)
+
+    def paginate_queryset(self, queryset, page_size):
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        try:
+            # При шардировании сотрудник видит клиентов всех шардов: страница сливается из страниц каждого
+            page = sharding.keyset_page(queryset, self.request.user, self.cursor_field, page_size,
+                                        after=after, before=before)
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы.')
+        return None, page, page.object_list, page.has_next or page.has_previous
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context['page_obj']
+        context['page_size'] = self.get_paginate_by(None)
+        context['next_cursor'] = page.next_cursor
+        context['prev_cursor'] = page.prev_cursor
+        return context
+
+# --- Асинхронные версии представлений для чтения (для запуска через ASGI, service/asgi.py) ---
+
+async def _auser(request):
+    # В Django 4.2 нет request.auser(): пользователь и сессия загружаются лениво синхронным ORM,
+    # поэтому вычисляем их один раз в потоке, дальше объект пользователя уже загружен
+    user = request.user
+    await sync_to_async(lambda: user.is_authenticated)()
+    return user
+
+
+async def index_async(request):
+    await _auser(request)  # base.html выводит имя пользователя
+    context = await aget_home_page_data()
+    return render(request, 'firm/index.html', context)
+
+
+class AsyncClientListView(View):
+    cursor_field = ClientListView.cursor_field
+
+    async def get(self, request):
+        user = await _auser(request)
+        queryset = Client.objects.visible_to(user).only(
+            'id', 'surname', 'name', 'email', 'registration_date', 'created_by_id'
+        )
+        page_size = _page_size(request)
+        after, before = request.GET.get('after'), request.GET.get('before')
+        try:
+            if sharding.fans_out(user, Client):
+                page = await sync_to_async(sharding.keyset_page)(queryset, user, self.cursor_field, page_size,
+                                                                 after=after, before=before)
             else:
-                # Обычный пользователь видит только своих клиентов (по created_by)
-                return Client.objects.filter(created_by=self.request.user)
+                rows = keyset_queryset(queryset, self.cursor_field, page_size, after=after, before=before)
+                page = build_page([client async for client in rows], self.cursor_field, page_size,
+                                  after=after, before=before)
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы.')
+        return render(request, 'firm/client_list.html', {
+            'clients': page.object_list,
+            'object_list': page.object_list,
+            'page_obj': page,
+            'is_paginated': page.has_next or page.has_previous,
+            'page_size': page_size,
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        })
+
+
+async def client_detail_async(request, pk):
+    user = await _auser(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    queryset = Client.objects.visible_to(user).select_related('created_by')
+    try:
+        if sharding.fans_out(user, Client):
+            client = await sync_to_async(sharding.get_visible)(queryset, user, pk=pk)
         else:
-            # Если пользователь не аутентифицирован, возвращаем пустой queryset или что-то другое
-            # Если страница защищена @login_required, эта ветка не будет достигнута.
-            return Client.objects.none() # Возвращаем пустой список для неаутентифицированных
+            client = await queryset.aget(pk=pk)
+    except Client.DoesNotExist:
+        raise Http404('Клиент не найден.')
+
+    form = ClientViewForm(instance=client)
+    return render(request, 'firm/client_detail.html', {'client': client, 'form': form})
+
+
+def _get_client(request, pk, queryset=None):
+    # Проверка прав — в WHERE (visible_to); при шардировании сотрудник ищет клиента во всех шардах,
+    # а изменение и удаление потом уходят в шард, из которого клиент прочитан
+    queryset = (queryset if queryset is not None else Client.objects.all()).visible_to(request.user)
+    try:
+        return sharding.get_visible(queryset, request.user, pk=pk)
+    except Client.DoesNotExist:
+        raise Http404('Клиент не найден.')
+
 
 # Представление для создания клиента
 @login_required
@@ -127,11 +237,8 @@ def client_create(request):
 # Представление для детального просмотра клиента
 @login_required
 def client_detail(request, pk):
-    client = get_object_or_404(Client, pk=pk)
-    # Проверка прав доступа
-    if not request.user.is_staff and client.created_by != request.user:
-        messages.error(request, 'У вас нет прав для просмотра этого клиента.')
-        return redirect('firm:client_list')
+    # Один запрос с проверкой прав в WHERE: чужой клиент для пользователя просто не существует (404)
+    client = _get_client(request, pk, Client.objects.select_related('created_by'))
 
     form = ClientViewForm(instance=client)
     return render(request, 'firm/client_detail.html', {'client': client, 'form': form})
@@ -140,11 +247,7 @@ def client_detail(request, pk):
 # Представление для обновления клиента
 @login_required
 def client_update(request, pk):
-    client = get_object_or_404(Client, pk=pk)
-    # Проверка прав доступа
-    if not request.user.is_staff and client.created_by != request.user:
-        messages.error(request, 'У вас нет прав для редактирования этого клиента.')
-        return redirect('firm:client_list')
+    client = _get_client(request, pk)
 
     if request.method == 'POST':
         form = ClientUpdateForm(request.POST, instance=client)
@@ -162,19 +265,154 @@ def client_update(request, pk):
 # Представление для удаления клиента
 @login_required
 def client_delete(request, pk):
-    client = get_object_or_404(Client, pk=pk)
-    # Проверка прав доступа
-    if not request.user.is_staff and client.created_by != request.user:
-        messages.error(request, 'У вас нет прав для удаления этого клиента.')
-        return redirect('firm:client_list')
+    client = _get_client(request, pk)
 
     if request.method == 'POST':
-        client.delete()
-        messages.success(request, 'Клиент успешно удален!')
+        # Большая история удаляется в фоне (purge_clients), чтобы запрос не держал блокировку записи
+        if deletion.delete_client(client, request.user) is None:
+            messages.success(request, 'Клиент успешно удален!')
+        else:
+            messages.success(request, 'Удаление клиента и его истории запущено, оно займёт некоторое время.')
         return redirect('firm:client_list')
 
     return render(request, 'firm/client_confirm_delete.html', {'client': client})
 
+# Потоковая выгрузка клиентов, заказов и платежей в CSV/NDJSON
+@login_required
+def export(request, resource):
+    if resource not in exports.EXPORTS:
+        raise Http404('Неизвестный тип выгрузки.')
+    config = exports.EXPORTS[resource]
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest('Формат должен быть csv или ndjson.')
+    try:
+        date_from = exports.parse_bound(request.GET.get('date_from'))
+        date_to = exports.parse_bound(request.GET.get('date_to'), upper=True)
+    except ValueError:
+        return HttpResponseBadRequest('Даты периода должны быть в формате YYYY-MM-DD или ISO 8601.')
+
+    rows = exports.period_rows(config, request.user, date_from, date_to)
+
+    response = StreamingHttpResponse(exports.stream(fmt, config['columns'], rows),
+                                     content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{resource}.{fmt}"'
+    return response
+
+# Полнотекстовый поиск по клиентам, продуктам и отзывам (индекс FTS5, см. firm/search.py)
+@login_required
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    results = {}
+    if query:
+        # Клиенты и отзывы — данные арендаторов: сотрудник при шардировании ищет во всех шардах
+        results = {
+            'clients': sharding.search_visible(Client.objects.visible_to(request.user), request.user, query),
+            'products': search.search(Product.objects.all(), query),
+            'feedbacks': sharding.search_visible(Feedback.objects.visible_to(request.user).select_related('client'),
+                                                 request.user, query),
+        }
+    return render(request, 'firm/search.html', {'query': query, **results})
+
+
+# Отчёт о продажах: читает только дневные агрегаты (заполняются командой rollup_sales)
+@login_required
+def sales_report(request):
+    if not request.user.is_staff:
+        messages.error(request, 'Отчёт о продажах доступен только администраторам.')
+        return redirect('firm:client_list')
+
+    try:
+        last_day = parse_date(request.GET.get('date_to') or '') or timezone.localdate()
+        first_day = parse_date(request.GET.get('date_from') or '') or last_day - timedelta(days=29)
+    except ValueError:
+        # parse_date пропускает формат, но не несуществующую дату вроде 2024-02-30
+        return HttpResponseBadRequest('Даты периода должны быть в формате YYYY-MM-DD.')
+    context = rollups.sales_report(first_day, last_day)
+    context.update({'date_from': first_day, 'date_to': last_day, 'rolled_up_at': rollups.get_watermark()})
+    return render(request, 'firm/sales_report.html', context)
+
+# JSON API (firm/api.py): чтение из values() с ?fields= и курсорами, запись через ModelForm
+def _api_response(payload, status=200):
+    return JsonResponse(payload, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _api_resource(request, resource):
+    if resource not in api.RESOURCES:
+        raise api.ApiError(404, {'error': 'Неизвестный ресурс.'})
+    if not request.user.is_authenticated:
+        raise api.ApiError(401, {'error': 'Требуется вход в систему.'})
+    return api.RESOURCES[resource]
+
+
+@require_http_methods(['GET', 'POST'])
+def api_list(request, resource):
+    try:
+        config = _api_resource(request, resource)
+        if request.method == 'POST':
+            api.check_write(config, request.user)
+            data = api.parse_body(request)
+            form = api.bind_form(config, request.user, data)
+            if not form.is_valid():
+                return _api_response({'errors': form.errors.get_json_data()}, status=400)
+            obj = api.save_form(config, form, request.user, data)
+            return _api_response(api.get_row(config, request.user, obj.pk, config['fields']), status=201)
+
+        fields = api.parse_fields(config, request.GET.get('fields'))
+        try:
+            payload = api.list_page(config, request.user, fields, _page_size(request),
+                                    after=request.GET.get('after'), before=request.GET.get('before'))
+        except InvalidCursor:
+            return _api_response({'error': 'Некорректный курсор страницы.'}, status=400)
+        return _api_response(payload)
+    except api.ApiError as exc:
+        return _api_response(exc.payload, status=exc.status)
+
+
+@require_http_methods(['GET', 'PUT', 'PATCH', 'DELETE'])
+def api_detail(request, resource, pk):
+    try:
+        config = _api_resource(request, resource)
+        if request.method == 'GET':
+            fields = api.parse_fields(config, request.GET.get('fields'))
+            try:
+                return _api_response(api.get_row(config, request.user, pk, fields))
+            except config['model'].DoesNotExist:
+                return _api_response({'error': 'Запись не найдена.'}, status=404)
+
+        api.check_write(config, request.user)
+        # Чужие записи для изменения так же «не существуют», как и для чтения
+        instance = api.get_instance(config, request.user, pk)
+        if instance is None:
+            return _api_response({'error': 'Запись не найдена.'}, status=404)
+        if request.method == 'DELETE':
+            job = api.delete_instance(config, instance, request.user)
+            if job is None:
+                return HttpResponse(status=204)
+            # Большая история удаляется в фоне (purge_clients): удаление принято, но ещё не выполнено
+            return _api_response(job, status=202)
+
+        data = api.parse_body(request)
+        form = api.bind_form(config, request.user, data, instance=instance, partial=request.method == 'PATCH')
+        if not form.is_valid():
+            return _api_response({'errors': form.errors.get_json_data()}, status=400)
+        api.save_form(config, form, request.user, data)
+        return _api_response(api.get_row(config, request.user, pk, config['fields']))
+    except api.ApiError as exc:
+        return _api_response(exc.payload, status=exc.status)
+
+# Метрики запросов в текстовом формате Prometheus (собирает firm.middleware.QueryMetricsMiddleware)
+def metrics_view(request):
+    # Метрики видят администраторы и сборщик с токеном FIRM_METRICS_TOKEN в заголовке Authorization: Bearer.
+    # Адрес клиента не проверяется: за прокси REMOTE_ADDR у всех запросов одинаковый
+    token = getattr(settings, 'FIRM_METRICS_TOKEN', None)
+    scheme, _, presented = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    authorized = (bool(token) and scheme.lower() == 'bearer'
+                  and hmac.compare_digest(presented.strip().encode(), token.encode()))
+    if not authorized and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # --- Представления для других моделей (примеры - нужно реализовать полный CRUD для всех) ---
 
 # Пример: Представление для просмотра списка продуктов
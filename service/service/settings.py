@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,7 +48,10 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'firm.CustomUser'
 
 # Настройки для отправки email (настройте под вашего провайдера)
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Письма не отправляются из запроса, а ставятся в очередь (firm.mail.OutboxBackend);
+# доставляет их команда send_outbox через FIRM_OUTBOX_DELIVERY_BACKEND
+EMAIL_BACKEND = 'firm.mail.OutboxBackend'
+FIRM_OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.example.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -59,10 +63,16 @@ DEFAULT_FROM_EMAIL = 'your_email@example.com'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Число и время SQL-запросов по представлениям, поиск N+1 (гистограммы на /metrics)
+    'firm.middleware.QueryMetricsMiddleware',
+    # Чтение из реплики, а после изменяющего запроса — из основной базы (firm/routers.py)
+    'firm.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Шард арендатора для данных текущего пользователя (firm/sharding.py)
+    'firm.middleware.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,9 +105,49 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединение живёт между запросами потока: PRAGMA из firm.signals.configure_sqlite выполняются один раз
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Реплика для чтения — копия основной базы, которую обновляет команда replicate_db (sqlite3 backup API).
+# Включается переменной окружения FIRM_REPLICA_DB с путём к файлу; маршрутизация — firm.routers.ReplicaRouter.
+if os.environ.get('FIRM_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['FIRM_REPLICA_DB'],
+        # В тестах реплика — та же тестовая база, что и основная
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Шарды с данными арендаторов (firm/sharding.py): основная база и файлы из FIRM_SHARD_DBS через запятую.
+# Пользователи, справочники, сессии и агрегаты остаются в основной базе, справочники копируются в шарды.
+FIRM_SHARDS = ['default']
+for _index, _path in enumerate(filter(None, os.environ.get('FIRM_SHARD_DBS', '').split(',')), start=1):
+    DATABASES[f'shard_{_index}'] = {**DATABASES['default'], 'NAME': _path.strip()}
+    FIRM_SHARDS.append(f'shard_{_index}')
+
+DATABASE_ROUTERS = ['firm.sharding.ShardRouter', 'firm.routers.ReplicaRouter']
+
+# Строк на одну порцию при копировании справочников и переносе арендатора (sync_shards, move_tenant)
+FIRM_SHARD_BATCH_SIZE = 1000
+
+# PRAGMA для каждого нового соединения с SQLite: synchronous=NORMAL безопасен при сбое процесса в режиме WAL,
+# mmap и кеш страниц — меньше системных вызовов. Сам WAL хранится в файле базы и включается при развёртывании
+# командой enable_wal, а не здесь: иначе любое соединение (даже manage.py check) переводило бы файл в WAL
+FIRM_SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ, т.е. 64 МиБ
+    'temp_store': 'MEMORY',
+}
+
+# Сколько секунд после POST/PUT/PATCH/DELETE пользователь читает из основной базы (свои записи), а не из реплики.
+# Это нижняя граница: если замеренное replicate_db --loop отставание реплики больше, окно растягивается до него.
+FIRM_REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -148,4 +198,56 @@ LOGIN_REDIRECT_URL = '/firm/clients/'
 
 LOGIN_URL = '/firm/login/'
 
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Размер страницы списка клиентов (keyset-пагинация) и верхняя граница для ?page_size=
+FIRM_CLIENT_LIST_PAGE_SIZE = 50
+FIRM_MAX_PAGE_SIZE = 200
+
+# Кеш общий для всех воркеров на хосте (файловый), чтобы сброс по сигналам был виден каждому процессу
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
+# Время жизни закешированных блоков главной страницы (секунды)
+FIRM_HOME_CACHE_TIMEOUT = 300
+
+# Сколько строк за раз читать из БД при потоковой выгрузке
+FIRM_EXPORT_CHUNK_SIZE = 2000
+
+# Названия статусов заказа, при которых заказ считается закрытым (не занимает курьера)
+FIRM_CLOSED_ORDER_STATUSES = ['Доставлен', 'Отменён']
+
+# Как часто (секунды) процесс сверяет свою копию справочников статусов с версией в общем кеше
+FIRM_LOOKUP_CHECK_INTERVAL = 1.0
+
+# Очередь писем: сколько попыток доставки и пауза перед повтором (секунды, удваивается с каждой попыткой)
+FIRM_OUTBOX_MAX_ATTEMPTS = 5
+FIRM_OUTBOX_RETRY_DELAY = 60
+FIRM_OUTBOX_MAX_RETRY_DELAY = 3600
+# Сколько секунд захваченная воркером порция писем скрыта от других воркеров (аренда)
+FIRM_OUTBOX_LEASE_SECONDS = 300
+
+# Сколько выполнений одного и того же SQL за запрос считать вероятным N+1 (firm.middleware.QueryMetricsMiddleware)
+FIRM_N_PLUS_ONE_THRESHOLD = 5
+# Токен сборщика Prometheus для /metrics (Authorization: Bearer <токен>); без него метрики видят только администраторы
+FIRM_METRICS_TOKEN = os.environ.get('FIRM_METRICS_TOKEN')
+
+# До скольких строк админка считает отфильтрованный список точно (firm.pagination.EstimatedCountPaginator)
+FIRM_ADMIN_COUNT_LIMIT = 10000
+
+# Строк на один UPDATE в массовых действиях (firm/bulk.py): короче порция — короче блокировка записи SQLite
+FIRM_BULK_CHUNK_SIZE = 1000
+
+# Сколько заказов (с позициями, платежами и отзывами) переносит в архив одна транзакция archive_before
+FIRM_ARCHIVE_BATCH_SIZE = 500
+
+# Удаление клиента (firm/deletion.py): до FIRM_PURGE_INLINE_ORDERS заказов — прямо в запросе, больше — заданием
+# для команды purge_clients порциями по FIRM_PURGE_BATCH_SIZE заказов
+FIRM_PURGE_INLINE_ORDERS = 50
+FIRM_PURGE_BATCH_SIZE = 500
+FIRM_PURGE_MAX_ATTEMPTS = 3
+FIRM_PURGE_STALE_SECONDS = 300
@@ -5,6 +5,7 @@ from firm import views # Импортируйте views из вашего при
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics_view, name='metrics'), # Метрики для Prometheus (firm/metrics.py)
     path('', views.index, name='index'), # Добавьте или раскомментируйте эту строку для главной страницы
     path('firm/', include('firm.urls', namespace='firm')), # Включаем urls.py из firm с пространством имен 'firm'
     # ... другие URL-адреса